@@ -0,0 +1,67 @@
+'''
+Coverage and wall time of `saveddit search --backfill` (TimeSlicedSearch) against the
+local stand-in API in benchmarks/fake_reddit_api.py, compared with a single listing,
+which stops at the listing cap.
+
+    python benchmarks/bench_backfill.py [--submissions 20000] [--latency 0.02] [-j 1 4 8]
+
+Requires praw.
+'''
+import argparse
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+import praw
+
+from fake_reddit_api import FakeRedditAPI, synthetic_history
+from saveddit.reddit_client import RedditClientPool
+from saveddit.time_sliced_search import TimeSlicedSearch
+
+
+def create_reddit(port):
+    url = "http://127.0.0.1:" + str(port)
+    return praw.Reddit(client_id="bench", client_secret="bench", user_agent="saveddit-bench",
+                       oauth_url=url, reddit_url=url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--submissions", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every API request")
+    parser.add_argument("-j", type=int, nargs="+", default=[1, 4, 8], help="Parallel windows to try")
+    args = parser.parse_args()
+
+    until = int(time.time())
+    since = until - 5 * 365 * 24 * 3600
+    api = FakeRedditAPI(synthetic_history(args.submissions, since, until), args.latency)
+    server = api.serve()
+    port = server.server_address[1]
+    pool = RedditClientPool([create_reddit(port)])
+
+    print("{:<16} {:>10} {:>9} {:>9} {:>9}".format("mode", "found", "requests", "windows", "seconds"))
+
+    api.requests = 0
+    start = time.perf_counter()
+    found = sum(1 for _ in pool.listing(lambda reddit: reddit.subreddit("bench").new, None))
+    print("{:<16} {:>10} {:>9} {:>9} {:>9.2f}".format("single listing", found, api.requests, "-", time.perf_counter() - start))
+
+    for jobs in args.j:
+        api.requests = 0
+        search = TimeSlicedSearch(pool, "bench")
+        start = time.perf_counter()
+        search.run(since, until, jobs, lambda submission: None)
+        print("{:<16} {:>10} {:>9} {:>9} {:>9.2f}".format(
+            "backfill -j " + str(jobs), search.submissions_found, api.requests,
+            search.windows_searched, time.perf_counter() - start))
+
+    print("total submissions: " + str(args.submissions))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+'''
+Per-page parse time of the embedded video extraction used by
+SubmissionDownloader.get_gfycat_embedded_video_url, measured on the saved
+pages in benchmarks/fixtures/.
+
+    python benchmarks/bench_html_extract.py [-n iterations] [--chunk-size bytes]
+
+If beautifulsoup4 is installed, the previous `html.parser` based scraper is
+timed as well for comparison.
+'''
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from saveddit.html_media_extractor import EmbeddedVideoExtractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def iter_chunks(content, chunk_size):
+    for i in range(0, len(content), chunk_size):
+        yield content[i:i + chunk_size]
+
+
+def extract_streaming(content, chunk_size):
+    extractor = EmbeddedVideoExtractor()
+    url, _ = extractor.extract(iter_chunks(content, chunk_size))
+    return url, extractor.bytes_read
+
+
+def extract_bs4(content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    for video in soup.find_all('video'):
+        for source in video.find_all('source'):
+            src = source.get('src')
+            if src and src.endswith('.mp4'):
+                return src, len(content)
+    for script in soup.find_all('script'):
+        if script.string and 'contentUrl' in script.string:
+            match = re.search(r'"contentUrl"\s*:\s*"([^"]+\.mp4)"', script.string)
+            if match:
+                return match.group(1).replace("\\/", "/"), len(content)
+    return None, len(content)
+
+
+def bench(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = function()
+    elapsed = time.perf_counter() - start
+    return result, elapsed / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=200, metavar='iterations')
+    parser.add_argument('--chunk-size', type=int, default=EmbeddedVideoExtractor.CHUNK_SIZE)
+    args = parser.parse_args()
+
+    try:
+        import bs4
+        has_bs4 = True
+    except ImportError:
+        has_bs4 = False
+        print("beautifulsoup4 not installed, skipping the html.parser baseline\n")
+
+    print("%-28s %-10s %10s %12s  %s" % ("fixture", "extractor", "bytes read", "ms/page", "url"))
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            content = f.read()
+        name = os.path.basename(path)
+
+        (url, bytes_read), per_page = bench(lambda: extract_streaming(content, args.chunk_size), args.n)
+        print("%-28s %-10s %10d %12.3f  %s" % (name, "streaming", bytes_read, per_page * 1000, url))
+
+        if has_bs4:
+            (url, bytes_read), per_page = bench(lambda: extract_bs4(content), max(1, args.n // 10))
+            print("%-28s %-10s %10d %12.3f  %s" % (name, "bs4", bytes_read, per_page * 1000, url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+'''
+Throughput of the SubmissionDownloader media handlers against the local stand-in
+media hosts in benchmarks/fake_media_server.py: synthetic submissions are fed to
+SubmissionDownloader (without submission.json and comments), one handler at a time.
+
+    python benchmarks/bench_media_handlers.py [-n 50] [-j 4] [--latency 0.02]
+        [--bandwidth 5000000] [--error-rate 0.01] [--handlers direct gallery ...]
+
+Reports submissions/s, MB/s and the p50/p99 time per submission of each handler.
+v.redd.it videos have no audio track unless --with-audio is given (merging the
+synthetic tracks with ffmpeg fails, but is timed all the same).
+
+Requires the saveddit dependencies. Runs with a temporary HOME, so the on-disk caches
+start out empty and the real ones are left alone.
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+# Before saveddit computes its default cache paths
+os.environ["HOME"] = tempfile.mkdtemp(prefix="saveddit-bench-home-")
+
+from fake_media_server import FakeMediaServer, LocalHostAdapter
+from saveddit.console import Console
+from saveddit.http_session import HttpSession
+from saveddit.metrics import Metrics
+from saveddit.submission_downloader import SubmissionDownloader
+
+HANDLERS = ("direct", "gallery", "video", "imgur_album", "gfycat")
+GALLERY_ITEMS = 5
+
+
+class OfflineSubmissionDownloader(SubmissionDownloader):
+    # youtube-dl is the last resort of the gfycat handler and would go to the real network
+    def download_youtube_video(self, url, output_path):
+        return False
+
+
+def synthetic_submission(handler, key, with_audio):
+    submission = SimpleNamespace(id=key, title="Synthetic " + handler + " " + key, is_self=False)
+    if handler == "direct":
+        submission.url = "https://i.redd.it/" + key + ".jpg"
+    elif handler == "gallery":
+        submission.url = "https://www.reddit.com/gallery/" + key
+        media_ids = [key + "m" + str(i) for i in range(GALLERY_ITEMS)]
+        submission.gallery_data = {"items": [{"media_id": media_id} for media_id in media_ids]}
+        submission.media_metadata = {
+            media_id: {"m": "image/jpg", "s": {"u": "https://i.redd.it/" + media_id + ".jpg"}} for media_id in media_ids
+        }
+    elif handler == "video":
+        media_id = key if with_audio else "s" + key # Ids starting with "s" have no audio track
+        submission.url = "https://v.redd.it/" + media_id
+        submission.media = {"reddit_video": {"fallback_url": submission.url + "/DASH_720.mp4?source=fallback"}}
+    elif handler == "imgur_album":
+        submission.url = "https://imgur.com/a/" + key
+    elif handler == "gfycat":
+        submission.url = "https://gfycat.com/" + key.capitalize()
+    return submission
+
+
+def failed_submissions(metrics):
+    return sum(value for name, labels, value in metrics.snapshot()["counters"]
+               if name == "saveddit_submissions_total" and ("outcome", "failed") in labels)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_handler(handler, args, logger, run_id):
+    output_dir = tempfile.mkdtemp(prefix="saveddit-bench-" + handler + "-")
+    config = {"imgur_client_id": "bench"}
+    submissions = [synthetic_submission(handler, handler.replace("_", "")[:3] + run_id + str(i), args.with_audio)
+                   for i in range(args.n)]
+    metrics = Metrics.shared()
+    received_before = metrics.total("saveddit_http_response_bytes_total")
+    failed_before = failed_submissions(metrics)
+
+    def download(index):
+        started = time.perf_counter()
+        OfflineSubmissionDownloader(submissions[index], index + 1, logger, output_dir,
+                                    skip_videos=False, skip_meta=True, skip_comments=True, comment_limit=0, config=config)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.j) as executor:
+        durations = sorted(executor.map(download, range(len(submissions))))
+    elapsed = time.perf_counter() - started
+
+    received = metrics.total("saveddit_http_response_bytes_total") - received_before
+    failed = failed_submissions(metrics) - failed_before
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return elapsed, durations, received, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", type=int, default=50, help="Submissions per handler")
+    parser.add_argument("-j", type=int, default=4, help="Submissions downloaded in parallel")
+    parser.add_argument("--handlers", nargs="+", choices=HANDLERS, default=list(HANDLERS))
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds before each response")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Bytes per second and response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--with-audio", action="store_true", help="Serve audio tracks for v.redd.it videos")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the downloaders' log")
+    args = parser.parse_args()
+
+    Console.configure(quiet=not args.verbose)
+    logger = Console.create_logger("bench_media_handlers")
+
+    media = FakeMediaServer(args.latency, args.bandwidth, args.error_rate)
+    server = media.serve()
+    adapter = LocalHostAdapter(server.server_address[1],
+                               pool_connections=HttpSession.POOL_CONNECTIONS, pool_maxsize=HttpSession.POOL_MAXSIZE)
+    adapter.mount(HttpSession.shared())
+    run_id = format(int(time.time()), "x")
+
+    print("{:<12} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        "handler", "items", "failed", "items/s", "MB/s", "p50 s", "p99 s", "requests"))
+    for handler in args.handlers:
+        requests_before = media.requests
+        elapsed, durations, received, failed = run_handler(handler, args, logger, run_id)
+        print("{:<12} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.3f} {:>9.3f} {:>9}".format(
+            handler, len(durations), int(failed), len(durations) / elapsed, received / elapsed / 1e6,
+            percentile(durations, 0.5), percentile(durations, 0.99), media.requests - requests_before))
+
+    Console.stop()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
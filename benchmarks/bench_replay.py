@@ -0,0 +1,123 @@
+'''
+End-to-end `saveddit subreddit` runs against a recorded Reddit API session
+(`saveddit --replay`), offline and deterministic: listing pagination, comment
+fetching and `replace_more` expansion, submission directories and the archive index.
+
+Without --fixture, a session is first recorded from the local stand-in API in
+benchmarks/fake_reddit_api.py (self posts, so no media is downloaded), with
+--comments top-level comments per submission to exercise comment expansion.
+The recording run is reported as "live".
+
+    python benchmarks/bench_replay.py [--submissions 100] [--comments 600] [--latency 0.02]
+    python benchmarks/bench_replay.py --fixture session.jsonl --subreddit AskReddit -f hot -l 100
+
+A fixture of your own is recorded with the same subreddit options, e.g.,
+`saveddit --record session.jsonl subreddit AskReddit -f hot -l 100 --skip-videos -o /tmp/out`;
+its media links are still downloaded from the network when replayed.
+
+Requires the saveddit dependencies. Runs with a temporary HOME.
+'''
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARKS_DIR, "..", "src")
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from fake_reddit_api import FakeRedditAPI, synthetic_history
+
+CONFIG = "reddit_client_id: bench\nreddit_client_secret: bench\nreddit_username: ''\nimgur_client_id: ''\n"
+
+
+def create_home(api_url=None):
+    home = tempfile.mkdtemp(prefix="saveddit-bench-home-")
+    os.makedirs(os.path.join(home, ".saveddit"))
+    with open(os.path.join(home, ".saveddit", "user_config.yaml"), "w") as f:
+        f.write(CONFIG)
+    if api_url:
+        # Points praw (and so saveddit's clients) at the stand-in API
+        os.makedirs(os.path.join(home, ".config"))
+        with open(os.path.join(home, ".config", "praw.ini"), "w") as f:
+            f.write("[DEFAULT]\noauth_url=" + api_url + "\nreddit_url=" + api_url + "\ncheck_for_updates=False\n")
+    return home
+
+
+def run_saveddit(home, options, args):
+    '''
+    Runs the saveddit CLI in a new process. Returns (seconds, metrics summary).
+    '''
+    summary_path = os.path.join(home, "summary.json")
+    output_dir = tempfile.mkdtemp(prefix="saveddit-bench-out-", dir=home)
+    command = [sys.executable, "-m", "saveddit.saveddit", "--quiet", "--metrics-summary", summary_path] + options + [
+        "subreddit", args.subreddit, "-f"] + args.f + ["--all-comments", "--skip-videos", "-o", output_dir]
+    if args.l:
+        command += ["-l", str(args.l)]
+    env = dict(os.environ, HOME=home, PYTHONPATH=SRC_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env.pop("XDG_CONFIG_HOME", None)
+    started = time.perf_counter()
+    subprocess.run(command, env=env, check=True)
+    elapsed = time.perf_counter() - started
+    with open(summary_path) as f:
+        return elapsed, json.load(f)
+
+
+def counter(summary, name):
+    return sum(entry["value"] for entry in summary["counters"].get(name, []))
+
+
+def report(mode, elapsed, summary):
+    submissions = counter(summary, "saveddit_submissions_total")
+    print("{:<16} {:>9.2f} {:>12} {:>10.1f} {:>9}".format(
+        mode, elapsed, int(submissions), submissions / elapsed, int(counter(summary, "saveddit_reddit_requests_total"))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", help="Recorded session to replay (default: record one from the stand-in API)")
+    parser.add_argument("--subreddit", default="bench")
+    parser.add_argument("-f", nargs="+", default=["new"], help="Categories, as recorded")
+    parser.add_argument("-l", type=int, default=None, help="Post limit, as recorded")
+    parser.add_argument("--submissions", type=int, default=100, help="Submissions of the stand-in subreddit")
+    parser.add_argument("--comments", type=int, default=600, help="Top-level comments per stand-in submission")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every stand-in API request")
+    parser.add_argument("--timing", nargs="+", choices=["original", "zero"], default=["original", "zero"])
+    parser.add_argument("-n", type=int, default=1, help="Replays per timing")
+    args = parser.parse_args()
+
+    print("{:<16} {:>9} {:>12} {:>10} {:>9}".format("mode", "seconds", "submissions", "subm/s", "requests"))
+
+    homes = []
+    fixture = args.fixture
+    if fixture is None:
+        now = int(time.time())
+        history = synthetic_history(args.submissions, now - 30 * 24 * 3600, now)
+        for submission in history:
+            submission["is_self"] = True
+            submission["url"] = "https://www.reddit.com" + submission["permalink"]
+        api = FakeRedditAPI(history, args.latency, args.comments)
+        server = api.serve()
+        home = create_home("http://127.0.0.1:" + str(server.server_address[1]))
+        homes.append(home)
+        fixture = os.path.join(home, "session.jsonl")
+        elapsed, summary = run_saveddit(home, ["--record", fixture], args)
+        server.shutdown()
+        report("live", elapsed, summary)
+
+    for timing in args.timing:
+        for _ in range(args.n):
+            homes.append(create_home())
+            elapsed, summary = run_saveddit(homes[-1], ["--replay", fixture, "--replay-timing", timing], args)
+            report("replay " + timing, elapsed, summary)
+
+    for home in homes:
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
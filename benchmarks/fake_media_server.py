@@ -0,0 +1,266 @@
+'''
+Local stand-in for the media hosts SubmissionDownloader talks to, so that the media
+handlers can be exercised without network access or an Imgur client ID.
+
+Requests are routed by the original host, which is the first path segment:
+http://127.0.0.1:<port>/<host>/<path>. LocalHostAdapter rewrites the URLs of a
+requests.Session accordingly, so the code under test keeps using the real URLs.
+
+    i.redd.it/<name>.<ext>, i.imgur.com/<name>.<ext>        images (and .mp4/.gif)
+    v.redd.it/<id>/DASH_<height>.mp4                        video track
+    v.redd.it/<id>/DASH_audio.mp4 (and the other variants)  audio track; 403 for ids starting with "s"
+    v.redd.it/<id>/DASHPlaylist.mpd                         DASH manifest
+    api.imgur.com/3/album/<id>, api.imgur.com/3/image/<id>  Imgur API
+    gfycat.com/<name>                                       redirects to redgifs.com/watch/<name> ...
+    redgifs.com/watch/<name>                                ... which redirects to www.redgifs.com/watch/<name>
+    www.redgifs.com/watch/<name>                            page with an embedded <video>
+    thumbs.redgifs.com/<Name>.mp4                           the embedded video
+
+Latency (before the response headers), bandwidth (per response) and the error rate
+(503 responses) are configurable.
+Images and videos on i.redd.it, i.imgur.com, preview.redd.it and thumbs.redgifs.com
+carry an ETag, and are answered with 304 Not Modified when it's sent in If-None-Match.
+
+    python benchmarks/fake_media_server.py [--port 8766] [--latency 0.02] [--bandwidth 5000000]
+'''
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 64 * 1024
+
+CONTENT_TYPES = {
+    ".gif": "image/gif",
+    ".jpeg": "image/jpeg",
+    ".jpg": "image/jpeg",
+    ".m4a": "audio/mp4",
+    ".mp4": "video/mp4",
+    ".png": "image/png",
+}
+
+DASH_MANIFEST = '''<?xml version="1.0" encoding="UTF-8"?>
+<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" type="static" mediaPresentationDuration="PT10S">
+  <Period>
+    <AdaptationSet contentType="video" mimeType="video/mp4">
+      <Representation id="720" bandwidth="2000000" height="720"><BaseURL>DASH_720.mp4</BaseURL></Representation>
+    </AdaptationSet>
+    <AdaptationSet contentType="audio" mimeType="audio/mp4">
+      <Representation id="audio" bandwidth="128000"><BaseURL>DASH_audio.mp4</BaseURL></Representation>
+    </AdaptationSet>
+  </Period>
+</MPD>
+'''
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html><head><title>{name}</title>
+<script>{filler}</script>
+</head><body>
+<video autoplay loop muted><source src="https://thumbs.redgifs.com/{name}.mp4" type="video/mp4"></video>
+</body></html>
+'''
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up mid-response on purpose, e.g., after finding the embedded video
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeMediaServer:
+    def __init__(self, latency=0.0, bandwidth=None, error_rate=0.0, image_size=256 * 1024,
+                 video_size=2 * 1024 * 1024, audio_size=128 * 1024, album_images=5, page_size=64 * 1024, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth # Bytes per second and response, None for unlimited
+        self.error_rate = error_rate
+        self.image_size = image_size
+        self.video_size = video_size
+        self.audio_size = audio_size
+        self.album_images = album_images
+        self.page_size = page_size
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._block = bytes(self._random.getrandbits(8) for _ in range(CHUNK_SIZE))
+
+    def route(self, host, path):
+        '''
+        Returns (status, headers, body) for a request. body is bytes, or an int for
+        that many bytes of synthetic media.
+        '''
+        parts = [urllib.parse.unquote(p) for p in path.strip("/").split("/") if p]
+        extension = "." + parts[-1].rsplit(".", 1)[-1].lower() if parts and "." in parts[-1] else ""
+
+        if host in ("i.redd.it", "i.imgur.com", "preview.redd.it", "thumbs.redgifs.com") and extension in CONTENT_TYPES:
+            size = self.video_size if extension == ".mp4" else self.image_size
+            return 200, {"Content-Type": CONTENT_TYPES[extension], "ETag": '"' + str(size) + '"'}, size
+
+        if host == "v.redd.it" and len(parts) == 2:
+            media_id, name = parts
+            if name == "DASHPlaylist.mpd":
+                return 200, {"Content-Type": "application/dash+xml"}, DASH_MANIFEST.encode("utf-8")
+            if name.lower().startswith("dash_audio"):
+                # Like videos without sound on Reddit
+                if media_id.startswith("s"):
+                    return 403, {"Content-Type": "application/xml"}, b"<Error>AccessDenied</Error>"
+                return 200, {"Content-Type": CONTENT_TYPES.get(extension, "video/mp4")}, self.audio_size
+            if name.startswith("DASH_") and extension == ".mp4":
+                return 200, {"Content-Type": "video/mp4"}, self.video_size
+
+        if host == "api.imgur.com" and len(parts) == 3 and parts[0] == "3":
+            return self._imgur_api(parts[1], parts[2])
+
+        if host in ("gfycat.com", "www.gfycat.com") and len(parts) == 1:
+            return 301, {"Location": "https://redgifs.com/watch/" + parts[0].lower()}, b""
+        if host == "redgifs.com" and len(parts) == 2 and parts[0] == "watch":
+            return 301, {"Location": "https://www.redgifs.com/watch/" + parts[1]}, b""
+        if host == "www.redgifs.com" and len(parts) == 2 and parts[0] == "watch":
+            name = parts[1][:1].upper() + parts[1][1:]
+            page = PAGE_TEMPLATE.format(name=name, filler="var filler = '" + "x" * self.page_size + "';")
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, page.encode("utf-8")
+
+        return 404, {"Content-Type": "text/plain"}, b"Not found"
+
+    def _imgur_api(self, kind, resource_id):
+        headers = {
+            "Content-Type": "application/json",
+            "X-RateLimit-ClientRemaining": "12500",
+            "X-RateLimit-UserRemaining": "2000",
+            "X-RateLimit-UserReset": str(int(time.time()) + 3600),
+        }
+
+        def image(image_id):
+            return {"id": image_id, "type": "image/jpeg", "link": "https://i.imgur.com/" + image_id + ".jpg"}
+
+        if kind == "album":
+            images = [image(resource_id + str(i)) for i in range(self.album_images)]
+            data = {"id": resource_id, "images_count": len(images), "images": images}
+        elif kind == "image":
+            data = image(resource_id)
+        else:
+            return 404, headers, json.dumps({"success": False, "status": 404, "data": {"error": "Not found"}}).encode("utf-8")
+        return 200, headers, json.dumps({"success": True, "status": 200, "data": data}).encode("utf-8")
+
+    def serve(self, host="127.0.0.1", port=0):
+        server_state = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._handle(send_body=True)
+
+            def do_HEAD(self):
+                self._handle(send_body=False)
+
+            def _handle(self, send_body):
+                with server_state._lock:
+                    server_state.requests += 1
+                    failed = server_state._random.random() < server_state.error_rate
+                    if failed:
+                        server_state.errors += 1
+                if server_state.latency:
+                    time.sleep(server_state.latency)
+
+                url = urllib.parse.urlparse(self.path)
+                target_host, _, target_path = url.path.lstrip("/").partition("/")
+                if failed:
+                    status, headers, body = 503, {"Content-Type": "text/plain"}, b"Service Unavailable"
+                else:
+                    status, headers, body = server_state.route(target_host, "/" + target_path)
+                if status == 200 and "ETag" in headers and self.headers.get("If-None-Match") == headers["ETag"]:
+                    status, body = 304, b""
+                length = body if isinstance(body, int) else len(body)
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(length))
+                self.end_headers()
+                if send_body:
+                    server_state._write_body(self.wfile, body)
+
+        server = _Server((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def _write_body(self, wfile, body):
+        remaining = body if isinstance(body, int) else len(body)
+        offset = 0
+        started = time.monotonic()
+        try:
+            while remaining > 0:
+                if isinstance(body, int):
+                    chunk = self._block[:min(CHUNK_SIZE, remaining)]
+                else:
+                    chunk = body[offset:offset + CHUNK_SIZE]
+                wfile.write(chunk)
+                offset += len(chunk)
+                remaining -= len(chunk)
+                if self.bandwidth:
+                    # Sleep until the bytes sent so far are within the bandwidth budget
+                    delay = offset / self.bandwidth - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client stopped reading, e.g., after finding the embedded video
+
+
+class LocalHostAdapter(HTTPAdapter):
+    '''
+    Sends every request of the session it is mounted on to a FakeMediaServer, keeping the
+    original URL on the response (redirects, metrics and logs see the real hosts).
+
+    All hosts share the server's connection pool, unlike on the real network.
+    '''
+    def __init__(self, port, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = "http://127.0.0.1:" + str(port)
+
+    def mount(self, session):
+        session.mount("http://", self)
+        session.mount("https://", self)
+
+    def send(self, request, **kwargs):
+        url = urllib.parse.urlsplit(request.url)
+        local_request = request.copy()
+        local_request.url = self.base_url + "/" + url.netloc + (url.path or "/") + ("?" + url.query if url.query else "")
+        response = super().send(local_request, **kwargs)
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic media for the saveddit media handlers")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Bytes per second and response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    media = FakeMediaServer(args.latency, args.bandwidth, args.error_rate)
+    server = media.serve(port=args.port)
+    print("Serving media on http://127.0.0.1:" + str(server.server_address[1]) + "/<host>/<path>")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+'''
+Local stand-in for the parts of the Reddit API used by saveddit listings and searches,
+serving a synthetic subreddit history. Used by the benchmarks to exercise praw code paths
+without network access or API credentials.
+
+Like the real API, a listing stops after LISTING_CAP items no matter how it is paginated.
+Searches understand cloudsearch `timestamp:start..end` ranges (inclusive), and /api/info
+returns the submissions asked for by fullname.
+
+Every submission has `comments` top-level comments. Like on a megathread, only the
+first COMMENT_PAGE come with the submission; the rest hide behind a "more" object
+that /api/morechildren expands MORE_CHILDREN_MAX at a time.
+
+    python benchmarks/fake_reddit_api.py [--port 8765] [--submissions 20000] [--comments 0]
+
+Point praw at it with
+
+    praw.Reddit(client_id="x", client_secret="x", user_agent="bench",
+                oauth_url="http://127.0.0.1:8765", reddit_url="http://127.0.0.1:8765")
+'''
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LISTING_CAP = 1000
+PAGE_SIZE_MAX = 100
+COMMENT_PAGE = 200
+MORE_CHILDREN_MAX = 100
+
+TIMESTAMP_RANGE = re.compile(r"timestamp:(\d+)\.\.(\d+)")
+LISTING_PATH = re.compile(r"^/r/(?P<subreddit>[^/]+)/(?P<listing>new|hot|top|search)/?(?:\.json)?$")
+ABOUT_PATH = re.compile(r"^/r/(?P<subreddit>[^/]+)/about/?(?:\.json)?$")
+INFO_PATH = re.compile(r"^/api/info/?(?:\.json)?$")
+COMMENTS_PATH = re.compile(r"^(?:/r/[^/]+)?/comments/(?P<id>[0-9a-z]+)(?:/[^/]*)?/?(?:\.json)?$")
+
+
+def synthetic_history(count, start, end, seed=0):
+    '''
+    Returns `count` submissions created between start and end, newest first. Activity grows
+    over time and comes in bursts, like a real subreddit's.
+    '''
+    rng = random.Random(seed)
+    span = end - start
+    created = []
+    while len(created) < count:
+        # Denser towards the end of the range
+        t = start + int(span * (rng.random() ** 0.5))
+        burst = rng.random() < 0.05
+        for _ in range(rng.randint(20, 60) if burst else 1):
+            created.append(min(end, t + rng.randint(0, 3600)))
+    created = sorted(created[:count], reverse=True)
+    return [{
+        "id": format(i + 1, "x"),
+        "name": "t3_" + format(i + 1, "x"),
+        "title": "Synthetic submission " + str(i + 1),
+        "created_utc": float(t),
+        "author": "bench_user",
+        "url": "https://example.invalid/" + format(i + 1, "x"),
+        "permalink": "/r/bench/comments/" + format(i + 1, "x") + "/synthetic/",
+        "is_self": False,
+        "over_18": False,
+        "num_comments": 0,
+        "score": 1,
+    } for i, t in enumerate(created)]
+
+
+class FakeRedditAPI:
+    def __init__(self, submissions, latency=0.0, comments=0):
+        self.submissions = submissions
+        self.latency = latency
+        self.comments = comments
+        self.requests = 0
+        self._by_id = {s["id"]: s for s in submissions}
+        self._lock = threading.Lock()
+
+    def listing(self, subreddit, listing, query):
+        items = self.submissions
+        match = TIMESTAMP_RANGE.search(query.get("q", [""])[0])
+        if listing == "search" and match:
+            start, end = int(match.group(1)), int(match.group(2))
+            items = [s for s in items if start <= s["created_utc"] <= end]
+        items = items[:LISTING_CAP]
+
+        offset = 0
+        after = query.get("after", [None])[0]
+        if after:
+            names = [s["name"] for s in items]
+            offset = names.index(after) + 1 if after in names else len(items)
+        limit = min(int(query.get("limit", [25])[0]), PAGE_SIZE_MAX)
+        page = items[offset:offset + limit]
+
+        children = []
+        for s in page:
+            data = dict(s)
+            data["subreddit"] = subreddit
+            children.append({"kind": "t3", "data": data})
+        next_after = page[-1]["name"] if page and offset + limit < len(items) else None
+        return {"kind": "Listing", "data": {"children": children, "after": next_after, "before": None, "dist": len(children)}}
+
+    def info(self, query):
+        # /api/info?id=t3_1,t3_2: the submissions that exist, at most PAGE_SIZE_MAX
+        names = ",".join(query.get("id", [""])).split(",")[:PAGE_SIZE_MAX]
+        children = [{"kind": "t3", "data": dict(self._by_id[name[3:]], subreddit="bench")}
+                    for name in names if name.startswith("t3_") and name[3:] in self._by_id]
+        return {"kind": "Listing", "data": {"children": children, "after": None, "before": None, "dist": len(children)}}
+
+    def comment_page(self, submission_id):
+        submission = dict(self._by_id.get(submission_id) or {})
+        if not submission:
+            return None
+        submission["subreddit"] = "bench"
+        submission["num_comments"] = self.comments
+        ids = [FakeRedditAPI._comment_id(submission_id, i) for i in range(self.comments)]
+        children = [self._comment(submission, comment_id) for comment_id in ids[:COMMENT_PAGE]]
+        if len(ids) > COMMENT_PAGE:
+            children.append(FakeRedditAPI._more(submission, ids[COMMENT_PAGE:]))
+        return [
+            {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": submission}], "after": None, "before": None}},
+            {"kind": "Listing", "data": {"children": children, "after": None, "before": None}},
+        ]
+
+    def more_children(self, form):
+        link_id = form.get("link_id", [""])[0]
+        submission = self._by_id.get(link_id[3:], {"id": link_id[3:], "name": link_id, "created_utc": 0})
+        ids = [c for c in form.get("children", [""])[0].split(",") if c]
+        things = [self._comment(submission, comment_id) for comment_id in ids[:MORE_CHILDREN_MAX]]
+        if len(ids) > MORE_CHILDREN_MAX:
+            things.append(FakeRedditAPI._more(submission, ids[MORE_CHILDREN_MAX:]))
+        return {"json": {"errors": [], "data": {"things": things}}}
+
+    @staticmethod
+    def _comment_id(submission_id, index):
+        return submission_id + "c" + format(index, "x")
+
+    @staticmethod
+    def _comment(submission, comment_id):
+        return {"kind": "t1", "data": {
+            "id": comment_id,
+            "name": "t1_" + comment_id,
+            "body": "Synthetic comment " + comment_id,
+            "author": "bench_user",
+            "created_utc": submission["created_utc"],
+            "link_id": submission["name"],
+            "parent_id": submission["name"],
+            "permalink": "/r/bench/comments/" + submission["id"] + "/synthetic/" + comment_id + "/",
+            "score": 1,
+            "subreddit": "bench",
+            "replies": "",
+            "depth": 0,
+        }}
+
+    @staticmethod
+    def _more(submission, ids):
+        return {"kind": "more", "data": {
+            "count": len(ids), "name": "t1_" + ids[0], "id": ids[0], "parent_id": submission["name"], "depth": 0,
+            "children": ids,
+        }}
+
+    def serve(self, host="127.0.0.1", port=0):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, body, status=200):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("x-ratelimit-remaining", "600")
+                self.send_header("x-ratelimit-used", "0")
+                self.send_header("x-ratelimit-reset", "600")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                form = parse_qs(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+                if self.path.startswith("/api/v1/access_token"):
+                    self._reply({"access_token": "bench", "token_type": "bearer", "expires_in": 3600, "scope": "*"})
+                elif self.path.startswith("/api/morechildren"):
+                    with api._lock:
+                        api.requests += 1
+                    if api.latency:
+                        time.sleep(api.latency)
+                    self._reply(api.more_children(form))
+                else:
+                    self._reply({"error": 404}, 404)
+
+            def do_GET(self):
+                with api._lock:
+                    api.requests += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                url = urlparse(self.path)
+                match = COMMENTS_PATH.match(url.path)
+                page = api.comment_page(match.group("id")) if match else None
+                if page is not None:
+                    self._reply(page)
+                    return
+                if INFO_PATH.match(url.path):
+                    self._reply(api.info(parse_qs(url.query)))
+                    return
+                match = ABOUT_PATH.match(url.path)
+                if match:
+                    self._reply({"kind": "t5", "data": {"id": "bench", "name": "t5_bench",
+                                                        "display_name": match.group("subreddit"), "subscribers": 1000}})
+                    return
+                match = LISTING_PATH.match(url.path)
+                if not match:
+                    self._reply({"error": 404}, 404)
+                    return
+                self._reply(api.listing(match.group("subreddit"), match.group("listing"), parse_qs(url.query)))
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic subreddit history")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--submissions", type=int, default=20000)
+    parser.add_argument("--comments", type=int, default=0, help="Top-level comments per submission")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API request")
+    args = parser.parse_args()
+
+    now = int(time.time())
+    api = FakeRedditAPI(synthetic_history(args.submissions, now - 5 * 365 * 24 * 3600, now), args.latency, args.comments)
+    server = api.serve(port=args.port)
+    print("Serving " + str(args.submissions) + " submissions on http://127.0.0.1:" + str(server.server_address[1]))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import datetime
+import json
+import os
+import threading
+import time
+import urllib.parse
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def _request_parts(args, kwargs):
+    # prawcore calls Requestor.request(method, url, ...) either positionally or with keywords
+    method = (args[0] if args else kwargs.get("method", "GET")).upper()
+    url = args[1] if len(args) > 1 else kwargs.get("url", "")
+    return method, url, kwargs.get("params"), kwargs.get("data")
+
+
+def _pairs(values):
+    # params/data arrive as dicts or as lists of (key, value) tuples
+    if not values:
+        return []
+    if isinstance(values, dict):
+        values = values.items()
+    if isinstance(values, (str, bytes)):
+        return [["", values if isinstance(values, str) else values.decode("utf-8", "replace")]]
+    return sorted([str(key), str(value)] for key, value in values)
+
+
+class ApiRecording:
+    '''
+    Reddit API sessions saved to a fixture file: one JSON object per line with the
+    request (method, path, query parameters and form data) and the response (status,
+    content type, body and latency). Written by ApiRecorder, served by ApiReplayer.
+
+    Nothing that identifies the account is saved: the token exchange is recorded
+    without its form data (username, password) and with a dummy access token, and no
+    request headers are kept.
+    '''
+    TOKEN_PATH = "/api/v1/access_token"
+    REDACTED_TOKEN = {"access_token": "replayed", "expires_in": 86400, "scope": "*", "token_type": "bearer"}
+
+    @staticmethod
+    def key(method, url, params, data):
+        '''
+        Identifies a request independently of the host and of the order of its parameters
+        '''
+        parsed = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qsl(parsed.query) + _pairs(params)
+        if parsed.path == ApiRecording.TOKEN_PATH:
+            query, data = [], None
+        return json.dumps([method, parsed.path, _pairs(query), _pairs(data)])
+
+
+class ApiRecorder:
+    '''
+    Appends every Reddit API request and its response to a fixture file (see ApiRecording).
+
+    Lines are written with a single os.write on a file opened for appending, so forked
+    ParallelDownloader workers can record into the same file.
+    '''
+    shared = None
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    @classmethod
+    def install(cls, recorder):
+        '''
+        Makes recorder the recorder used by every Reddit client created in this process
+        '''
+        cls.shared = recorder
+
+    def record(self, args, kwargs, response, elapsed):
+        method, url, params, data = _request_parts(args, kwargs)
+        body = response.text
+        if urllib.parse.urlsplit(url).path == ApiRecording.TOKEN_PATH and response.status_code == 200:
+            body = json.dumps(ApiRecording.REDACTED_TOKEN)
+        entry = {
+            "key": ApiRecording.key(method, url, params, data),
+            "url": url,
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type"),
+            "elapsed": round(elapsed, 6),
+            "body": body,
+        }
+        os.write(self._fd, (json.dumps(entry) + "\n").encode("utf-8"))
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class ApiReplayer:
+    '''
+    Answers Reddit API requests from a fixture file written by ApiRecorder, without network access.
+
+    Responses to repeated identical requests are replayed in the order they were recorded
+    (the last one is repeated when the recording runs out). With timing="original" each
+    response is delayed by its recorded latency; with timing="zero" it is returned right away.
+    Rate limit headers are never replayed, so prawcore does not throttle a replay.
+    '''
+    TIMINGS = ("original", "zero")
+
+    shared = None
+
+    class MissingResponse(Exception):
+        pass
+
+    def __init__(self, path, timing="original"):
+        if timing not in ApiReplayer.TIMINGS:
+            raise ValueError("timing must be one of " + ", ".join(ApiReplayer.TIMINGS))
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.timing = timing
+        self.replayed = 0
+        self._responses = {}
+        self._lock = threading.Lock()
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._responses.setdefault(entry["key"], []).append(entry)
+
+    @classmethod
+    def install(cls, replayer):
+        '''
+        Makes replayer answer the requests of every Reddit client created in this process
+        '''
+        cls.shared = replayer
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._responses.values())
+
+    def request(self, args, kwargs):
+        method, url, params, data = _request_parts(args, kwargs)
+        key = ApiRecording.key(method, url, params, data)
+        with self._lock:
+            entries = self._responses.get(key)
+            if not entries:
+                if urllib.parse.urlsplit(url).path == ApiRecording.TOKEN_PATH:
+                    # Recorded with a cached token, so there was no token exchange
+                    entries = [{"url": url, "status": 200, "content_type": "application/json",
+                                "elapsed": 0.0, "body": json.dumps(ApiRecording.REDACTED_TOKEN)}]
+                else:
+                    raise ApiReplayer.MissingResponse("No recorded response for " + method + " " + url +
+                                                      " (params: " + json.dumps(_pairs(params)) + ") in " + self.path)
+            entry = entries.pop(0) if len(entries) > 1 else entries[0]
+            self.replayed += 1
+
+        if self.timing == "original" and entry["elapsed"]:
+            time.sleep(entry["elapsed"])
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict({"content-type": entry["content_type"] or "application/json"})
+        response._content = entry["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        response.elapsed = datetime.timedelta(seconds=entry["elapsed"])
+        response.request = requests.Request(method, url, params=params).prepare()
+        return response
@@ -0,0 +1,119 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class ArchiveIndex:
+    '''
+    Index of the submissions saved under one output path.
+
+    Stored as SQLite in <output_path>/.saveddit/index.sqlite3 so that several
+    threads, processes (or hosts sharing the output tree) can record into it.
+    Paths are stored relative to the output path.
+    '''
+    INDEX_DIR = ".saveddit"
+    INDEX_FILE = "index.sqlite3"
+
+    _indexes = {}
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, output_path):
+        self.output_path = os.path.abspath(output_path)
+        index_dir = os.path.join(self.output_path, ArchiveIndex.INDEX_DIR)
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir, exist_ok=True)
+        self.path = os.path.join(index_dir, ArchiveIndex.INDEX_FILE)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS submissions ("
+                "id TEXT NOT NULL, "
+                "path TEXT NOT NULL, "
+                "created_utc INTEGER, "
+                "title TEXT, "
+                "complete INTEGER NOT NULL, "
+                "archived_at REAL NOT NULL, "
+                "PRIMARY KEY (id, path))")
+            self._connection.commit()
+
+    @classmethod
+    def for_output(cls, output_path):
+        '''
+        Returns one ArchiveIndex per output path for the whole process
+        '''
+        key = os.path.abspath(output_path)
+        with cls._indexes_lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                index = cls(key)
+                cls._indexes[key] = index
+            return index
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # SQLite connections must not be used across fork(); a forked worker opens its own
+        cls._indexes = {}
+        cls._indexes_lock = threading.Lock()
+
+    def add(self, submission, submission_dir, complete=True):
+        '''
+        Records that `submission` was saved to `submission_dir`
+        '''
+        relative_path = os.path.relpath(os.path.abspath(submission_dir), self.output_path)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO submissions (id, path, created_utc, title, complete, archived_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (submission.id, relative_path, int(getattr(submission, 'created_utc', 0) or 0),
+                 getattr(submission, 'title', None), 1 if complete else 0, time.time()))
+            self._connection.commit()
+
+    def contains(self, submission_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM submissions WHERE id = ? LIMIT 1", (submission_id,)).fetchone()
+        return row is not None
+
+    def paths(self, submission_id):
+        '''
+        Returns the absolute paths `submission_id` was saved to
+        '''
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT path FROM submissions WHERE id = ?", (submission_id,)).fetchall()
+        return [os.path.join(self.output_path, row[0]) for row in rows]
+
+    def entries(self):
+        '''
+        Returns a list of (id, absolute path) tuples for every recorded submission
+        '''
+        with self._lock:
+            rows = self._connection.execute("SELECT id, path FROM submissions ORDER BY id").fetchall()
+        return [(row[0], os.path.join(self.output_path, row[1])) for row in rows]
+
+    def records(self):
+        '''
+        Returns a list of (id, absolute path, created_utc) tuples for every recorded submission
+        '''
+        with self._lock:
+            rows = self._connection.execute("SELECT id, path, created_utc FROM submissions ORDER BY id").fetchall()
+        return [(row[0], os.path.join(self.output_path, row[1]), row[2]) for row in rows]
+
+    def move(self, submission_id, old_dir, new_dir):
+        '''
+        Records that the copy of `submission_id` saved to `old_dir` now lives in `new_dir`
+        '''
+        old_path = os.path.relpath(os.path.abspath(old_dir), self.output_path)
+        new_path = os.path.relpath(os.path.abspath(new_dir), self.output_path)
+        with self._lock:
+            self._connection.execute(
+                "UPDATE OR REPLACE submissions SET path = ? WHERE id = ? AND path = ?",
+                (new_path, submission_id, old_path))
+            self._connection.commit()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ArchiveIndex._reset_after_fork)
@@ -0,0 +1,154 @@
+import datetime
+import os
+import re
+from saveddit.archive_index import ArchiveIndex
+from saveddit.file_writer import FileWriter
+
+
+class ArchiveLayout:
+    '''
+    Where a submission is saved within a category directory (e.g., www.reddit.com/r/pics/new):
+
+        flat   <category>/<NNN>_<title>, NNN being the position in the listing (default)
+        id     <category>/<last two characters of the submission ID>/<ID>_<title>
+        month  <category>/<YYYY>/<MM>/<ID>_<title>, from the submission's created_utc (UTC)
+
+    Reddit IDs are sequential base36 numbers, so it's their last two characters that
+    spread submissions evenly (over up to 1296 shards). Sharded directory names hold
+    the submission ID instead of the listing position, so they don't change between runs.
+
+    The layout of an output path is saved to <output_path>/.saveddit/layout by the first
+    download (or `saveddit migrate`), and later runs without --layout use it.
+    '''
+    LAYOUTS = ("flat", "id", "month")
+    SHARDED_LAYOUTS = ("id", "month")
+    LAYOUT_FILE = "layout"
+
+    # Filesystems limit names to ~255 characters, and the full path length matters too
+    MAX_TITLE_LENGTH = 64
+
+    layout = "flat"
+    requested = None # Given with --layout, or else None to use the saved layout
+
+    _outputs = {} # Absolute output path -> its layout
+
+    @classmethod
+    def configure(cls, layout=None):
+        if layout is not None and layout not in ArchiveLayout.LAYOUTS:
+            raise ValueError("layout must be one of " + ", ".join(ArchiveLayout.LAYOUTS))
+        cls.requested = layout
+        cls.layout = layout or "flat"
+
+    @classmethod
+    def for_output(cls, output_path):
+        '''
+        Returns the layout of the archive under `output_path` and saves submissions with it from now on.
+        Without a saved layout, the requested one (or the one found in the archive index, or flat) is saved.
+        Raises ValueError if --layout asks for another layout than the archive has.
+        '''
+        key = os.path.abspath(os.path.expanduser(output_path))
+        layout = cls._outputs.get(key)
+        if layout is None:
+            saved = ArchiveLayout.saved(key)
+            existing = saved or ArchiveLayout.detect(key)
+            if cls.requested is not None and existing is not None and cls.requested != existing:
+                raise ValueError(key + " is saved with --layout " + existing + ", not " + cls.requested +
+                                 " (move it with `saveddit --layout " + cls.requested + " migrate " + key + "`)")
+            layout = existing or cls.requested or "flat"
+            if saved is None:
+                ArchiveLayout.save(key, layout)
+            cls._outputs[key] = layout
+        cls.layout = layout
+        return layout
+
+    @staticmethod
+    def layout_file(output_path):
+        return os.path.join(os.path.abspath(os.path.expanduser(output_path)), ArchiveIndex.INDEX_DIR, ArchiveLayout.LAYOUT_FILE)
+
+    @staticmethod
+    def saved(output_path):
+        '''
+        Returns the layout saved for `output_path`, or None
+        '''
+        try:
+            with open(ArchiveLayout.layout_file(output_path), "r", encoding="utf-8") as f:
+                layout = f.read().strip()
+        except OSError:
+            return None
+        return layout if layout in ArchiveLayout.LAYOUTS else None
+
+    @classmethod
+    def save(cls, output_path, layout):
+        path = ArchiveLayout.layout_file(output_path)
+        FileWriter.ensure_dir(os.path.dirname(path))
+        with FileWriter.open(path, "w", encoding="utf-8") as f:
+            f.write(layout + "\n")
+        cls._outputs[os.path.abspath(os.path.expanduser(output_path))] = layout
+
+    @staticmethod
+    def detect(output_path):
+        '''
+        Returns the layout of the submissions in the archive index of `output_path` (saved before
+        the layout was), or None for an output path without any
+        '''
+        if not os.path.exists(os.path.join(output_path, ArchiveIndex.INDEX_DIR, ArchiveIndex.INDEX_FILE)):
+            return None
+        records = ArchiveIndex.for_output(output_path).records()
+        if not records:
+            return None
+        submission_id, path, created_utc = records[-1]
+        return ArchiveLayout.parse(path, submission_id, created_utc)[1]
+
+    @staticmethod
+    def sanitize_title(title):
+        # Replace non-alphanumeric characters (except underscore/hyphen) with underscore
+        title = re.sub(r'[^\w\-]+', '_', title or "")
+        # Remove leading/trailing underscores/spaces
+        title = title.strip('_ ')
+        return title[:ArchiveLayout.MAX_TITLE_LENGTH]
+
+    @classmethod
+    def submission_dir(cls, category_dir, submission, index):
+        '''
+        Returns the directory `submission`, at position `index` of its listing, is saved to with the configured layout
+        '''
+        return ArchiveLayout.path(category_dir, cls.layout, submission.id, getattr(submission, 'created_utc', 0),
+                                  ArchiveLayout.sanitize_title(submission.title), index)
+
+    @staticmethod
+    def path(category_dir, layout, submission_id, created_utc, title, index=None):
+        if layout == "flat":
+            return os.path.join(category_dir, str(index).zfill(3) + "_" + title)
+        return os.path.join(category_dir, *ArchiveLayout.shard(layout, submission_id, created_utc), submission_id + "_" + title)
+
+    @staticmethod
+    def shard(layout, submission_id, created_utc):
+        '''
+        Returns the directories between the category directory and the submission directory
+        '''
+        if layout == "id":
+            return [submission_id[-2:].lower()]
+        if layout == "month":
+            created = datetime.datetime.fromtimestamp(int(created_utc or 0), datetime.timezone.utc)
+            return [str(created.year), str(created.month).zfill(2)]
+        return []
+
+    @staticmethod
+    def parse(path, submission_id, created_utc):
+        '''
+        Splits the directory of a submission saved with any layout into (category directory, layout, title)
+        '''
+        parent, name = os.path.split(os.path.normpath(path))
+        if name.startswith(submission_id + "_"):
+            title = name[len(submission_id) + 1:]
+            for layout in ArchiveLayout.SHARDED_LAYOUTS:
+                shard = ArchiveLayout.shard(layout, submission_id, created_utc)
+                category_dir = parent
+                for directory in reversed(shard):
+                    category_dir, shard_name = os.path.split(category_dir)
+                    if shard_name != directory:
+                        break
+                else:
+                    return category_dir, layout, title
+        match = re.match(r'\d+_(.*)$', name)
+        return parent, "flat", match.group(1) if match else name
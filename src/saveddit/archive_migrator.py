@@ -0,0 +1,108 @@
+import json
+import os
+from types import SimpleNamespace
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+
+
+class ArchiveMigrator:
+    '''
+    Moves the submissions saved under an output path into another ArchiveLayout (`saveddit migrate`).
+
+    Submissions are found through the archive index and by looking for submission.json
+    files, so trees saved before the index existed are migrated too (those saved with
+    --skip-meta only if they are in the index). Directories are renamed, never copied,
+    and the index is updated as they move. A submission whose new directory already
+    exists (e.g., it was saved twice at different positions of a flat listing) stays where it is.
+    '''
+    def __init__(self, output_path, layout):
+        if layout not in ArchiveLayout.SHARDED_LAYOUTS:
+            raise ValueError("Can only migrate to one of " + ", ".join(ArchiveLayout.SHARDED_LAYOUTS) +
+                             " (flat directory names need the listing position)")
+        self.output_path = os.path.abspath(os.path.expanduser(output_path))
+        self.layout = layout
+        self.logger = Console.create_logger(__name__)
+
+    def migrate(self, dry_run=False):
+        '''
+        Returns the number of submission directories moved (or, with dry_run, that would be moved)
+        '''
+        index = ArchiveIndex.for_output(self.output_path)
+        submissions = {path: (submission_id, created_utc, True) for submission_id, path, created_utc in index.records()}
+        for path, meta in ArchiveMigrator.find_saved_submissions(self.output_path):
+            if path not in submissions:
+                submissions[path] = (meta.get("id"), meta.get("created_utc"), False)
+
+        self.logger.notice("Migrating " + str(len(submissions)) + " submission(s) in " + self.output_path +
+                           " to the " + self.layout + " layout" + (" (dry run)" if dry_run else ""))
+        moved = 0
+        for path, (submission_id, created_utc, indexed) in sorted(submissions.items()):
+            if not submission_id or not os.path.isdir(path):
+                continue
+            if not created_utc:
+                created_utc = ArchiveMigrator.read_meta(path).get("created_utc", 0)
+            category_dir, layout, title = ArchiveLayout.parse(path, submission_id, created_utc)
+            if layout == self.layout:
+                continue
+            target = ArchiveLayout.path(category_dir, self.layout, submission_id, created_utc, title)
+            if os.path.exists(target):
+                self.logger.warning("Leaving " + self.relative(path) + " in place, " + self.relative(target) + " already exists")
+                continue
+
+            self.logger.spam("  * " + self.relative(path) + " -> " + self.relative(target))
+            moved += 1
+            if dry_run:
+                continue
+            try:
+                FileWriter.ensure_dir(os.path.dirname(target))
+                os.rename(path, target)
+            except OSError as e:
+                self.logger.error("Failed to move " + self.relative(path) + ": " + str(e))
+                moved -= 1
+                continue
+            if indexed:
+                index.move(submission_id, path, target)
+            else:
+                index.add(SimpleNamespace(id=submission_id, created_utc=created_utc, title=title), target)
+            self.remove_empty_shards(os.path.dirname(path), category_dir)
+
+        if not dry_run:
+            # Later runs without --layout save to the new layout (see ArchiveLayout.for_output)
+            ArchiveLayout.save(self.output_path, self.layout)
+        self.logger.success(("Would move " if dry_run else "Moved ") + str(moved) + " submission(s)")
+        return moved
+
+    @staticmethod
+    def find_saved_submissions(output_path):
+        '''
+        Yields (path, submission.json contents) for every directory under `output_path` with a submission.json
+        '''
+        for directory, dirnames, filenames in os.walk(output_path):
+            # Skips .saveddit and the staging directories of unfinished submissions
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            if "submission.json" in filenames:
+                dirnames[:] = []
+                yield directory, ArchiveMigrator.read_meta(directory)
+
+    @staticmethod
+    def read_meta(submission_dir):
+        try:
+            with open(os.path.join(submission_dir, "submission.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def remove_empty_shards(self, directory, category_dir):
+        # Shard directories left empty by moving out of a sharded layout
+        while os.path.normpath(directory) != os.path.normpath(category_dir):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            FileWriter.forget(directory)
+            directory = os.path.dirname(directory)
+
+    def relative(self, path):
+        return os.path.relpath(path, self.output_path)
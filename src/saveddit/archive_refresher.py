@@ -0,0 +1,124 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_migrator import ArchiveMigrator
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+
+
+class ArchiveRefresher:
+    '''
+    Updates the scores, comment counts and other fields that change after posting in the
+    submission.json files saved under an output path (`saveddit refresh`).
+
+    Submissions are found through the archive index and by looking for submission.json
+    files. Their current data is fetched BATCH_SIZE at a time through /api/info, spread
+    over the Reddit apps of the RedditClientPool. Only REFRESHED_FIELDS are replaced, so
+    a post deleted since it was saved keeps its title, author and text. Each submission.json
+    is replaced atomically, and nothing else in a submission directory is touched.
+    '''
+    # /api/info takes up to 100 fullnames per request
+    BATCH_SIZE = 100
+    DEFAULT_JOBS = 4
+
+    # With the defaults SubmissionDownloader.download_submission_meta saves when a field is absent
+    REFRESHED_FIELDS = {
+        "distinguished": None,
+        "edited": False,
+        "link_flair_text": None,
+        "locked": False,
+        "num_comments": 0,
+        "num_crossposts": 0,
+        "over_18": False,
+        "score": 0,
+        "spoiler": False,
+        "stickied": False,
+        "total_awards_received": 0,
+        "upvote_ratio": 0.0,
+    }
+
+    def __init__(self, output_path, reddit_pool, jobs=DEFAULT_JOBS):
+        self.output_path = os.path.abspath(os.path.expanduser(output_path))
+        self.reddit_pool = reddit_pool
+        self.jobs = jobs
+        self.logger = Console.create_logger(__name__)
+
+    def refresh(self):
+        '''
+        Returns the number of submission.json files that were updated
+        '''
+        directories = self.find_submissions()
+        submission_ids = sorted(directories)
+        batches = [submission_ids[i:i + ArchiveRefresher.BATCH_SIZE]
+                   for i in range(0, len(submission_ids), ArchiveRefresher.BATCH_SIZE)]
+        self.logger.notice("Refreshing " + str(len(submission_ids)) + " submission(s) in " + self.output_path +
+                           " (" + str(len(batches)) + " request(s))")
+
+        updated = unchanged = missing = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {executor.submit(self.fetch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    submissions = future.result()
+                except Exception as e:
+                    self.logger.error("Failed to fetch " + str(len(batch)) + " submission(s) from /api/info: " + str(e))
+                    continue
+                for submission_id in batch:
+                    submission = submissions.get(submission_id)
+                    if submission is None:
+                        missing += 1
+                        continue
+                    for submission_dir in directories[submission_id]:
+                        try:
+                            if self.patch(submission_dir, submission):
+                                updated += 1
+                            else:
+                                unchanged += 1
+                        except (OSError, ValueError) as e:
+                            self.logger.error("Failed to update " + os.path.relpath(submission_dir, self.output_path) +
+                                              "/submission.json: " + str(e))
+
+        self.logger.success("Updated " + str(updated) + " submission(s), " + str(unchanged) + " unchanged, " +
+                            str(missing) + " no longer on Reddit")
+        return updated
+
+    def find_submissions(self):
+        '''
+        Returns {submission ID: [directories with a submission.json]}
+        '''
+        directories = {}
+        for submission_id, path in ArchiveIndex.for_output(self.output_path).entries():
+            if os.path.isfile(os.path.join(path, "submission.json")):
+                directories.setdefault(submission_id, set()).add(path)
+        for path, meta in ArchiveMigrator.find_saved_submissions(self.output_path):
+            if meta.get("id"):
+                directories.setdefault(meta["id"], set()).add(path)
+        return {submission_id: sorted(paths) for submission_id, paths in directories.items()}
+
+    def fetch(self, batch):
+        '''
+        Returns {submission ID: praw Submission} for the submissions of `batch` Reddit still has
+        '''
+        fullnames = ["t3_" + submission_id for submission_id in batch]
+        submissions = self.reddit_pool.call(lambda reddit: list(reddit.info(fullnames=fullnames)))
+        return {submission.id: submission for submission in submissions}
+
+    def patch(self, submission_dir, submission):
+        '''
+        Writes the current REFRESHED_FIELDS of `submission` to its submission.json; returns False if none changed
+        '''
+        path = os.path.join(submission_dir, "submission.json")
+        meta = ArchiveMigrator.read_meta(submission_dir)
+        if not meta:
+            raise ValueError("unreadable submission.json")
+        # vars() rather than getattr, so an absent field doesn't make PRAW fetch the submission again
+        attributes = vars(submission)
+        current = {field: attributes.get(field, default) for field, default in ArchiveRefresher.REFRESHED_FIELDS.items()}
+        if all(meta.get(field) == value for field, value in current.items()):
+            return False
+        meta.update(current)
+        meta["saveddit_refreshed_utc"] = int(time.time())
+        FileWriter.write_json(path, meta, indent=2, ensure_ascii=False, default=str)
+        return True
@@ -0,0 +1,148 @@
+import argparse
+import os
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.batch_downloader_config import BatchDownloaderConfig
+from saveddit.console import Console
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.search_config import SearchConfig
+from saveddit.subreddit_downloader import SubredditDownloader
+from saveddit.subreddit_downloader_config import SubredditDownloaderConfig
+from saveddit.user_downloader_config import UserDownloaderConfig
+
+
+class BatchDownloader:
+    '''
+    Runs a manifest of heterogeneous targets (subreddits, multireddits, searches, users)
+    in one process, sharing the Reddit clients, the HTTP connection pool, the on-disk
+    caches and the archive index between them.
+
+    Example jobs.yaml:
+
+        output: ~/Archive
+        concurrency: 4
+        prefetch_pages: 4
+        defaults:
+          categories: [hot, top]
+          post_limit: 100
+        jobs:
+          - subreddit: [pics, aww]
+          - multireddit: [EarthPorn, SkyPorn]
+            skip_comments: true
+          - search: [all]
+            query: "mechanical keyboard"
+            sort: top
+            time_filter: week
+          - user: [Poem_for_your_sprog]
+            command: submitted
+            sort: new
+    '''
+    def __init__(self, manifest_path):
+        with open(os.path.expanduser(manifest_path), "r") as f:
+            self.manifest = yaml.safe_load(f.read()) or {}
+
+        self.logger = Console.create_logger(__name__)
+
+        self.output_path = self.manifest.get("output")
+        if not self.output_path:
+            raise ValueError("`output` is missing in " + manifest_path)
+        self.output_path = os.path.expanduser(self.output_path)
+        ArchiveLayout.for_output(self.output_path)
+        self.concurrency = int(self.manifest.get("concurrency", BatchDownloaderConfig.DEFAULT_CONCURRENCY))
+        self.defaults = self.manifest.get("defaults", {}) or {}
+        if self.manifest.get("prefetch_pages") is not None:
+            ListingPrefetcher.configure(int(self.manifest["prefetch_pages"]))
+
+        # Subreddit, multireddit and search targets share RedditClientFactory's clients;
+        # the user client is created once in run() and shared by every user target
+        self._user_reddit = None
+
+    def run(self):
+        targets = self.expand_targets()
+        self.logger.notice("Running " + str(len(targets)) + " target(s) with concurrency " + str(self.concurrency))
+
+        # Created up front so that every user target shares one client
+        if any(kind == "user" for kind, _, _ in targets):
+            from saveddit.user_downloader import UserDownloader
+            self._user_reddit = UserDownloader().reddit
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.run_target, kind, names, job): (kind, names)
+                       for kind, names, job in targets}
+            for done, future in enumerate(as_completed(futures), start=1):
+                kind, names = futures[future]
+                label = kind + " " + "+".join(names)
+                try:
+                    future.result()
+                    self.logger.success("[" + str(done) + "/" + str(len(targets)) + "] Finished " + label)
+                except Exception as e:
+                    self.logger.error("[" + str(done) + "/" + str(len(targets)) + "] Failed " + label + " - " + str(e))
+
+    def expand_targets(self):
+        '''
+        Returns a list of (kind, names, job) tuples. Subreddit jobs become one target per subreddit
+        '''
+        targets = []
+        for job in self.manifest.get("jobs", []) or []:
+            kinds = [k for k in BatchDownloaderConfig.JOB_TYPES if k in job]
+            if len(kinds) != 1:
+                raise ValueError("Each job needs exactly one of " + ", ".join(BatchDownloaderConfig.JOB_TYPES) + ": " + str(job))
+            kind = kinds[0]
+            names = job[kind]
+            if isinstance(names, str):
+                names = [names]
+            settings = dict(self.defaults)
+            settings.update(job)
+            if kind == "subreddit":
+                for name in names:
+                    targets.append((kind, [name], settings))
+            else:
+                targets.append((kind, list(names), settings))
+        return targets
+
+    def run_target(self, kind, names, job):
+        skip_videos = job.get("skip_videos", False)
+        skip_meta = job.get("skip_meta", False)
+        skip_comments = job.get("skip_comments", False)
+
+        if kind == "subreddit":
+            downloader = SubredditDownloader(names[0])
+            downloader.download(self.output_path,
+                                download_all_comments=job.get("all_comments", False),
+                                categories=job.get("categories", SubredditDownloaderConfig.DEFAULT_CATEGORIES),
+                                post_limit=job.get("post_limit", SubredditDownloaderConfig.DEFAULT_POST_LIMIT),
+                                skip_videos=skip_videos, skip_meta=skip_meta, skip_comments=skip_comments)
+        elif kind == "multireddit":
+            from saveddit.multireddit_downloader import MultiredditDownloader
+            from saveddit.multireddit_downloader_config import MultiredditDownloaderConfig
+            downloader = MultiredditDownloader(names)
+            downloader.download(self.output_path,
+                                categories=job.get("categories", MultiredditDownloaderConfig.DEFAULT_CATEGORIES),
+                                post_limit=job.get("post_limit", MultiredditDownloaderConfig.DEFAULT_POST_LIMIT),
+                                skip_videos=skip_videos, skip_meta=skip_meta, skip_comments=skip_comments)
+        elif kind == "search":
+            from saveddit.search_subreddits import SearchSubreddits
+            if not job.get("query"):
+                raise ValueError("search job without a `query`")
+            downloader = SearchSubreddits(names)
+            queries = job["query"]
+            downloader.download(argparse.Namespace(
+                o=self.output_path, q=[queries] if isinstance(queries, str) else list(queries),
+                j=job.get("jobs", SearchConfig.DEFAULT_BACKFILL_JOBS),
+                s=job.get("sort", SearchConfig.DEFAULT_SORT),
+                t=job.get("time_filter", SearchConfig.DEFAULT_TIME_FILTER),
+                include_nsfw=job.get("include_nsfw", False),
+                skip_comments=skip_comments, skip_videos=skip_videos, skip_meta=skip_meta))
+        elif kind == "user":
+            from saveddit.user_downloader import UserDownloader
+            downloader = UserDownloader(reddit=self._user_reddit)
+            command = job.get("command", "submitted")
+            comment_limit = UserDownloaderConfig.DEFAULT_COMMENT_LIMIT
+            downloader.download(argparse.Namespace(
+                o=self.output_path, users=names, user_subparser_name=command,
+                s=job.get("sort", UserDownloaderConfig.DEFAULT_SORT),
+                l=job.get("post_limit", comment_limit if command == "comments" else UserDownloaderConfig.DEFAULT_POST_LIMIT),
+                n=job.get("names"),
+                f=job.get("categories", UserDownloaderConfig.DEFAULT_CATEGORIES),
+                skip_comments=skip_comments, skip_videos=skip_videos, skip_meta=skip_meta))
@@ -0,0 +1,3 @@
+class BatchDownloaderConfig:
+    DEFAULT_CONCURRENCY = 4
+    JOB_TYPES = ["subreddit", "multireddit", "search", "user"]
\ No newline at end of file
@@ -11,6 +11,9 @@ class ConfigurationLoader:
     WHITE = colorama.Style.RESET_ALL
     RED = colorama.Fore.RED
 
+    # Set by `saveddit --quiet`
+    quiet = False
+
     @staticmethod
     def load(path):
         """
@@ -36,13 +39,14 @@ class ConfigurationLoader:
             sys.exit(0)
 
         # Explicitly converting path to POSIX-like path (to avoid '\\' hell)
-        print(
-            "{notice}Retrieving configuration from {path} file{white}".format(
-                path=path,
-                notice=ConfigurationLoader.PURPLE,
-                white=ConfigurationLoader.WHITE,
+        if not ConfigurationLoader.quiet:
+            print(
+                "{notice}Retrieving configuration from {path} file{white}".format(
+                    path=path,
+                    notice=ConfigurationLoader.PURPLE,
+                    white=ConfigurationLoader.WHITE,
+                )
             )
-        )
         path = pathlib.Path(path).absolute().as_posix()
 
         # Check if file exists. If not, create one and fill it with std config template
@@ -85,3 +89,25 @@ class ConfigurationLoader:
 
         with open(path, "r") as _f:
             return yaml.safe_load(_f.read())
+
+    @staticmethod
+    def reddit_credentials(config):
+        """
+        Returns the Reddit app credentials of a loaded configuration as a list of
+        (client_id, client_secret) tuples.
+
+        The primary `reddit_client_id`/`reddit_client_secret` pair comes first, followed by
+        any extra apps listed under `reddit_credentials`, e.g.,
+
+            reddit_credentials:
+              - client_id: '<SECOND_CLIENT_ID>'
+                client_secret: '<SECOND_CLIENT_SECRET>'
+        """
+        credentials = []
+        if config.get("reddit_client_id"):
+            credentials.append((config["reddit_client_id"], config.get("reddit_client_secret")))
+        for entry in config.get("reddit_credentials") or []:
+            pair = (entry.get("client_id"), entry.get("client_secret"))
+            if pair[0] and pair not in credentials:
+                credentials.append(pair)
+        return credentials
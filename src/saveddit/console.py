@@ -0,0 +1,239 @@
+import coloredlogs
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import verboselogs
+from saveddit.metrics import Metrics
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    '''
+    In-process QueueHandler that leaves formatting to the listener thread.
+    The stock QueueHandler formats every record in the caller's thread so that it can be pickled.
+    '''
+    def prepare(self, record):
+        return record
+
+
+class _ConsoleHandler(logging.StreamHandler):
+    '''
+    Writes log lines above the progress status line, which is redrawn afterwards
+    '''
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            with Console.output_lock:
+                Console.clear_status()
+                self.stream.write(message + self.terminator)
+                Console.draw_status()
+                self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class Console:
+    '''
+    Console output shared by all downloaders of a process.
+
+    Loggers created with Console.create_logger hand their records to a queue; a
+    background listener thread formats (colors) and writes them, so downloads never
+    block on the terminal. Records below Console.level are dropped before any
+    formatting takes place, and quiet mode (for cron) only lets errors through.
+    '''
+    LEVEL_STYLES = {
+        'critical': {'bold': True, 'color': 'red'},
+        'debug': {'color': 'green'},
+        'error': {'color': 'red'},
+        'info': {'color': 'white'},
+        'notice': {'color': 'magenta'},
+        'spam': {'color': 'white', 'faint': True},
+        'success': {'bold': True, 'color': 'green'},
+        'verbose': {'color': 'blue'},
+        'warning': {'color': 'yellow'}
+    }
+    FORMAT = '%(message)s'
+
+    level = verboselogs.SPAM
+    quiet = False
+
+    output_lock = threading.RLock()
+    stream = sys.stderr
+    status = None
+
+    _queue = None
+    _listener = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, quiet=False):
+        '''
+        Call before creating loggers
+        '''
+        cls.quiet = quiet
+        cls.level = logging.ERROR if quiet else verboselogs.SPAM
+
+    @classmethod
+    def create_logger(cls, name):
+        logger = verboselogs.VerboseLogger(name)
+        logger.handlers = [_LazyQueueHandler(cls._ensure_listener())]
+        logger.propagate = False
+        logger.setLevel(cls.level)
+        return logger
+
+    @classmethod
+    def stop(cls):
+        '''
+        Writes out the queued records and stops the listener thread
+        '''
+        with cls._lock:
+            if cls._listener is not None:
+                cls._listener.stop()
+                cls._listener = None
+                cls._queue = None
+        cls.set_status(None)
+
+    @classmethod
+    def set_status(cls, text):
+        '''
+        Shows text on a status line at the bottom of the terminal (None removes it)
+        '''
+        with cls.output_lock:
+            cls.clear_status()
+            cls.status = text
+            cls.draw_status()
+            cls.stream.flush()
+
+    @classmethod
+    def clear_status(cls):
+        if cls.status is not None:
+            cls.stream.write("\r\x1b[K")
+
+    @classmethod
+    def draw_status(cls):
+        if cls.status is not None:
+            cls.stream.write(cls.status)
+
+    @classmethod
+    def _ensure_listener(cls):
+        with cls._lock:
+            if cls._listener is None:
+                handler = _ConsoleHandler(cls.stream)
+                if coloredlogs.terminal_supports_colors(cls.stream):
+                    handler.setFormatter(coloredlogs.ColoredFormatter(fmt=cls.FORMAT, level_styles=cls.LEVEL_STYLES))
+                else:
+                    handler.setFormatter(logging.Formatter(cls.FORMAT))
+                if cls._queue is None:
+                    cls._queue = queue.Queue(-1)
+                cls._listener = logging.handlers.QueueListener(cls._queue, handler)
+                cls._listener.start()
+            return cls._queue
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # The listener and progress threads don't exist in a forked child, and the locks they
+        # may have held at the fork would never be released. The queue is reset in place since
+        # loggers created before the fork hold it; the next create_logger starts a listener for it.
+        cls.output_lock = threading.RLock()
+        cls._lock = threading.Lock()
+        cls._listener = None
+        if cls._queue is not None:
+            cls._queue.__init__(-1)
+        Progress._shared_lock = threading.Lock()
+        if Progress._shared is not None:
+            Progress._shared._lock = threading.Lock()
+
+
+class Progress:
+    '''
+    One aggregated status line for the whole run (submissions/s, bytes/s and queue
+    depths) in place of a progress bar per file. Rates come from Metrics.
+    '''
+    REFRESH_SECONDS = 1.0
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._stop = None
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def add_gauge(self, name, function):
+        '''
+        Shows the sum of all function() registered under name, e.g., queue sizes.
+        Returns a token for remove_gauge.
+        '''
+        token = object()
+        with self._lock:
+            self._gauges[token] = (name, function)
+        return token
+
+    def remove_gauge(self, token):
+        with self._lock:
+            self._gauges.pop(token, None)
+
+    def start(self):
+        '''
+        Starts redrawing the status line, when stderr is a terminal and output isn't quiet
+        '''
+        if Console.quiet or not Console.stream.isatty() or self._stop is not None:
+            return
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+            Console.set_status(None)
+
+    def render(self, elapsed, submissions, received):
+        parts = [
+            "{} submissions ({:.1f}/s)".format(submissions, submissions / elapsed if elapsed else 0),
+            "{} ({}/s)".format(Progress.format_bytes(received), Progress.format_bytes(received / elapsed if elapsed else 0)),
+        ]
+        with self._lock:
+            gauges = list(self._gauges.values())
+        totals = {}
+        for name, function in gauges:
+            try:
+                totals[name] = totals.get(name, 0) + function()
+            except Exception:
+                pass
+        for name in sorted(totals):
+            parts.append(name + " " + str(totals[name]))
+        return " | ".join(parts)
+
+    @staticmethod
+    def format_bytes(count):
+        for unit in ("B", "KiB", "MiB", "GiB"):
+            if count < 1024:
+                return "{:.1f} {}".format(count, unit)
+            count /= 1024
+        return "{:.1f} TiB".format(count)
+
+    def _run(self, stop):
+        metrics = Metrics.shared()
+        started = time.monotonic()
+        while not stop.wait(Progress.REFRESH_SECONDS):
+            submissions = int(metrics.total("saveddit_submissions_total"))
+            received = metrics.total("saveddit_http_response_bytes_total")
+            # Stay out of the way of prompts (e.g., for the Reddit password) until downloads start
+            if not submissions and not received and Console.status is None:
+                continue
+            Console.set_status(self.render(time.monotonic() - started, submissions, received))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Console._reset_after_fork)
@@ -0,0 +1,102 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from saveddit.metrics import Metrics
+
+
+class DiskCache:
+    '''
+    Small persistent key/value cache backed by SQLite.
+
+    Entries live in a namespace (e.g., "imgur_album") and carry an expiry
+    timestamp. Values are stored as JSON, so a cached `None` is a valid
+    (negative) entry - use `DiskCache.MISS` to tell misses apart.
+    '''
+    MISS = object()
+
+    DEFAULT_PATH = os.path.expanduser("~/.saveddit/cache.sqlite3")
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, "
+                "key TEXT NOT NULL, "
+                "value TEXT, "
+                "expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))")
+            self._connection.commit()
+
+    @classmethod
+    def shared(cls, path=DEFAULT_PATH):
+        '''
+        Returns one DiskCache per path for the whole process
+        '''
+        with cls._shared_lock:
+            cache = cls._shared.get(path)
+            if cache is None:
+                cache = cls(path)
+                cls._shared[path] = cache
+            return cache
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # SQLite connections must not be used across fork(); a forked worker opens its own
+        cls._shared = {}
+        cls._shared_lock = threading.Lock()
+
+    def get(self, namespace, key):
+        '''
+        Returns the cached value, or DiskCache.MISS if the entry is absent or expired
+        '''
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key)).fetchone()
+        if row is None:
+            Metrics.shared().inc("saveddit_cache_lookups_total", namespace=namespace, result="miss")
+            return DiskCache.MISS
+        value, expires_at = row
+        if expires_at < time.time():
+            self.delete(namespace, key)
+            Metrics.shared().inc("saveddit_cache_lookups_total", namespace=namespace, result="expired")
+            return DiskCache.MISS
+        Metrics.shared().inc("saveddit_cache_lookups_total", namespace=namespace, result="hit")
+        return json.loads(value)
+
+    def set(self, namespace, key, value, ttl):
+        '''
+        ttl: Number of seconds the entry stays valid
+        '''
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time() + ttl))
+            self._connection.commit()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+            self._connection.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            self._connection.commit()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=DiskCache._reset_after_fork)
@@ -0,0 +1,129 @@
+import os
+import socket
+import threading
+import time
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+from saveddit.distributed_downloader_config import DistributedDownloaderConfig
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.reddit_client import RedditClientFactory
+from saveddit.submission_downloader import SubmissionDownloader
+from saveddit.subreddit_downloader import SubredditDownloader
+from saveddit.work_queue import WorkQueue
+
+
+class Coordinator:
+    '''
+    Expands a subreddit job (subreddits x categories x submissions) into one
+    work unit per submission and puts the units in a WorkQueue.
+    '''
+    def __init__(self, queue_url):
+        self.queue = WorkQueue.open(queue_url)
+        self.logger = Console.create_logger(__name__)
+        self.reddit_pool = RedditClientFactory.pool(SubredditDownloader.REDDIT_CREDENTIALS)
+
+    def enqueue_subreddits(self, args):
+        output_path = os.path.abspath(args.o)
+        comment_limit = None if args.all_comments else 0
+
+        for subreddit_name in sorted(args.subreddits):
+            for c in args.f:
+                self.logger.notice("Expanding /r/" + subreddit_name + "/" + c + "/")
+                # Relative to the output path, so workers can mount the shared tree anywhere
+                category_dir = os.path.join("www.reddit.com", "r", subreddit_name, c)
+                listing = self.reddit_pool.listing(
+                    lambda reddit: getattr(reddit.subreddit(subreddit_name), c), args.l)
+                added = 0
+                with ListingPrefetcher(listing) as submissions:
+                    for i, submission in enumerate(submissions):
+                        unit = {
+                            "submission_id": submission.id,
+                            "index": i,
+                            "output_path": output_path,
+                            "category_dir": category_dir,
+                            "skip_videos": args.skip_videos,
+                            "skip_meta": args.skip_meta,
+                            "skip_comments": args.skip_comments,
+                            "comment_limit": comment_limit,
+                        }
+                        if self.queue.put(category_dir + "/" + submission.id, unit):
+                            added += 1
+                self.logger.spam("     * Queued " + str(added) + " submissions")
+
+        counts = self.queue.counts()
+        self.logger.success("Queue now holds " + str(counts["pending"]) + " pending, " +
+                            str(counts["leased"]) + " leased, " + str(counts["done"]) + " done and " +
+                            str(counts["failed"]) + " failed units")
+
+
+class Worker:
+    '''
+    Leases units from a WorkQueue and downloads them with SubmissionDownloader,
+    heartbeating while a unit is in progress.
+    '''
+    IDLE_POLL_SECONDS = 10
+
+    def __init__(self, queue_url, lease_seconds=DistributedDownloaderConfig.DEFAULT_LEASE_SECONDS, output_path=None):
+        self.queue = WorkQueue.open(queue_url)
+        self.lease_seconds = lease_seconds
+        self.output_path = output_path
+        self.worker_id = socket.gethostname() + ":" + str(os.getpid())
+        self.logger = Console.create_logger(__name__)
+        self.reddit_pool = RedditClientFactory.pool(SubredditDownloader.REDDIT_CREDENTIALS)
+
+    def run(self, wait=False):
+        '''
+        wait: Keep polling for new units instead of exiting once the queue is drained
+        '''
+        self.logger.notice("Worker " + self.worker_id + " started")
+        processed = 0
+        while True:
+            requeued = self.queue.requeue_expired()
+            if requeued:
+                self.logger.warning("Re-queued " + str(requeued) + " abandoned unit(s)")
+
+            leased = self.queue.lease(self.worker_id, self.lease_seconds)
+            if leased is None:
+                if not wait and self.queue.counts()["leased"] == 0:
+                    break
+                # Other workers may still abandon their leases
+                time.sleep(Worker.IDLE_POLL_SECONDS)
+                continue
+
+            unit_id, unit = leased
+            self.process(unit_id, unit)
+            processed += 1
+
+        self.logger.success("Worker " + self.worker_id + " finished after " + str(processed) + " unit(s)")
+
+    def process(self, unit_id, unit):
+        stop_heartbeat = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(unit_id, stop_heartbeat), daemon=True)
+        heartbeat.start()
+        try:
+            output_path = self.output_path or unit["output_path"]
+            ArchiveLayout.for_output(output_path)
+            category_dir = os.path.join(output_path, unit["category_dir"])
+            FileWriter.ensure_dir(category_dir)
+
+            submission = self.reddit_pool.best().submission(id=unit["submission_id"])
+            SubmissionDownloader(submission, unit["index"], self.logger, category_dir,
+                unit["skip_videos"], unit["skip_meta"], unit["skip_comments"], unit["comment_limit"],
+                {'imgur_client_id': SubredditDownloader.IMGUR_CLIENT_ID,
+                 'archive_index': ArchiveIndex.for_output(output_path),
+                 'reddit_pool': self.reddit_pool})
+            self.queue.complete(unit_id, self.worker_id)
+        except Exception as e:
+            self.logger.error("Unit " + str(unit_id) + " (" + unit["submission_id"] + ") failed - " + str(e))
+            self.queue.fail(unit_id, self.worker_id, e)
+        finally:
+            stop_heartbeat.set()
+            heartbeat.join()
+
+    def _heartbeat(self, unit_id, stop):
+        while not stop.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(unit_id, self.worker_id, self.lease_seconds):
+                self.logger.warning("Lost the lease on unit " + str(unit_id))
+                return
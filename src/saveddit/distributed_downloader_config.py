@@ -0,0 +1,2 @@
+class DistributedDownloaderConfig:
+    DEFAULT_LEASE_SECONDS = 300
\ No newline at end of file
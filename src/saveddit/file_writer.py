@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+
+class FileWriter:
+    '''
+    Write path of the archive, shared by all downloaders of a process.
+
+    Directories that were created (or found) once are remembered, so asking for them
+    again costs no stat or mkdir - this adds up on network filesystems. Files are written
+    to a temporary file next to their final name and renamed into place, so an
+    interrupted write never leaves a truncated file under the final name.
+
+    A submission is saved into a hidden staging directory (see `begin`) that `commit`
+    renames to its final name once everything was written. A crash therefore leaves no
+    directory that the next run would take for a complete submission and skip. With
+    fsync enabled, `commit` fsyncs the files and directories of the submission in one batch.
+    '''
+    TEMP_SUFFIX = ".tmp"
+    STAGING_SUFFIX = ".part"
+    REPLACED_SUFFIX = ".old"
+
+    fsync = True
+
+    _known_dirs = set()
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, fsync=True):
+        cls.fsync = fsync
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # Another thread of the parent may have held the lock at the fork
+        cls._lock = threading.Lock()
+
+    @classmethod
+    def ensure_dir(cls, path):
+        '''
+        Creates directory `path` (and its parents) unless it was created or found before
+        '''
+        path = os.path.abspath(path)
+        if path in cls._known_dirs:
+            return path
+        os.makedirs(path, exist_ok=True)
+        with cls._lock:
+            cls._known_dirs.add(path)
+        return path
+
+    @classmethod
+    def forget(cls, path):
+        '''
+        Drops `path` and the directories below it from the known directories, e.g., after renaming or removing it
+        '''
+        path = os.path.abspath(path)
+        with cls._lock:
+            cls._known_dirs = {d for d in cls._known_dirs if d != path and not d.startswith(path + os.sep)}
+
+    @classmethod
+    @contextmanager
+    def open(cls, path, mode="wb", encoding=None):
+        '''
+        Opens a temporary file that replaces `path` when the block exits without an exception
+        '''
+        directory, name = os.path.split(os.path.abspath(path))
+        temp_path = os.path.join(directory, "." + name[:200] + "." + os.urandom(4).hex() + FileWriter.TEMP_SUFFIX)
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, mode, encoding=encoding) as f:
+                yield f
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @staticmethod
+    def link(source, path):
+        '''
+        Replaces `path` with a hard link to `source`
+        '''
+        if os.path.lexists(path) and os.path.samefile(source, path):
+            # Already linked; renaming a link over its own inode is a no-op that would strand the temp file
+            return
+        directory, name = os.path.split(os.path.abspath(path))
+        temp_path = os.path.join(directory, "." + name[:200] + "." + os.urandom(4).hex() + FileWriter.TEMP_SUFFIX)
+        os.link(source, temp_path)
+        try:
+            os.replace(temp_path, path)
+        finally:
+            # rename() leaves both names in place if another thread linked `path` to `source` meanwhile
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def write_json(cls, path, value, **kwargs):
+        with cls.open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f, **kwargs)
+
+    @staticmethod
+    def staging_dir(final_dir):
+        parent, name = os.path.split(os.path.abspath(final_dir))
+        return os.path.join(parent, "." + name + FileWriter.STAGING_SUFFIX)
+
+    @classmethod
+    def begin(cls, final_dir):
+        '''
+        Creates the empty staging directory of `final_dir` and returns its path.
+        Leftovers of an interrupted earlier attempt are removed first.
+        '''
+        cls.ensure_dir(os.path.dirname(os.path.abspath(final_dir)))
+        staging_dir = FileWriter.staging_dir(final_dir)
+        try:
+            os.mkdir(staging_dir)
+        except FileExistsError:
+            shutil.rmtree(staging_dir)
+            os.mkdir(staging_dir)
+        return staging_dir
+
+    @classmethod
+    def commit(cls, staging_dir, final_dir, replace=False):
+        '''
+        Makes the staging directory durable (with fsync) and renames it to `final_dir`.
+        With replace, an existing `final_dir` is moved aside first and removed afterwards.
+        '''
+        cls.forget(staging_dir)
+        if cls.fsync:
+            for directory, _, filenames in os.walk(staging_dir, topdown=False):
+                for filename in filenames:
+                    cls._fsync(os.path.join(directory, filename))
+                cls._fsync_dir(directory)
+        replaced_dir = None
+        if replace and os.path.isdir(final_dir):
+            parent, name = os.path.split(os.path.abspath(final_dir))
+            replaced_dir = os.path.join(parent, "." + name + FileWriter.REPLACED_SUFFIX)
+            shutil.rmtree(replaced_dir, ignore_errors=True)
+            cls.forget(final_dir)
+            os.rename(final_dir, replaced_dir)
+        os.rename(staging_dir, final_dir)
+        if replaced_dir is not None:
+            shutil.rmtree(replaced_dir, ignore_errors=True)
+        if cls.fsync:
+            cls._fsync_dir(os.path.dirname(os.path.abspath(final_dir)))
+
+    @classmethod
+    def discard(cls, staging_dir):
+        cls.forget(staging_dir)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    @staticmethod
+    def _fsync(path, flags=os.O_RDONLY):
+        fd = os.open(path, flags)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _fsync_dir(path):
+        # Persists renames and new entries; directories can't be opened for fsync on Windows
+        if hasattr(os, "O_DIRECTORY"):
+            FileWriter._fsync(path, os.O_RDONLY | os.O_DIRECTORY)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=FileWriter._reset_after_fork)
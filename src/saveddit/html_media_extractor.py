@@ -0,0 +1,74 @@
+import html
+import re
+
+
+class EmbeddedVideoExtractor:
+    '''
+    Finds the embedded MP4 URL of a gfycat/redgifs style page without parsing the whole document.
+
+    The page is consumed chunk by chunk and matched with precompiled patterns:
+      - the first `<source src="....mp4">` that follows a `<video>` tag wins immediately
+      - otherwise the first `"contentUrl": "....mp4"` found in a script block is used
+    Reading stops as soon as a `<video>` source is found, or after `max_bytes`.
+    '''
+    DEFAULT_MAX_BYTES = 512 * 1024
+    CHUNK_SIZE = 16 * 1024
+
+    # Bytes carried over between chunks so that tags split across two chunks still match
+    OVERLAP = 2048
+
+    VIDEO_TAG_PATTERN = re.compile(rb'<video\b', re.IGNORECASE)
+    SOURCE_TAG_PATTERN = re.compile(
+        rb'<source\b[^>]*?\bsrc\s*=\s*["\']([^"\'>]+?\.mp4)["\']', re.IGNORECASE)
+    CONTENT_URL_PATTERN = re.compile(rb'"contentUrl"\s*:\s*"([^"]+?\.mp4)"')
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def extract(self, chunks):
+        '''
+        chunks: Iterable of bytes, e.g., `response.iter_content(EmbeddedVideoExtractor.CHUNK_SIZE)`
+
+        Returns:
+            A (url, origin) tuple where origin is "video" or "script", or (None, None)
+        '''
+        buffer = b""
+        in_video = False
+        script_url = None
+        self.bytes_read = 0
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+            self.bytes_read += len(chunk)
+            buffer += chunk
+
+            if script_url is None:
+                match = EmbeddedVideoExtractor.CONTENT_URL_PATTERN.search(buffer)
+                if match:
+                    script_url = self._decode(match.group(1))
+
+            if not in_video:
+                match = EmbeddedVideoExtractor.VIDEO_TAG_PATTERN.search(buffer)
+                if match:
+                    in_video = True
+                    # From here on the buffer only holds content that follows the <video> tag
+                    buffer = buffer[match.start():]
+            if in_video:
+                match = EmbeddedVideoExtractor.SOURCE_TAG_PATTERN.search(buffer)
+                if match:
+                    return self._decode(match.group(1)), "video"
+
+            if self.bytes_read >= self.max_bytes:
+                break
+            buffer = buffer[-EmbeddedVideoExtractor.OVERLAP:]
+
+        if script_url:
+            return script_url, "script"
+        return None, None
+
+    def _decode(self, raw_url):
+        url = raw_url.decode("utf-8", "replace")
+        # Attribute values are HTML-escaped, JSON strings may escape slashes
+        return html.unescape(url).replace("\\/", "/")
@@ -0,0 +1,60 @@
+import os
+import threading
+import requests
+import urllib.parse
+from requests.adapters import HTTPAdapter
+from saveddit.metrics import Metrics
+
+
+class HttpSession:
+    '''
+    Process-wide requests.Session used for all media and Imgur API traffic,
+    so that connections are pooled and reused across submissions and threads.
+    '''
+    # Number of hosts with a connection pool, and connections kept per host
+    POOL_CONNECTIONS = 32
+    POOL_MAXSIZE = 32
+
+    _session = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls._lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=cls.POOL_CONNECTIONS, pool_maxsize=cls.POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.hooks["response"].append(cls._record_metrics)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # Pooled connections must not be shared with forked workers
+        cls._session = None
+        cls._lock = threading.Lock()
+
+    @staticmethod
+    def _record_metrics(response, *args, **kwargs):
+        metrics = Metrics.shared()
+        host = urllib.parse.urlparse(response.url).hostname or "unknown"
+        metrics.inc("saveddit_http_requests_total", host=host, status=str(response.status_code))
+        metrics.observe("saveddit_http_request_seconds", response.elapsed.total_seconds(), host=host)
+
+        # Count body bytes as they are read, streamed or not (response.content reads through iter_content)
+        iter_content = response.iter_content
+
+        def counting_iter_content(*args, **kwargs):
+            for chunk in iter_content(*args, **kwargs):
+                if chunk:
+                    metrics.inc("saveddit_http_response_bytes_total", len(chunk), host=host)
+                yield chunk
+
+        response.iter_content = counting_iter_content
+        return response
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=HttpSession._reset_after_fork)
@@ -0,0 +1,184 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from saveddit.file_writer import FileWriter
+from saveddit.image_hash_index import ImageHashIndex
+from saveddit.metrics import Metrics
+
+
+# Bits per side of the hash, 8 makes a 64-bit hash
+HASH_SIZE = 8
+
+
+def dhash_images(paths, hash_size=HASH_SIZE):
+    '''
+    Returns the difference hash of each image in `paths` (None where the file can't be decoded).
+
+    Runs in the worker processes of ImageDeduplicator. Every image is shrunk to
+    (hash_size + 1) x hash_size grey pixels, then the bits (is a pixel brighter than its
+    left neighbour?) of the whole batch are computed and packed in one go.
+    '''
+    import numpy
+    from PIL import Image
+
+    pixels = numpy.zeros((len(paths), hash_size, hash_size + 1), dtype=numpy.int16)
+    decoded = []
+    for i, path in enumerate(paths):
+        try:
+            with Image.open(path) as image:
+                # Lets JPEGs be decoded at a fraction of their size
+                image.draft("L", (4 * (hash_size + 1), 4 * hash_size))
+                pixels[i] = numpy.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS))
+            decoded.append(True)
+        except Exception:
+            decoded.append(False)
+    bits = numpy.packbits((pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(paths), -1), axis=1)
+    return [int.from_bytes(row.tobytes(), "big") if ok else None for row, ok in zip(bits, decoded)]
+
+
+class ImageDeduplicator:
+    '''
+    Replaces images that look like one saved before (reposts, recompressed or resized
+    copies) with hard links to the earlier file (`saveddit --dedup-images`).
+
+    Once the media of a submission are downloaded, the hashes of its images are computed
+    in a pool of `workers` processes, one batch per submission, and looked up in the
+    ImageHashIndex of the output path. An image within max_distance bits of an indexed
+    one is replaced by a hard link to it; any other image is added to the index.
+
+    The workers of `saveddit -j` already spread the downloads over processes, so they hash
+    in-process (workers = 1) rather than each starting a pool of their own.
+
+    Needs Pillow and numpy, which saveddit doesn't install by default.
+    '''
+    IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+    DEFAULT_MAX_DISTANCE = 4
+    HASH_WORKERS = min(4, os.cpu_count() or 1)
+
+    enabled = False
+    max_distance = DEFAULT_MAX_DISTANCE
+    workers = HASH_WORKERS
+
+    _pool = None
+    _pool_lock = threading.Lock()
+    # Keeps two threads from both indexing the same new image
+    _index_lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, enabled=False, max_distance=DEFAULT_MAX_DISTANCE, workers=HASH_WORKERS):
+        cls.enabled = enabled
+        cls.max_distance = max_distance
+        cls.workers = workers
+
+    @classmethod
+    def shutdown(cls):
+        '''
+        Stops the hashing processes, at the end of a run
+        '''
+        with cls._pool_lock:
+            pool, cls._pool = cls._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # The parent's pool can't be used from a forked worker, and another thread may have held the locks
+        cls._pool = None
+        cls._pool_lock = threading.Lock()
+        cls._index_lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        try:
+            import numpy
+            import PIL
+        except ImportError:
+            return False
+        return True
+
+    @classmethod
+    def hash_files(cls, paths):
+        if cls.workers <= 1:
+            return dhash_images(paths)
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = ProcessPoolExecutor(max_workers=cls.workers)
+            pool = cls._pool
+        try:
+            return pool.submit(dhash_images, paths).result()
+        except (BrokenProcessPool, OSError):
+            # No worker process could be started, e.g., in a sandbox
+            return dhash_images(paths)
+
+    @classmethod
+    def dedupe(cls, archive_index, submission_id, submission_dir):
+        '''
+        Links or indexes the images in the files directory of `submission_dir`, saved for `submission_id`.
+        Returns {file: {"submission_id", "file", "distance"}} for the images that were replaced with links.
+        '''
+        files_dir = os.path.join(submission_dir, "files")
+        try:
+            names = sorted(os.listdir(files_dir))
+        except OSError:
+            return {}
+        files = [os.path.join("files", name) for name in names
+                 if name.lower().endswith(ImageDeduplicator.IMAGE_EXTENSIONS)]
+        if not files:
+            return {}
+        hashes = cls.hash_files([os.path.join(submission_dir, file) for file in files])
+
+        index = ImageHashIndex.for_output(archive_index.output_path)
+        duplicates = {}
+        with cls._index_lock:
+            index.refresh()
+            for file, value in zip(files, hashes):
+                if value is None:
+                    continue
+                hits = index.search(value, cls.max_distance)
+                match = cls.find_original(hits, archive_index, submission_id, submission_dir, file)
+                if match is None:
+                    # A re-run (or --update) finds the image already indexed
+                    if not any((hit_id, hit_file) == (submission_id, file) for _, hit_id, hit_file in hits):
+                        index.add(value, submission_id, file)
+                    continue
+                original_path, original_id, original_file, distance = match
+                path = os.path.join(submission_dir, file)
+                if not cls.same_file(original_path, path):
+                    try:
+                        FileWriter.link(original_path, path)
+                    except OSError:
+                        # e.g., the original is on another filesystem; the image stays a copy
+                        continue
+                    Metrics.shared().inc("saveddit_duplicate_images_total")
+                # else it is a link to the original already, e.g., --update reused the earlier copy
+                duplicates[file] = {"submission_id": original_id, "file": original_file, "distance": distance}
+        return duplicates
+
+    @classmethod
+    def find_original(cls, hits, archive_index, submission_id, submission_dir, file):
+        '''
+        Returns (path, submission ID, file, distance) of the closest of `hits` (from ImageHashIndex.search)
+        that is still on disk and isn't image `file` of `submission_id` itself
+        '''
+        for distance, original_id, original_file in hits:
+            if (original_id, original_file) == (submission_id, file):
+                continue # Its own entry, from an earlier run
+            # The submission being saved isn't in the archive index yet
+            directories = ([submission_dir] if original_id == submission_id else []) + archive_index.paths(original_id)
+            for directory in directories:
+                path = os.path.join(directory, original_file)
+                if os.path.isfile(path):
+                    return path, original_id, original_file, distance
+        return None
+
+    @staticmethod
+    def same_file(a, b):
+        try:
+            return os.path.samefile(a, b)
+        except OSError:
+            return False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ImageDeduplicator._reset_after_fork)
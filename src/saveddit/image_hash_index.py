@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+from saveddit.archive_index import ArchiveIndex
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class ImageHashIndex:
+    '''
+    Perceptual hashes of the images saved under one output path, searchable by Hamming distance.
+
+    Stored as SQLite in <output_path>/.saveddit/image_hashes.sqlite3 next to the
+    ArchiveIndex. Images are recorded as (submission ID, path within the submission
+    directory), so entries stay valid when `saveddit migrate` moves submissions.
+
+    Lookups go through a BK-tree held in memory. Every row also stores where it was
+    attached in the tree (parent row and edge distance), so loading the tree doesn't
+    search it for every row. Rows added by other processes are picked up by `refresh`.
+    '''
+    INDEX_FILE = "image_hashes.sqlite3"
+
+    _indexes = {}
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, output_path):
+        self.output_path = os.path.abspath(output_path)
+        index_dir = os.path.join(self.output_path, ArchiveIndex.INDEX_DIR)
+        os.makedirs(index_dir, exist_ok=True)
+        self.path = os.path.join(index_dir, ImageHashIndex.INDEX_FILE)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        # BK-tree nodes, by row id: hash, {distance: child row id}, (submission ID, file)
+        self._hashes = {}
+        self._children = {}
+        self._images = {}
+        self._root = None
+        self._last_row = 0
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS image_hashes ("
+                "row INTEGER PRIMARY KEY, "
+                "hash INTEGER NOT NULL, "
+                "parent INTEGER, "
+                "distance INTEGER, "
+                "submission_id TEXT NOT NULL, "
+                "file TEXT NOT NULL)")
+            self._connection.commit()
+        self.refresh()
+
+    @classmethod
+    def for_output(cls, output_path):
+        '''
+        Returns one ImageHashIndex per output path for the whole process
+        '''
+        key = os.path.abspath(output_path)
+        with cls._indexes_lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                index = cls(key)
+                cls._indexes[key] = index
+            return index
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # SQLite connections must not be used across fork(); a forked worker opens its own
+        cls._indexes = {}
+        cls._indexes_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    # SQLite integers are signed 64-bit
+    @staticmethod
+    def _to_sql(value):
+        return value - (1 << 64) if value >= (1 << 63) else value
+
+    @staticmethod
+    def _from_sql(value):
+        return value + (1 << 64) if value < 0 else value
+
+    def refresh(self):
+        '''
+        Loads the rows added since the last refresh (by this or other processes)
+        '''
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT row, hash, parent, distance, submission_id, file FROM image_hashes WHERE row > ? ORDER BY row",
+                (self._last_row,)).fetchall()
+            for row, value, parent, distance, submission_id, file in rows:
+                self._last_row = row
+                if row in self._hashes:
+                    continue
+                value = ImageHashIndex._from_sql(value)
+                self._hashes[row] = value
+                self._children[row] = {}
+                self._images[row] = (submission_id, file)
+                if parent is not None and parent in self._children and distance not in self._children[parent] \
+                        and hamming_distance(self._hashes[parent], value) == distance:
+                    self._children[parent][distance] = row
+                else:
+                    # Another process attached the row to a tree that differs from ours
+                    self._attach(row)
+
+    def _attach(self, row):
+        '''
+        Adds loaded node `row` to the tree, returning its (parent, distance)
+        '''
+        if self._root is None:
+            self._root = row
+            return None, None
+        value = self._hashes[row]
+        node = self._root
+        while True:
+            distance = hamming_distance(self._hashes[node], value)
+            child = self._children[node].get(distance)
+            if child is None:
+                self._children[node][distance] = row
+                return node, distance
+            node = child
+
+    def add(self, value, submission_id, file):
+        '''
+        Records image `file` of `submission_id` with perceptual hash `value`
+        '''
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT INTO image_hashes (hash, submission_id, file) VALUES (?, ?, ?)",
+                (ImageHashIndex._to_sql(value), submission_id, file))
+            row = cursor.lastrowid
+            self._hashes[row] = value
+            self._children[row] = {}
+            self._images[row] = (submission_id, file)
+            parent, distance = self._attach(row)
+            self._connection.execute(
+                "UPDATE image_hashes SET parent = ?, distance = ? WHERE row = ?", (parent, distance, row))
+            self._connection.commit()
+
+    def search(self, value, max_distance):
+        '''
+        Returns a list of (distance, submission ID, file) within `max_distance` of `value`, closest first
+        '''
+        matches = []
+        with self._lock:
+            pending = [self._root] if self._root is not None else []
+            while pending:
+                node = pending.pop()
+                distance = hamming_distance(self._hashes[node], value)
+                if distance <= max_distance:
+                    matches.append((distance, node))
+                # By the triangle inequality, only these subtrees can hold matches
+                for edge, child in self._children[node].items():
+                    if distance - max_distance <= edge <= distance + max_distance:
+                        pending.append(child)
+            return [(distance,) + self._images[node] for distance, node in sorted(matches)]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ImageHashIndex._reset_after_fork)
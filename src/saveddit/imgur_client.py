@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from saveddit.disk_cache import DiskCache
+from saveddit.http_session import HttpSession
+
+
+class ImgurClient:
+    '''
+    Thin wrapper around the Imgur API that caches album and image metadata
+    on disk and keeps track of the remaining API credits.
+
+    Imgur reports credits with the `X-RateLimit-ClientRemaining` (per client ID, per day)
+    and `X-RateLimit-UserRemaining` (per IP, reset at `X-RateLimit-UserReset`) headers.
+    The last known values are persisted so that back-to-back runs see them too.
+    '''
+    API_URL = "https://api.imgur.com/3"
+
+    ALBUM_TTL = 7 * 24 * 60 * 60
+    IMAGE_TTL = 7 * 24 * 60 * 60
+    NOT_FOUND_TTL = 24 * 60 * 60
+    CREDITS_TTL = 60 * 60
+
+    # Stop spending credits once fewer than this many are left
+    MIN_CLIENT_CREDITS = 200
+    MIN_USER_CREDITS = 50
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, client_id, cache=None):
+        self.client_id = client_id
+        self.cache = cache if cache is not None else DiskCache.shared()
+        self._lock = threading.Lock()
+        credits = self.cache.get("imgur_credits", client_id)
+        self.credits = credits if credits is not DiskCache.MISS else {}
+
+    @classmethod
+    def for_client_id(cls, client_id):
+        '''
+        Returns one ImgurClient per client ID for the whole process
+        '''
+        with cls._clients_lock:
+            client = cls._clients.get(client_id)
+            if client is None:
+                client = cls(client_id)
+                cls._clients[client_id] = client
+            return client
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # The parent's clients hold its DiskCache connection
+        cls._clients = {}
+        cls._clients_lock = threading.Lock()
+
+    def get_album(self, album_id, timeout=20):
+        '''
+        Returns the decoded `/3/album/<album_id>` response (served from cache when possible)
+        '''
+        return self._get("album", album_id, self.ALBUM_TTL, timeout)
+
+    def get_image(self, image_id, timeout=15):
+        '''
+        Returns the decoded `/3/image/<image_id>` response (served from cache when possible)
+        '''
+        return self._get("image", image_id, self.IMAGE_TTL, timeout)
+
+    def has_album(self, album_id):
+        '''
+        True when get_album(album_id) would be served from the cache, spending no credit
+        '''
+        return self._cached("album", album_id)
+
+    def has_image(self, image_id):
+        '''
+        True when get_image(image_id) would be served from the cache, spending no credit
+        '''
+        return self._cached("image", image_id)
+
+    def credits_low(self):
+        '''
+        True when the last known client or user credits are below the configured minimum
+        '''
+        with self._lock:
+            client_remaining = self.credits.get("client_remaining")
+            user_remaining = self.credits.get("user_remaining")
+            user_reset = self.credits.get("user_reset")
+
+        if client_remaining is not None and client_remaining < self.MIN_CLIENT_CREDITS:
+            return True
+        if user_remaining is not None and user_remaining < self.MIN_USER_CREDITS:
+            if user_reset is None or user_reset > time.time():
+                return True
+        return False
+
+    def _cached(self, kind, resource_id):
+        return resource_id is not None and self.cache.get("imgur_" + kind, resource_id) is not DiskCache.MISS
+
+    def _get(self, kind, resource_id, ttl, timeout):
+        namespace = "imgur_" + kind
+        cached = self.cache.get(namespace, resource_id)
+        if cached is not DiskCache.MISS:
+            return cached
+
+        request_url = "{}/{}/{}".format(self.API_URL, kind, resource_id)
+        headers = {"Authorization": "Client-ID " + self.client_id}
+        response = HttpSession.shared().get(request_url, headers=headers, timeout=timeout)
+        self._update_credits(response.headers)
+
+        if response.status_code == 404:
+            # Deleted albums/images stay deleted - remember that for a while
+            data = {"success": False, "status": 404, "data": {"error": "Not found"}}
+            self.cache.set(namespace, resource_id, data, self.NOT_FOUND_TTL)
+            return data
+
+        response.raise_for_status()
+        data = response.json()
+        if data.get("success"):
+            self.cache.set(namespace, resource_id, data, ttl)
+        return data
+
+    def _update_credits(self, response_headers):
+        def _header_int(name):
+            try:
+                return int(response_headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        client_remaining = _header_int("X-RateLimit-ClientRemaining")
+        user_remaining = _header_int("X-RateLimit-UserRemaining")
+        user_reset = _header_int("X-RateLimit-UserReset")
+        if client_remaining is None and user_remaining is None:
+            return
+
+        with self._lock:
+            if client_remaining is not None:
+                self.credits["client_remaining"] = client_remaining
+            if user_remaining is not None:
+                self.credits["user_remaining"] = user_remaining
+            if user_reset is not None:
+                self.credits["user_reset"] = user_reset
+            credits = dict(self.credits)
+
+        ttl = self.CREDITS_TTL
+        if user_reset is not None and user_reset > time.time():
+            ttl = max(ttl, user_reset - time.time())
+        self.cache.set("imgur_credits", self.client_id, credits, ttl)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ImgurClient._reset_after_fork)
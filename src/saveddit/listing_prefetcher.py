@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from saveddit.console import Progress
+from saveddit.metrics import Metrics
+from saveddit.profiler import Profiler
+
+
+class ListingPrefetcher:
+    '''
+    Iterates a listing (e.g., `subreddit.hot(limit=None)`) from a background thread,
+    so that page N+1 is requested while the items of page N are being downloaded.
+
+    praw's ListingGenerator only requests the next page once the current one is exhausted,
+    which leaves a full API round trip between pages during which nothing is downloaded.
+    At most `pages` pages are buffered ahead of the consumer (`saveddit --prefetch-pages`),
+    more of them trading memory for fewer stalls.
+
+    Use it as a context manager, so that the producer stops when the consumer stops early:
+
+        with ListingPrefetcher(subreddit.hot(limit=None)) as submissions:
+            for submission in submissions:
+                ...
+    '''
+    PAGE_SIZE = 100 # Items per listing page requested by praw
+    DEFAULT_PAGES = 2
+
+    pages = DEFAULT_PAGES
+
+    # How often a blocked producer checks whether the consumer went away
+    PUT_TIMEOUT_SECONDS = 0.5
+
+    _DONE = object()
+
+    class _Error:
+        def __init__(self, exception):
+            self.exception = exception
+
+    @classmethod
+    def configure(cls, pages=DEFAULT_PAGES):
+        if pages < 1:
+            raise ValueError("pages must be at least 1")
+        cls.pages = pages
+
+    def __init__(self, listing, pages=None):
+        pages = pages if pages is not None else ListingPrefetcher.pages
+        self._queue = queue.Queue(maxsize=max(1, pages) * ListingPrefetcher.PAGE_SIZE)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(iter(listing),), daemon=True)
+        self._thread.start()
+        self._gauge = Progress.shared().add_gauge("listing queued", self._queue.qsize)
+
+    def __iter__(self):
+        metrics = Metrics.shared()
+        try:
+            while True:
+                started = time.perf_counter()
+                item = self._queue.get()
+                # Time downloads were stalled waiting on the listing
+                metrics.observe("saveddit_stage_seconds", time.perf_counter() - started, stage="listing")
+                if item is ListingPrefetcher._DONE:
+                    return
+                if isinstance(item, ListingPrefetcher._Error):
+                    raise item.exception
+                yield item
+        finally:
+            # Also reached when the consumer stops early, which unblocks and ends the producer
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        '''
+        Stops the producer; the items it fetched and the rest of the listing are dropped
+        '''
+        self._stop.set()
+        Progress.shared().remove_gauge(self._gauge)
+
+    def _fill(self, iterator):
+        Profiler.set_stage("listing")
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+            self._put(ListingPrefetcher._DONE)
+        except Exception as e:
+            # Re-raised in the consumer's thread, after the items fetched so far
+            self._put(ListingPrefetcher._Error(e))
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=ListingPrefetcher.PUT_TIMEOUT_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
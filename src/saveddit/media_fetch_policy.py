@@ -0,0 +1,77 @@
+from saveddit.disk_cache import DiskCache
+from saveddit.transfer_scheduler import TransferScheduler
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class MediaFetchPolicy:
+    '''
+    Rules SubmissionDownloader applies to a media response before reading its body:
+
+        update          `saveddit --update`: submissions saved by an earlier run are downloaded
+                        again. Media the earlier run saved are requested with the ETag and
+                        Last-Modified it got, and a 304 Not Modified reuses the saved file.
+        max_file_size   `saveddit --max-file-size`: files larger than this many bytes are skipped,
+                        going by Content-Length, or by the bytes read when the server doesn't send one.
+
+    When a rule triggers, the response is closed without reading its body. The validators
+    are kept in the DiskCache, by URL.
+    '''
+    CACHE_NAMESPACE = "media_validators"
+    VALIDATORS_TTL = 365 * 24 * 60 * 60
+
+    update = False
+    max_file_size = None
+
+    @classmethod
+    def configure(cls, update=False, max_file_size=None):
+        cls.update = update
+        cls.max_file_size = max_file_size
+
+    @staticmethod
+    def parse_size(value):
+        '''
+        Parses bytes such as 20000000, "500K", "20M" or "1.5G"
+        '''
+        return int(TransferScheduler.parse_rate(value))
+
+    @staticmethod
+    def conditional_headers(url):
+        '''
+        Returns the If-None-Match/If-Modified-Since headers for the copy of `url` saved before
+        '''
+        validators = DiskCache.shared().get(MediaFetchPolicy.CACHE_NAMESPACE, url)
+        if validators is DiskCache.MISS or not validators:
+            return {}
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    @staticmethod
+    def remember(url, response):
+        '''
+        Stores the validators of a response whose body was saved
+        '''
+        validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        if validators["etag"] or validators["last_modified"]:
+            DiskCache.shared().set(MediaFetchPolicy.CACHE_NAMESPACE, url, validators, MediaFetchPolicy.VALIDATORS_TTL)
+
+    @staticmethod
+    def content_length(response):
+        try:
+            return int(response.headers.get("Content-Length"))
+        except (TypeError, ValueError):
+            return None
+
+    @classmethod
+    def check_size(cls, size):
+        '''
+        Raises FileTooLarge when `size` bytes (announced or read so far) exceed max_file_size
+        '''
+        if cls.max_file_size and size is not None and size > cls.max_file_size:
+            raise FileTooLarge("%d bytes, over the limit of %d" % (size, cls.max_file_size))
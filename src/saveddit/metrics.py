@@ -0,0 +1,288 @@
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Metrics:
+    '''
+    Process-wide counters and histograms for the stages of a run, exported in the
+    Prometheus text format (as a textfile for node_exporter's textfile collector,
+    or on a small /metrics endpoint) and as a JSON summary at the end of the run.
+
+    Metric names and label sets are free-form; the ones saveddit records are
+    described in Metrics.HELP.
+    '''
+    HELP = {
+        "saveddit_http_requests_total": ("counter", "Media and Imgur HTTP requests by host and status"),
+        "saveddit_http_request_seconds": ("histogram", "Time to response headers of media and Imgur HTTP requests by host"),
+        "saveddit_http_response_bytes_total": ("counter", "Response body bytes read by host"),
+        "saveddit_reddit_requests_total": ("counter", "Reddit API requests (including prawcore's retries) by host and status"),
+        "saveddit_reddit_request_seconds": ("histogram", "Reddit API request latency by host"),
+        "saveddit_retries_total": ("counter", "Requests that were or will be retried, by reason"),
+        "saveddit_cache_lookups_total": ("counter", "On-disk cache lookups by namespace and result"),
+        "saveddit_stage_seconds": ("histogram", "Time spent per submission in each stage of SubmissionDownloader"),
+        "saveddit_submissions_total": ("counter", "Submissions processed by media handler and outcome"),
+        "saveddit_transfer_wait_seconds": ("histogram", "Time media transfers waited for a slot on their host or for bandwidth, by host and reason"),
+        "saveddit_duplicate_images_total": ("counter", "Images replaced with a hard link to a similar image saved before (--dedup-images)"),
+        "saveddit_media_not_modified_total": ("counter", "Media requests answered with 304 Not Modified, whose saved copy was kept (--update)"),
+        "saveddit_media_skipped_total": ("counter", "Media files skipped before their body was read, by reason"),
+    }
+
+    # Seconds
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+    # How often the textfile is rewritten while a run is in progress
+    TEXTFILE_INTERVAL_SECONDS = 15
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._textfile_stop = None
+
+    @classmethod
+    def shared(cls):
+        '''
+        Returns the Metrics instance of the whole process
+        '''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # Another thread of the parent (textfile writer, /metrics server, progress line) may have held
+        # a lock at the fork; the child would wait on it forever. That thread doesn't exist in the child.
+        cls._shared_lock = threading.Lock()
+        if cls._shared is not None:
+            cls._shared._lock = threading.Lock()
+            cls._shared._textfile_stop = None
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._histograms[key] = histogram
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def total(self, name):
+        '''
+        Returns the sum of the counter `name` over all its label sets
+        '''
+        with self._lock:
+            return sum(value for (counter, _), value in self._counters.items() if counter == name)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        '''
+        Observes the wall time of the `with` block into the histogram `name`
+        '''
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self, reset=False):
+        '''
+        Returns a picklable copy of all metrics (see merge). With reset, starts over from zero.
+        '''
+        with self._lock:
+            snapshot = {
+                "counters": [(name, labels, value) for (name, labels), value in self._counters.items()],
+                "histograms": [(name, labels, list(h[0]), h[1], h[2]) for (name, labels), h in self._histograms.items()],
+            }
+            if reset:
+                self._counters = {}
+                self._histograms = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        '''
+        Adds a snapshot taken in another process (e.g., a ParallelDownloader worker)
+        '''
+        with self._lock:
+            for name, labels, value in snapshot["counters"]:
+                key = (name, tuple(labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, bucket_counts, total, count in snapshot["histograms"]:
+                key = (name, tuple(labels))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                    self._histograms[key] = histogram
+                for i, bucket_count in enumerate(bucket_counts):
+                    histogram[0][i] += bucket_count
+                histogram[1] += total
+                histogram[2] += count
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            help_text = Metrics.HELP.get(name, (kind, name))[1]
+            lines.append("# HELP " + name + " " + help_text)
+            lines.append("# TYPE " + name + " " + kind)
+
+        for name, labels, value in sorted(snapshot["counters"]):
+            describe(name, "counter")
+            lines.append(name + Metrics._format_labels(labels) + " " + Metrics._format_value(value))
+
+        for name, labels, bucket_counts, total, count in sorted(snapshot["histograms"]):
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else Metrics._format_value(bound)
+                lines.append(name + "_bucket" + Metrics._format_labels(labels + (("le", le),)) + " " + str(cumulative))
+            lines.append(name + "_sum" + Metrics._format_labels(labels) + " " + Metrics._format_value(total))
+            lines.append(name + "_count" + Metrics._format_labels(labels) + " " + str(count))
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        '''
+        Returns a JSON-serializable summary: counter values and, for histograms,
+        count, sum, mean and approximate quantiles (upper bucket bounds)
+        '''
+        snapshot = self.snapshot()
+        summary = {"counters": {}, "histograms": {}}
+        for name, labels, value in sorted(snapshot["counters"]):
+            summary["counters"].setdefault(name, []).append({"labels": dict(labels), "value": value})
+        for name, labels, bucket_counts, total, count in sorted(snapshot["histograms"]):
+            summary["histograms"].setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": count,
+                "sum": round(total, 6),
+                "mean": round(total / count, 6) if count else None,
+                "p50": self._quantile(bucket_counts, count, 0.5),
+                "p95": self._quantile(bucket_counts, count, 0.95),
+                "p99": self._quantile(bucket_counts, count, 0.99),
+            })
+        return summary
+
+    def write_textfile(self, path):
+        '''
+        Atomically (re)writes the Prometheus textfile at path
+        '''
+        Metrics._write_atomically(path, self.prometheus_text())
+
+    def write_summary(self, path):
+        Metrics._write_atomically(path, json.dumps(self.summary(), indent=2))
+
+    def start_textfile_writer(self, path, interval=TEXTFILE_INTERVAL_SECONDS):
+        '''
+        Rewrites the textfile every `interval` seconds until stop_textfile_writer() is called
+        '''
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.write_textfile(path)
+
+        threading.Thread(target=run, daemon=True).start()
+        self._textfile_stop = stop
+
+    def stop_textfile_writer(self):
+        if self._textfile_stop is not None:
+            self._textfile_stop.set()
+            self._textfile_stop = None
+
+    def serve(self, port, host=""):
+        '''
+        Serves GET /metrics on port from a background thread. Returns the server.
+        '''
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def _quantile(self, bucket_counts, count, q):
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return None # Above the largest bucket
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        escaped = []
+        for key, value in labels:
+            value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            escaped.append(key + '="' + value + '"')
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+
+    @staticmethod
+    def _write_atomically(path, content):
+        path = os.path.abspath(os.path.expanduser(path))
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Metrics._reset_after_fork)
@@ -1,14 +1,18 @@
-import coloredlogs
 from colorama import Fore, Style
 from datetime import datetime, timezone
 import logging
-import verboselogs
 import getpass
 import json
 import os
-import praw
 from pprint import pprint
 import re
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.profiler import Profiler
+from saveddit.reddit_client import RedditClientFactory, RedditClientPool
 from saveddit.submission_downloader import SubmissionDownloader
 from saveddit.subreddit_downloader import SubredditDownloader
 from saveddit.multireddit_downloader_config import MultiredditDownloaderConfig
@@ -21,30 +25,15 @@ class MultiredditDownloader:
     REDDIT_CLIENT_SECRET = config['reddit_client_secret']
     IMGUR_CLIENT_ID = config['imgur_client_id']
 
-    def __init__(self, multireddit_names):
-        self.logger = verboselogs.VerboseLogger(__name__)
-        level_styles = {
-            'critical': {'bold': True, 'color': 'red'},
-            'debug': {'color': 'green'},
-            'error': {'color': 'red'},
-            'info': {'color': 'white'},
-            'notice': {'color': 'magenta'},
-            'spam': {'color': 'white', 'faint': True},
-            'success': {'bold': True, 'color': 'green'},
-            'verbose': {'color': 'blue'},
-            'warning': {'color': 'yellow'}
-        }
-        coloredlogs.install(level='SPAM', logger=self.logger,
-                            fmt='%(message)s', level_styles=level_styles)
+    def __init__(self, multireddit_names, reddit=None):
+        self.logger = Console.create_logger(__name__)
 
-        self.reddit = praw.Reddit(
-            client_id=MultiredditDownloader.REDDIT_CLIENT_ID,
-            client_secret=MultiredditDownloader.REDDIT_CLIENT_SECRET,
-            user_agent="saveddit (by /u/p_ranav)"
-        )
+        if reddit is None:
+            self.reddit_pool = RedditClientFactory.pool(SubredditDownloader.REDDIT_CREDENTIALS)
+        else:
+            self.reddit_pool = RedditClientPool([reddit])
 
         self.multireddit_name = "+".join(multireddit_names)
-        self.multireddit = self.reddit.subreddit(self.multireddit_name)
 
     def download(self, output_path, categories=MultiredditDownloaderConfig.DEFAULT_CATEGORIES, post_limit=MultiredditDownloaderConfig.DEFAULT_POST_LIMIT, skip_videos=False, skip_meta=False, skip_comments=False, comment_limit=0):
         '''
@@ -62,16 +51,22 @@ class MultiredditDownloader:
         root_dir = os.path.join(os.path.join(os.path.join(
             output_path, "www.reddit.com"), "m"), multireddit_dir_name)
         categories = categories
+        ArchiveLayout.for_output(output_path)
+        submission_config = {'imgur_client_id': MultiredditDownloader.IMGUR_CLIENT_ID,
+                             'archive_index': ArchiveIndex.for_output(output_path),
+                             'reddit_pool': self.reddit_pool}
 
         for c in categories:
             self.logger.notice("Downloading from /m/" +
                                self.multireddit_name + "/" + c + "/")
             category_dir = os.path.join(root_dir, c)
-            if not os.path.exists(category_dir):
-                os.makedirs(category_dir)
-            category_function = getattr(self.multireddit, c)
+            FileWriter.ensure_dir(category_dir)
+            listing = self.reddit_pool.listing(
+                lambda reddit: getattr(reddit.subreddit(self.multireddit_name), c), post_limit)
 
-            for i, submission in enumerate(category_function(limit=post_limit)):
-                SubmissionDownloader(submission, i, self.logger, category_dir,
-                    skip_videos, skip_meta, skip_comments, comment_limit,
-                    {'imgur_client_id': MultiredditDownloader.IMGUR_CLIENT_ID})
+            with ListingPrefetcher(listing) as submissions:
+                for i, submission in enumerate(submissions):
+                    SubmissionDownloader(submission, i, self.logger, category_dir,
+                        skip_videos, skip_meta, skip_comments, comment_limit,
+                        submission_config)
+            Profiler.checkpoint("/m/" + self.multireddit_name + "/" + c)
@@ -0,0 +1,95 @@
+import copy
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from saveddit.console import Console
+from saveddit.image_deduplicator import ImageDeduplicator
+from saveddit.metrics import Metrics
+from saveddit.rate_limiter import RateLimiter
+
+# Set in every worker process by _init_worker
+_log_queue = None
+
+
+def _init_worker(log_queue, rate_limiter):
+    global _log_queue
+    _log_queue = log_queue
+    RateLimiter.install(rate_limiter)
+    # The workers are the parallelism, a hashing pool in each would start jobs x HASH_WORKERS processes
+    ImageDeduplicator.workers = 1
+    # Forked workers start with the parent's counts, which the parent already has
+    Metrics.shared().snapshot(reset=True)
+
+
+def _route_logs(logger):
+    # Send everything to the parent process, which prints it in one stream
+    logger.handlers = [logging.handlers.QueueHandler(_log_queue)]
+    logger.propagate = False
+
+
+def _download_subreddit(subreddit, args):
+    from saveddit.subreddit_downloader import SubredditDownloader
+    downloader = SubredditDownloader(subreddit)
+    _route_logs(downloader.logger)
+    downloader.download(args.o,
+                        download_all_comments=args.all_comments, categories=args.f, post_limit=args.l, skip_videos=args.skip_videos, skip_meta=args.skip_meta, skip_comments=args.skip_comments)
+    return Metrics.shared().snapshot(reset=True)
+
+
+def _download_user(username, args):
+    from saveddit.user_downloader import UserDownloader
+    downloader = UserDownloader()
+    _route_logs(downloader.logger)
+    user_args = copy.copy(args)
+    user_args.users = [username]
+    downloader.download(user_args)
+    return Metrics.shared().snapshot(reset=True)
+
+
+class ParallelDownloader:
+    '''
+    Spreads the targets of one CLI invocation (subreddits or users) over a pool of worker processes.
+
+    All workers share one RateLimiter for Reddit API requests (with a bucket per
+    Reddit app, see RedditClientPool), record into the same ArchiveIndex (it lives in the output path), and send their log
+    records to this process so that the console shows a single stream.
+    Their metrics are merged into this process's Metrics as targets finish.
+    '''
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+        # Workers inherit the parent's state (configuration, password read from stdin, ...). Locks held
+        # by the parent's other threads at the fork, and its SQLite connections and clients, are reset
+        # in the child by the register_at_fork hooks of Metrics, Console, Profiler, RedditClientFactory,
+        # ArchiveIndex, DiskCache, ImgurClient, HttpSession, FileWriter, ImageHashIndex and ImageDeduplicator
+        if "fork" in multiprocessing.get_all_start_methods():
+            self.context = multiprocessing.get_context("fork")
+        else:
+            self.context = multiprocessing.get_context()
+
+        self.logger = Console.create_logger(__name__)
+
+    def download_subreddits(self, args):
+        self._run(_download_subreddit, sorted(args.subreddits), args, "/r/")
+
+    def download_users(self, args):
+        self._run(_download_user, list(args.users), args, "/u/")
+
+    def _run(self, function, targets, args, prefix):
+        log_queue = self.context.Queue()
+        listener = logging.handlers.QueueListener(log_queue, *self.logger.handlers, respect_handler_level=True)
+        rate_limiter = RateLimiter(context=self.context)
+        listener.start()
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.jobs, len(targets)), mp_context=self.context,
+                                     initializer=_init_worker, initargs=(log_queue, rate_limiter)) as executor:
+                futures = {executor.submit(function, target, args): target for target in targets}
+                for done, future in enumerate(as_completed(futures), start=1):
+                    target = futures[future]
+                    try:
+                        Metrics.shared().merge(future.result())
+                        self.logger.success("[" + str(done) + "/" + str(len(targets)) + "] Finished " + prefix + target)
+                    except Exception as e:
+                        self.logger.error("[" + str(done) + "/" + str(len(targets)) + "] Failed " + prefix + target + " - " + str(e))
+        finally:
+            listener.stop()
@@ -0,0 +1,275 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class _ProfileSnapshot:
+    # Lets pstats read a cProfile.Profile that is still enabled in another thread
+    def __init__(self, profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    '''
+    Profiles a whole run (`saveddit --profile <dir>`) and writes its reports to a directory.
+
+    In "sampling" mode a background thread samples the stacks of all threads every
+    SAMPLE_INTERVAL_SECONDS (wall clock, so time spent waiting on the network shows up)
+    and writes profile.txt, with the samples grouped by the SubmissionDownloader stage or
+    media handler each thread was in, and stacks.collapsed for flamegraph.pl/speedscope.
+    In "cprofile" mode every thread runs under cProfile; profile.txt then lists the time
+    spent in each handler method and profile.pstats holds the full statistics. Before
+    Python 3.12 each thread gets its own cProfile.Profile; from 3.12 on, cProfile runs on
+    sys.monitoring, which allows one profiler per process, and that one sees all threads.
+
+    With memory=True, tracemalloc snapshots are compared at every checkpoint (the end of
+    each category of posts) and written to memory.txt.
+
+    Only this process is profiled, not the workers started with -j.
+    '''
+    MODES = ("sampling", "cprofile")
+    SAMPLE_INTERVAL_SECONDS = 0.005
+    MEMORY_FRAMES = 1
+    TOP_FUNCTIONS = 15
+
+    # A second enabled cProfile.Profile raises "Another profiling tool is already active" on 3.12+
+    PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+    # Handler methods reported in cprofile mode, and the stages they implement
+    STAGE_FUNCTIONS = {
+        "classify_link": "classify",
+        "download_direct_link": "direct_image/direct_video",
+        "download_reddit_gallery": "reddit_gallery",
+        "download_reddit_video": "reddit_video",
+        "download_gfycat_or_redgif": "gfycat/redgifs",
+        "download_imgur_album": "imgur_album",
+        "download_imgur_image": "imgur_image",
+        "download_youtube_video": "youtube/youtube_dl",
+        "download_items_concurrently": "gallery/album items",
+        "dedupe": "dedup",
+        "download_submission_meta": "meta",
+        "download_comments": "comments",
+    }
+
+    active = None
+
+    # Thread ident -> (thread, stage); only maintained while a profiler is active
+    _stages = {}
+
+    def __init__(self, output_dir, mode="sampling", memory=False):
+        if mode not in Profiler.MODES:
+            raise ValueError("mode must be one of " + ", ".join(Profiler.MODES))
+        self.output_dir = os.path.abspath(os.path.expanduser(output_dir))
+        self.mode = mode
+        self.memory = memory
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._samples = {}
+        self._sample_count = 0
+        self._profiles = []
+        self._checkpoints = []
+        self._last_snapshot = None
+        self._started = None
+
+    @staticmethod
+    def set_stage(stage):
+        '''
+        Attributes the calling thread's samples to stage (None for none) and returns its previous stage
+        '''
+        if Profiler.active is None:
+            return None
+        ident = threading.get_ident()
+        previous = Profiler._stages.get(ident)
+        if stage is None:
+            Profiler._stages.pop(ident, None)
+        else:
+            Profiler._stages[ident] = (threading.current_thread(), stage)
+        return previous[1] if previous else None
+
+    @staticmethod
+    def current_stage():
+        entry = Profiler._stages.get(threading.get_ident())
+        return entry[1] if entry else None
+
+    @staticmethod
+    @contextmanager
+    def stage(stage):
+        previous = Profiler.set_stage(stage)
+        try:
+            yield
+        finally:
+            Profiler.set_stage(previous)
+
+    @staticmethod
+    def checkpoint(label):
+        '''
+        Takes a memory snapshot labeled `label`, when the active profiler tracks memory
+        '''
+        profiler = Profiler.active
+        if profiler is not None and profiler.memory:
+            profiler._take_snapshot(label)
+
+    @staticmethod
+    def _reset_after_fork():
+        # The sampler thread doesn't exist in a forked child, nor do the threads that may have held the lock
+        if Profiler.active is not None:
+            Profiler.active._lock = threading.Lock()
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        Profiler._stages = {}
+        Profiler.active = self
+        self._started = time.monotonic()
+        if self.memory:
+            tracemalloc.start(Profiler.MEMORY_FRAMES)
+            self._last_snapshot = tracemalloc.take_snapshot()
+        if self.mode == "sampling":
+            self._sampler = threading.Thread(target=self._sample_loop, name="saveddit-profiler", daemon=True)
+            self._sampler.start()
+        else:
+            if Profiler.PROFILE_PER_THREAD:
+                threading.setprofile(self._profile_new_thread)
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+            profile.enable()
+
+    def stop(self):
+        '''
+        Stops profiling and writes the reports. Returns the paths written.
+        '''
+        elapsed = time.monotonic() - self._started
+        if self.mode == "sampling":
+            self._stop.set()
+            self._sampler.join()
+        else:
+            if Profiler.PROFILE_PER_THREAD:
+                threading.setprofile(None)
+            self._profiles[0].disable()
+        if self.memory:
+            self._take_snapshot("end of run")
+            tracemalloc.stop()
+        Profiler.active = None
+        Profiler._stages = {}
+
+        paths = []
+        if self.mode == "sampling":
+            paths.append(self._write("profile.txt", self._sampling_report(elapsed)))
+            paths.append(self._write("stacks.collapsed", "".join(
+                stack + " " + str(count) + "\n" for stack, count in sorted(self._samples.items()))))
+        else:
+            with self._lock:
+                stats = pstats.Stats(*[_ProfileSnapshot(profile) for profile in self._profiles])
+            stats.dump_stats(os.path.join(self.output_dir, "profile.pstats"))
+            paths.append(self._write("profile.txt", self._cprofile_report(stats, elapsed)))
+            paths.append(os.path.join(self.output_dir, "profile.pstats"))
+        if self.memory:
+            paths.append(self._write("memory.txt", "\n".join(self._checkpoints)))
+        return paths
+
+    def _profile_new_thread(self, frame, event, arg):
+        # Installed with threading.setprofile: runs once in every new thread, then hands over to cProfile
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(Profiler.SAMPLE_INTERVAL_SECONDS):
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                entry = Profiler._stages.get(ident)
+                stage = entry[1] if entry and entry[0] is threads.get(ident) else "other"
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(code.co_name + " (" + os.path.basename(code.co_filename) + ":" + str(code.co_firstlineno) + ")")
+                    frame = frame.f_back
+                frames.append(stage)
+                stack = ";".join(reversed(frames))
+                self._samples[stack] = self._samples.get(stack, 0) + 1
+            self._sample_count += 1
+
+    def _sampling_report(self, elapsed):
+        stages = {}
+        leaves = {}
+        for stack, count in self._samples.items():
+            frames = stack.split(";")
+            stages[frames[0]] = stages.get(frames[0], 0) + count
+            leaf_counts = leaves.setdefault(frames[0], {})
+            leaf_counts[frames[-1]] = leaf_counts.get(frames[-1], 0) + count
+        total = sum(stages.values()) or 1
+
+        lines = [
+            "Sampling profile: {} samples every {:.0f} ms over {:.1f} s".format(
+                self._sample_count, Profiler.SAMPLE_INTERVAL_SECONDS * 1000, elapsed),
+            "Thread time by stage (\"other\": threads outside of any stage, e.g., idle ones):",
+            "",
+            "{:<28} {:>9} {:>7} {:>10}".format("stage", "samples", "share", "thread-s"),
+        ]
+        for stage, count in sorted(stages.items(), key=lambda item: -item[1]):
+            lines.append("{:<28} {:>9} {:>6.1f}% {:>10.2f}".format(
+                stage, count, 100.0 * count / total, count * Profiler.SAMPLE_INTERVAL_SECONDS))
+        for stage, count in sorted(stages.items(), key=lambda item: -item[1]):
+            lines += ["", "Top functions in " + stage + " (innermost frame):"]
+            for function, function_count in sorted(leaves[stage].items(), key=lambda item: -item[1])[:Profiler.TOP_FUNCTIONS]:
+                lines.append("  {:>7} {:>6.1f}%  {}".format(function_count, 100.0 * function_count / count, function))
+        return "\n".join(lines) + "\n"
+
+    def _cprofile_report(self, stats, elapsed):
+        threads = "{} thread(s)".format(len(self._profiles)) if Profiler.PROFILE_PER_THREAD else "all threads"
+        lines = [
+            "cProfile of {} over {:.1f} s".format(threads, elapsed),
+            "Cumulative time per handler method (nested calls are included in both, e.g., gfycat -> direct link):",
+            "",
+            "{:<28} {:<28} {:>8} {:>10}".format("stage", "method", "calls", "cum. s"),
+        ]
+        for (filename, _, function), (_, calls, _, cumulative, _) in sorted(stats.stats.items(), key=lambda item: -item[1][3]):
+            if function in Profiler.STAGE_FUNCTIONS and filename.endswith("submission_downloader.py"):
+                lines.append("{:<28} {:<28} {:>8} {:>10.3f}".format(Profiler.STAGE_FUNCTIONS[function], function, calls, cumulative))
+
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.sort_stats("cumulative").print_stats(40)
+        lines += ["", stream.getvalue()]
+        return "\n".join(lines)
+
+    def _take_snapshot(self, label):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        lines = ["== {} (+{:.1f} s): {:.1f} MiB traced, peak {:.1f} MiB".format(
+            label, time.monotonic() - self._started, current / 2 ** 20, peak / 2 ** 20)]
+        if self._last_snapshot is not None:
+            lines.append("Largest changes since the previous checkpoint:")
+            for difference in snapshot.compare_to(self._last_snapshot, "lineno")[:Profiler.TOP_FUNCTIONS]:
+                lines.append("  " + str(difference))
+        lines.append("")
+        self._checkpoints.append("\n".join(lines))
+        self._last_snapshot = snapshot
+
+    def _write(self, name, content):
+        path = os.path.join(self.output_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=Profiler._reset_after_fork)
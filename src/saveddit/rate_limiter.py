@@ -0,0 +1,70 @@
+import hashlib
+import multiprocessing
+import time
+
+
+class RateLimiter:
+    '''
+    Token buckets, one per key (the client ID of a Reddit app), that can be shared by several worker processes.
+
+    The bucket state lives in shared memory, so a RateLimiter has to reach the
+    workers through process inheritance (e.g., a pool initializer argument).
+    Keys get one of MAX_KEYS buckets on first use, in whichever process that is;
+    keys beyond that share the last bucket.
+    '''
+    # Reddit allows ~600 requests per 10 minutes for an OAuth client
+    DEFAULT_REQUESTS_PER_SECOND = 1.0
+    DEFAULT_BURST = 10
+    MAX_KEYS = 32
+
+    shared = None
+
+    def __init__(self, rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST, context=multiprocessing, max_keys=MAX_KEYS):
+        self.rate = rate
+        self.capacity = burst
+        self._lock = context.Lock()
+        # Stable hash of the key each bucket belongs to, 0 for a free bucket
+        self._keys = context.Array('q', max_keys, lock=False)
+        self._tokens = context.Array('d', [float(burst)] * max_keys, lock=False)
+        self._updated = context.Array('d', [time.monotonic()] * max_keys, lock=False)
+
+    @classmethod
+    def install(cls, rate_limiter):
+        '''
+        Makes rate_limiter the limiter used by every Reddit client created in this process
+        '''
+        cls.shared = rate_limiter
+
+    @staticmethod
+    def key_hash(key):
+        # hash() of a str differs between processes that weren't forked
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little", signed=True) or 1
+
+    def _bucket(self, key):
+        # Called with the lock held
+        key_hash = RateLimiter.key_hash(key)
+        for i, bucket_key in enumerate(self._keys):
+            if bucket_key == key_hash:
+                return i
+            if bucket_key == 0:
+                self._keys[i] = key_hash
+                return i
+        return len(self._keys) - 1
+
+    def acquire(self, tokens=1, key=None):
+        '''
+        Blocks until `tokens` tokens are available in the bucket of `key` and takes them
+        '''
+        while True:
+            with self._lock:
+                i = self._bucket(key)
+                now = time.monotonic()
+                elapsed = max(0.0, now - self._updated[i])
+                self._tokens[i] = min(self.capacity, self._tokens[i] + elapsed * self.rate)
+                self._updated[i] = now
+                if self._tokens[i] >= tokens:
+                    self._tokens[i] -= tokens
+                    return
+                wait = (tokens - self._tokens[i]) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,377 @@
+import hashlib
+import json
+import os
+import praw
+import prawcore
+import tempfile
+import threading
+import time
+import urllib.parse
+from prawcore.exceptions import TooManyRequests
+from prawcore.sessions import Session
+from saveddit.api_recording import ApiRecorder, ApiReplayer
+from saveddit.console import Console
+from saveddit.metrics import Metrics
+from saveddit.rate_limiter import RateLimiter
+
+USER_AGENT = "saveddit (by /u/p_ranav)"
+
+try:
+    PRAWCORE_MAJOR_VERSION = int(prawcore.__version__.split(".")[0])
+except ValueError:
+    PRAWCORE_MAJOR_VERSION = 0
+
+
+class SavedditRequestor(prawcore.Requestor):
+    '''
+    prawcore Requestor that waits on the bucket of its client ID in a (possibly cross-process)
+    RateLimiter before every request, so every app in a RedditClientPool keeps its own quota,
+    and records request metrics. With an ApiRecorder, requests and responses are saved to a
+    fixture file; with an ApiReplayer, they are answered from one instead of the network.
+    '''
+    # Statuses prawcore retries on its own; a 429 raises TooManyRequests instead (see RedditClientPool)
+    RETRIED_STATUSES = frozenset(getattr(Session, "RETRY_STATUSES", {500, 502, 503, 504}))
+
+    def __init__(self, *args, rate_limiter=None, client_id=None, recorder=None, replayer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+        self.client_id = client_id
+        self.recorder = recorder
+        self.replayer = replayer
+
+    def request(self, *args, **kwargs):
+        if self.rate_limiter is not None and self.replayer is None:
+            self.rate_limiter.acquire(key=self.client_id)
+        url = args[1] if len(args) > 1 else kwargs.get("url", "")
+        host = urllib.parse.urlparse(url).hostname or "unknown"
+        metrics = Metrics.shared()
+        started = time.perf_counter()
+        try:
+            if self.replayer is not None:
+                response = self.replayer.request(args, kwargs)
+            else:
+                response = super().request(*args, **kwargs)
+        except Exception:
+            metrics.inc("saveddit_reddit_requests_total", host=host, status="error")
+            raise
+        elapsed = time.perf_counter() - started
+        if self.recorder is not None:
+            self.recorder.record(args, kwargs, response, elapsed)
+        metrics.observe("saveddit_reddit_request_seconds", elapsed, host=host)
+        metrics.inc("saveddit_reddit_requests_total", host=host, status=str(response.status_code))
+        if response.status_code in SavedditRequestor.RETRIED_STATUSES:
+            metrics.inc("saveddit_retries_total", reason="reddit_" + str(response.status_code))
+        return response
+
+
+class TokenCache:
+    '''
+    Keeps OAuth access tokens in ~/.saveddit/tokens.json until they expire,
+    so that short back-to-back runs skip the token exchange.
+
+    Entries are keyed by a hash of the client ID, the username and the kind of
+    authorizer; secrets and passwords are never written to the file.
+    '''
+    DEFAULT_PATH = os.path.expanduser("~/.saveddit/tokens.json")
+
+    # Tokens that expire sooner than this are not worth reusing
+    MIN_REMAINING_SECONDS = 60
+
+    # prawcore < 3 keeps a token's expiry as epoch seconds, prawcore >= 3 as time.monotonic_ns()
+    # nanoseconds, which mean nothing to another process; the file always holds epoch seconds
+    WALL_CLOCK_FIELD = "_expiration_timestamp"
+    MONOTONIC_FIELD = "_expiration_timestamp_ns"
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(client_id, username, kind):
+        return hashlib.sha256((client_id + ":" + (username or "") + ":" + kind).encode("utf-8")).hexdigest()
+
+    def load(self, key):
+        token = self._read().get(key)
+        if token and token.get("expires_at", 0) > time.time() + TokenCache.MIN_REMAINING_SECONDS:
+            return token
+        return None
+
+    def save(self, key, token):
+        with self._lock:
+            tokens = self._read()
+            now = time.time()
+            tokens = {k: v for k, v in tokens.items() if v.get("expires_at", 0) > now}
+            tokens[key] = token
+            directory = os.path.dirname(self.path)
+            if not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tokens.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(tokens, f)
+                os.chmod(temp_path, 0o600)
+                os.replace(temp_path, self.path)
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+    def attach(self, authorizer, key):
+        '''
+        Seeds a prawcore authorizer with a cached token and saves every token it fetches from now on
+        '''
+        token = self.load(key)
+        if token:
+            authorizer.access_token = token["access_token"]
+            TokenCache.set_expires_at(authorizer, token["expires_at"])
+            authorizer.scopes = set(token["scopes"])
+
+        original_refresh = authorizer.refresh
+
+        def refresh():
+            original_refresh()
+            try:
+                self.save(key, {
+                    "access_token": authorizer.access_token,
+                    "expires_at": TokenCache.expires_at(authorizer),
+                    "scopes": sorted(authorizer.scopes or []),
+                })
+            except OSError:
+                pass # Caching is best effort
+
+        authorizer.refresh = refresh
+
+    @staticmethod
+    def expiry_field(authorizer):
+        '''
+        Returns the attribute `authorizer` keeps its token's expiry in, or None for unknown prawcore internals
+        '''
+        if hasattr(authorizer, TokenCache.WALL_CLOCK_FIELD):
+            return TokenCache.WALL_CLOCK_FIELD
+        # prawcore >= 3 only sets it once a token was fetched
+        if hasattr(authorizer, TokenCache.MONOTONIC_FIELD) or PRAWCORE_MAJOR_VERSION >= 3:
+            return TokenCache.MONOTONIC_FIELD
+        return None
+
+    @staticmethod
+    def expires_at(authorizer):
+        '''
+        Returns when the token of `authorizer` expires, in epoch seconds
+        '''
+        if TokenCache.expiry_field(authorizer) == TokenCache.MONOTONIC_FIELD:
+            return time.time() + (authorizer._expiration_timestamp_ns - time.monotonic_ns()) / 1e9
+        return authorizer._expiration_timestamp
+
+    @staticmethod
+    def set_expires_at(authorizer, expires_at):
+        if TokenCache.expiry_field(authorizer) == TokenCache.MONOTONIC_FIELD:
+            authorizer._expiration_timestamp_ns = time.monotonic_ns() + int((expires_at - time.time()) * 1e9)
+        else:
+            authorizer._expiration_timestamp = expires_at
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+class RedditClientFactory:
+    '''
+    Hands out one praw.Reddit instance per credential set for the whole process,
+    with OAuth tokens reused across runs through TokenCache.
+    '''
+    token_cache = TokenCache()
+
+    _clients = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, client_id, client_secret, username=None, password=None):
+        key = (client_id, username)
+        with cls._lock:
+            reddit = cls._clients.get(key)
+            if reddit is None:
+                reddit = create_reddit(client_id, client_secret, username, password)
+                if ApiReplayer.shared is None: # Replayed tokens must not end up in the cache
+                    cls._attach_token_cache(reddit, client_id, username)
+                cls._clients[key] = reddit
+            return reddit
+
+    @classmethod
+    def _reset_after_fork(cls):
+        # Sockets and locks of the parent's clients must not be shared with forked workers
+        cls._clients = {}
+        cls._lock = threading.Lock()
+
+    @classmethod
+    def _attach_token_cache(cls, reddit, client_id, username):
+        # praw keeps a read-only session and, with a username, a script-authorized one
+        sessions = {"read_only": getattr(reddit, "_read_only_core", None)}
+        if username:
+            sessions["script"] = getattr(reddit, "_authorized_core", None)
+        for kind, session in sessions.items():
+            authorizer = getattr(session, "_authorizer", None)
+            if authorizer is None or TokenCache.expiry_field(authorizer) is None:
+                # Unknown praw/prawcore internals, run without the cache
+                Console.create_logger(__name__).warning(
+                    "OAuth tokens won't be cached, unsupported prawcore version " + prawcore.__version__)
+                return
+            cls.token_cache.attach(authorizer, TokenCache.key(client_id, username, kind))
+
+    @classmethod
+    def pool(cls, credentials):
+        '''
+        Returns a RedditClientPool over the (client_id, client_secret) pairs in credentials
+        '''
+        return RedditClientPool([cls.get(client_id, client_secret) for client_id, client_secret in credentials])
+
+
+class RedditClientPool:
+    '''
+    Spreads read-only API traffic over several Reddit apps, each with its own quota.
+
+    Every request goes to the client with the most remaining budget, as last reported
+    by Reddit's X-Ratelimit-* headers (`reddit.auth.limits`). A client that gets a
+    429 is benched until its quota resets and the request is retried on another one.
+    '''
+    # Budget assumed for a client that has not made a request yet (Reddit allows 600 per 10 minutes)
+    UNKNOWN_REMAINING = 600
+
+    # How long a throttled client is benched when Reddit does not say when its quota resets
+    THROTTLE_SECONDS = 60
+
+    def __init__(self, clients):
+        if not clients:
+            raise ValueError("RedditClientPool needs at least one client")
+        self.clients = list(clients)
+        self._throttled_until = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.clients)
+
+    def best(self):
+        '''
+        Returns the client with the most remaining budget, waiting if every client is benched
+        '''
+        while True:
+            now = time.time()
+            with self._lock:
+                available = [reddit for reddit in self.clients
+                             if self._throttled_until.get(id(reddit), 0) <= now]
+                if available:
+                    return max(available, key=lambda reddit: self._remaining(reddit, now))
+                wake_up = min(self._throttled_until.values())
+            time.sleep(max(wake_up - now, 0))
+
+    def mark_throttled(self, reddit):
+        reset = self._limits(reddit).get("reset_timestamp")
+        now = time.time()
+        until = reset if reset and reset > now else now + RedditClientPool.THROTTLE_SECONDS
+        with self._lock:
+            self._throttled_until[id(reddit)] = until
+
+    def call(self, function):
+        '''
+        Returns function(reddit) for the best client, failing over to the next best one on a 429
+        '''
+        for attempt in range(len(self.clients)):
+            reddit = self.best()
+            try:
+                return function(reddit)
+            except TooManyRequests:
+                if attempt == len(self.clients) - 1:
+                    raise
+                self.mark_throttled(reddit)
+                Metrics.shared().inc("saveddit_retries_total", reason="reddit_failover")
+
+    def listing(self, make_listing, limit=None, params=None):
+        '''
+        Iterates a listing, e.g., `lambda reddit: reddit.subreddit("pics").hot`,
+        resuming after the last seen item on another client when one gets throttled
+        '''
+        params = dict(params or {})
+        fetched = 0
+        while limit is None or fetched < limit:
+            reddit = self.best()
+            remaining = None if limit is None else limit - fetched
+            try:
+                for item in make_listing(reddit)(limit=remaining, params=dict(params)):
+                    params["after"] = item.fullname
+                    fetched += 1
+                    yield item
+                return
+            except TooManyRequests:
+                if len(self.clients) == 1:
+                    raise
+                self.mark_throttled(reddit)
+                Metrics.shared().inc("saveddit_retries_total", reason="reddit_failover")
+
+    def _remaining(self, reddit, now):
+        limits = self._limits(reddit)
+        remaining = limits.get("remaining")
+        reset = limits.get("reset_timestamp")
+        if remaining is None or (reset is not None and reset <= now):
+            return RedditClientPool.UNKNOWN_REMAINING
+        return remaining
+
+    @staticmethod
+    def _limits(reddit):
+        try:
+            return reddit.auth.limits or {}
+        except AttributeError:
+            return {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=RedditClientFactory._reset_after_fork)
+
+
+def create_reddit(client_id, client_secret, username=None, password=None):
+    '''
+    Creates a new praw.Reddit instance, throttled by its client ID's bucket of RateLimiter.shared when one is installed
+    and instrumented with Metrics. Its requests are recorded by ApiRecorder.shared or
+    answered by ApiReplayer.shared when one is installed.
+    Prefer RedditClientFactory.get, which reuses instances and tokens.
+    '''
+    kwargs = {
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "user_agent": USER_AGENT,
+    }
+    if username:
+        kwargs["username"] = username
+        kwargs["password"] = password
+    kwargs["requestor_class"] = SavedditRequestor
+    kwargs["requestor_kwargs"] = {
+        "rate_limiter": RateLimiter.shared,
+        "client_id": client_id,
+        "recorder": ApiRecorder.shared,
+        "replayer": ApiReplayer.shared,
+    }
+    reddit = praw.Reddit(**kwargs)
+    serialize_requests(reddit)
+    return reddit
+
+
+def serialize_requests(reddit):
+    '''
+    Lets one thread at a time send requests through `reddit`.
+
+    praw isn't thread-safe (token refreshes, prawcore's rate limit state, the HTTP session),
+    yet one instance and the lazy models it returns are used by several threads: listing
+    prefetchers, `saveddit run` jobs, parallel searches and backfill windows. Reddit allows
+    an app about one request per second anyway, so this costs little; RedditClientPool
+    spreads the load over apps, whose requests still run in parallel.
+    '''
+    lock = threading.RLock()
+    sessions = {id(session): session for session in (getattr(reddit, "_read_only_core", None),
+                                                      getattr(reddit, "_authorized_core", None))
+                if session is not None}
+    for session in sessions.values():
+        def request(*args, _request=session.request, **kwargs):
+            with lock:
+                return _request(*args, **kwargs)
+        session.request = request
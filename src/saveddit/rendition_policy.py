@@ -0,0 +1,74 @@
+import html
+import os
+import urllib.parse
+
+
+class RenditionPolicy:
+    '''
+    Picks which rendition of an image to download (`saveddit --max-image-px`).
+
+    Reddit keeps resized renditions of gallery images (media_metadata[...]['p']) and of
+    linked images (preview['images'][0]['resolutions']). With max_image_px set, the
+    largest rendition whose longer side fits within max_image_px is downloaded instead
+    of the original. The original is kept when it fits itself, or when no rendition does.
+    '''
+    max_image_px = None
+
+    # Reddit's `format` parameter of a rendition URL -> file extension
+    FORMAT_EXTENSIONS = {"pjpg": ".jpg", "jpg": ".jpg", "jpeg": ".jpg", "png": ".png", "png8": ".png",
+                         "webp": ".webp", "gif": ".gif", "mp4": ".mp4"}
+
+    @classmethod
+    def configure(cls, max_image_px=None):
+        cls.max_image_px = max_image_px
+
+    @classmethod
+    def choose(cls, source, renditions):
+        '''
+        source, renditions: (url, width, height) tuples, widths/heights may be None when unknown
+        Returns a dict with the url, width and height of the chosen rendition and whether it is the original
+        '''
+        url, width, height = source
+        original = {"url": url, "width": width, "height": height, "original": True}
+        limit = cls.max_image_px
+        if not limit or (width and height and max(width, height) <= limit):
+            return original
+        fitting = [r for r in renditions if r[0] and r[1] and r[2] and max(r[1], r[2]) <= limit]
+        if not fitting:
+            return original
+        url, width, height = max(fitting, key=lambda r: r[1] * r[2])
+        return {"url": html.unescape(url), "width": width, "height": height, "original": False}
+
+    @staticmethod
+    def from_media_metadata(item_meta):
+        '''
+        Returns (source, renditions) of a gallery item's media_metadata entry
+        '''
+        source = item_meta.get('s') or {}
+        renditions = [(p.get('u'), p.get('x'), p.get('y')) for p in item_meta.get('p') or []]
+        return (source.get('u'), source.get('x'), source.get('y')), renditions
+
+    @staticmethod
+    def from_preview(preview, url):
+        '''
+        Returns (source, renditions) of a submission's preview, with `url` (the linked image) as the source
+        '''
+        images = (preview or {}).get('images') or [{}]
+        source = images[0].get('source') or {}
+        renditions = [(r.get('url'), r.get('width'), r.get('height')) for r in images[0].get('resolutions') or []]
+        return (url, source.get('width'), source.get('height')), renditions
+
+    @staticmethod
+    def filename(filename, url):
+        '''
+        Returns `filename` with the extension of the file `url` serves, e.g., a JPEG rendition of a PNG.
+        Renditions are often in another format than their original; `auto=webp` only applies
+        to requests that accept image/webp, which saveddit's don't.
+        '''
+        parsed = urllib.parse.urlparse(url)
+        image_format = urllib.parse.parse_qs(parsed.query).get("format", [""])[0].lower()
+        extension = RenditionPolicy.FORMAT_EXTENSIONS.get(image_format) or os.path.splitext(parsed.path)[1].lower()
+        stem, current = os.path.splitext(filename)
+        if not extension or RenditionPolicy.FORMAT_EXTENSIONS.get(current.lower().lstrip(".")) == extension:
+            return filename
+        return stem + extension
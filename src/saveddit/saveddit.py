@@ -1,8 +1,21 @@
 import argparse
+import calendar
+import datetime
+import signal
 import sys
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.configuration import ConfigurationLoader
+from saveddit.console import Console, Progress
+from saveddit.distributed_downloader_config import DistributedDownloaderConfig
+from saveddit.file_writer import FileWriter
+from saveddit.image_deduplicator import ImageDeduplicator
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.media_fetch_policy import MediaFetchPolicy
 from saveddit.multireddit_downloader_config import MultiredditDownloaderConfig
+from saveddit.rendition_policy import RenditionPolicy
 from saveddit.search_config import SearchConfig
 from saveddit.subreddit_downloader_config import SubredditDownloaderConfig
+from saveddit.transfer_scheduler import TransferScheduler
 from saveddit.user_downloader_config import UserDownloaderConfig
 from saveddit._version import __version__
 
@@ -28,6 +41,17 @@ def check_positive(value):
             "%s is an invalid positive int value" % value)
     return ivalue
 
+def parse_timestamp(value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return calendar.timegm(datetime.datetime.strptime(value, "%Y-%m-%d").timetuple())
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "%s is neither a YYYY-MM-DD date nor epoch seconds" % value)
+
 class UniqueAppendAction(argparse.Action):
     '''
     Class used to discard duplicates in list arguments
@@ -42,6 +66,86 @@ def main():
 
     parser = argparse.ArgumentParser(prog="saveddit")
     parser.add_argument('-v', '--version', action='version', version='%(prog)s ' + __version__)
+    parser.add_argument('--quiet',
+                        default=False,
+                        action='store_true',
+                        help='Only print errors, e.g., when running from cron (no banner, progress or per-submission logs)')
+    parser.add_argument('--prefetch-pages',
+                        metavar='pages',
+                        type=check_positive,
+                        default=ListingPrefetcher.DEFAULT_PAGES,
+                        help='Pages of 100 listing items fetched ahead of the downloads; more avoid stalls on slow listings at the cost of memory (default: %(default)s)')
+    parser.add_argument('--layout',
+                        default=None,
+                        choices=['flat', 'id', 'month'],
+                        help='Where submissions go within a category directory: NNN_title, sharded by the end of the submission ID (<xy>/<id>_title) or by month (<YYYY>/<MM>/<id>_title) (default: the layout saved by the first run on the output path, or flat)')
+    parser.add_argument('--no-fsync',
+                        default=False,
+                        action='store_true',
+                        help='Don\'t fsync each submission before moving it into place (faster, but a power loss can leave incomplete files)')
+    parser.add_argument('--update',
+                        default=False,
+                        action='store_true',
+                        help='Download submissions saved by an earlier run again instead of skipping them; media that didn\'t change on the server (ETag/Last-Modified) are not transferred again')
+    parser.add_argument('--max-file-size',
+                        metavar='size',
+                        help='Skip media files larger than this many bytes (K, M, G suffixes), going by Content-Length, without reading their body')
+    parser.add_argument('--max-image-px',
+                        metavar='px',
+                        type=check_positive,
+                        help='Download images from galleries and i.redd.it links at the largest size Reddit has whose longer side is at most px pixels, instead of the original')
+    parser.add_argument('--dedup-images',
+                        default=False,
+                        action='store_true',
+                        help='Replace images that look like one saved before in the output path (reposts, recompressed copies) with hard links to it (needs Pillow and numpy)')
+    parser.add_argument('--dedup-distance',
+                        metavar='bits',
+                        type=int,
+                        default=ImageDeduplicator.DEFAULT_MAX_DISTANCE,
+                        help='How many of the 64 bits of their perceptual hashes two images may differ in to count as duplicates (default: %(default)s)')
+    parser.add_argument('--max-per-host',
+                        metavar='limit',
+                        nargs='+',
+                        help='Media requests in flight per host: a default and/or host=limit pairs, e.g., 4 v.redd.it=2')
+    parser.add_argument('--bandwidth',
+                        metavar='rate',
+                        nargs='+',
+                        help='Bytes/s for all media transfers and/or per host (host=rate), e.g., 5M v.redd.it=2M')
+    parser.add_argument('--transfer-control',
+                        metavar='path',
+                        help='YAML file with max_per_host and bandwidth limits that replace the ones above while saveddit runs (re-read when changed, or on SIGHUP)')
+    parser.add_argument('--metrics-textfile',
+                        metavar='path',
+                        help='Prometheus textfile (e.g., for node_exporter\'s textfile collector) that saveddit keeps updated with its metrics')
+    parser.add_argument('--metrics-port',
+                        metavar='port',
+                        type=check_positive,
+                        help='Serve Prometheus metrics on http://<host>:<port>/metrics while saveddit runs')
+    parser.add_argument('--metrics-summary',
+                        metavar='path',
+                        help='JSON file that saveddit writes a summary of its metrics to at the end of the run')
+    recording_group = parser.add_mutually_exclusive_group()
+    recording_group.add_argument('--record',
+                        metavar='fixture',
+                        help='Save all Reddit API requests and responses of the run to this fixture file (appended to)')
+    recording_group.add_argument('--replay',
+                        metavar='fixture',
+                        help='Answer Reddit API requests from a fixture file saved with --record instead of the network')
+    parser.add_argument('--replay-timing',
+                        default='original',
+                        choices=['original', 'zero'],
+                        help='Delay replayed responses by their recorded latency, or not at all (default: %(default)s)')
+    parser.add_argument('--profile',
+                        metavar='output_dir',
+                        help='Profile the run and write reports (time per download stage and handler, flamegraph stacks) to this directory')
+    parser.add_argument('--profiler',
+                        default='sampling',
+                        choices=['sampling', 'cprofile'],
+                        help='Profiler used by --profile: stack sampling of all threads, or the deterministic cProfile (default: %(default)s)')
+    parser.add_argument('--profile-memory',
+                        default=False,
+                        action='store_true',
+                        help='With --profile, also compare tracemalloc snapshots at the end of each category of posts')
 
     subparsers = parser.add_subparsers(dest="subparser_name")
 
@@ -78,6 +182,11 @@ def main():
                         default=False,
                         action='store_true',
                         help='When true, saveddit will download all the comments in a post instead of just the top ones.')
+    subreddit_parser.add_argument('-j',
+                        default=1,
+                        metavar='jobs',
+                        type=check_positive,
+                        help='Number of worker processes the subreddits are spread over (default: %(default)s)')
     subreddit_parser.add_argument('-o',
                         required=True,
                         type=str,
@@ -85,6 +194,76 @@ def main():
                         help='Directory where saveddit will save downloaded content'
                         )
 
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('manifest',
+                        metavar='manifest',
+                        help='YAML job manifest listing the subreddit, multireddit, search and user targets to download in one process')
+
+    coordinator_parser = subparsers.add_parser('coordinator')
+    coordinator_parser.add_argument('subreddits',
+                        metavar='subreddits',
+                        nargs='+',
+                        action=UniqueAppendAction,
+                        help='Names of subreddits to queue for download, e.g., AskReddit')
+    coordinator_parser.add_argument('--queue',
+                        required=True,
+                        metavar='queue_url',
+                        help='Work queue shared with the workers, e.g., /shared/jobs.sqlite3 or sqlite:///shared/jobs.sqlite3')
+    coordinator_parser.add_argument('-f',
+                        metavar='categories',
+                        default=SubredditDownloaderConfig.DEFAULT_CATEGORIES,
+                        nargs='+',
+                        action=UniqueAppendAction,
+                        help='Categories of posts to download (default: %(default)s)')
+    coordinator_parser.add_argument('-l',
+                        default=SubredditDownloaderConfig.DEFAULT_POST_LIMIT,
+                        metavar='post_limit',
+                        type=check_positive,
+                        help='Limit the number of submissions downloaded in each category (default: %(default)s, i.e., all submissions)')
+    coordinator_parser.add_argument('--skip-comments',
+                        default=False,
+                        action='store_true',
+                        help='When true, saveddit will not save comments to a comments.json file')
+    coordinator_parser.add_argument('--skip-meta',
+                        default=False,
+                        action='store_true',
+                        help='When true, saveddit will not save meta to a submission.json file on submissions')
+    coordinator_parser.add_argument('--skip-videos',
+                        default=False,
+                        action='store_true',
+                        help='When true, saveddit will not download videos (e.g., gfycat, redgifs, youtube, v.redd.it links)')
+    coordinator_parser.add_argument('--all-comments',
+                        default=False,
+                        action='store_true',
+                        help='When true, saveddit will download all the comments in a post instead of just the top ones.')
+    coordinator_parser.add_argument('-o',
+                        required=True,
+                        type=str,
+                        metavar='output_path',
+                        help='Shared directory where the workers will save downloaded content'
+                        )
+
+    worker_parser = subparsers.add_parser('worker')
+    worker_parser.add_argument('--queue',
+                        required=True,
+                        metavar='queue_url',
+                        help='Work queue filled by `saveddit coordinator`')
+    worker_parser.add_argument('--lease',
+                        default=DistributedDownloaderConfig.DEFAULT_LEASE_SECONDS,
+                        metavar='seconds',
+                        type=check_positive,
+                        help='Seconds a unit stays leased without a heartbeat before other workers may take it over (default: %(default)s)')
+    worker_parser.add_argument('--wait',
+                        default=False,
+                        action='store_true',
+                        help='When true, keep polling for new units instead of exiting once the queue is drained')
+    worker_parser.add_argument('-o',
+                        default=None,
+                        type=str,
+                        metavar='output_path',
+                        help='Local mount point of the shared output tree (default: the output path given to the coordinator)'
+                        )
+
     multireddit_parser = subparsers.add_parser('multireddit')
     multireddit_parser.add_argument('subreddits',
                         metavar='subreddits',
@@ -129,8 +308,12 @@ def main():
                         help='Names of subreddits to search, e.g., all, aww, pics')
     search_parser.add_argument('-q',
                         metavar='query',
-                        required=True,
-                        help='Search query string')
+                        nargs='+',
+                        action='extend',
+                        help='Search query strings (required unless --queries-file or --backfill is used)')
+    search_parser.add_argument('--queries-file',
+                        metavar='path',
+                        help='File with more search queries, one per line (blank lines and lines starting with # are skipped)')
     search_parser.add_argument('-s',
                         metavar='sort',
                         default=SearchConfig.DEFAULT_SORT,
@@ -157,6 +340,23 @@ def main():
                         default=False,
                         action='store_true',
                         help='When true, saveddit will not download videos (e.g., gfycat, redgifs, youtube, v.redd.it links)')
+    search_parser.add_argument('--backfill',
+                        default=False,
+                        action='store_true',
+                        help='When true, saveddit will download the full history of the subreddits (matching the query, if any) by searching time windows, instead of the ~1000 results of a single search')
+    search_parser.add_argument('--since',
+                        metavar='date',
+                        type=parse_timestamp,
+                        help='With --backfill, oldest creation time to download, as YYYY-MM-DD (UTC) or epoch seconds (default: Reddit\'s launch)')
+    search_parser.add_argument('--until',
+                        metavar='date',
+                        type=parse_timestamp,
+                        help='With --backfill, newest creation time to download, as YYYY-MM-DD (UTC) or epoch seconds (default: now)')
+    search_parser.add_argument('-j',
+                        default=SearchConfig.DEFAULT_BACKFILL_JOBS,
+                        metavar='jobs',
+                        type=check_positive,
+                        help='Number of queries, or with --backfill, time windows searched and downloaded in parallel (default: %(default)s)')
     search_parser.add_argument('-o',
                         required=True,
                         type=str,
@@ -169,6 +369,11 @@ def main():
                         metavar='users',
                         nargs='+',
                         help='Names of users to download, e.g., Poem_for_your_sprog')
+    user_parser.add_argument('-j',
+                        default=1,
+                        metavar='jobs',
+                        type=check_positive,
+                        help='Number of worker processes the users are spread over (default: %(default)s)')
 
 
     user_subparsers = user_parser.add_subparsers(dest="user_subparser_name")
@@ -340,15 +545,117 @@ def main():
                         help='Directory where saveddit will save downloaded comments'
                         )
 
+    migrate_parser = subparsers.add_parser('migrate')
+    migrate_parser.add_argument('output_path',
+                        help='Output path of earlier runs to move into the layout given with --layout (id or month)')
+    migrate_parser.add_argument('--dry-run',
+                        default=False,
+                        action='store_true',
+                        help='Only list the moves')
+
+    refresh_parser = subparsers.add_parser('refresh')
+    refresh_parser.add_argument('output_path',
+                        help='Output path of earlier runs whose submission.json files get the current score, comment count, etc.')
+    refresh_parser.add_argument('-j',
+                        default=4,
+                        metavar='jobs',
+                        type=check_positive,
+                        help='Number of /api/info requests (100 submissions each) in flight (default: %(default)s)')
+
     args = parser.parse_args(argv)
-    print(asciiart())
+    try:
+        max_per_host = TransferScheduler.parse_limits(args.max_per_host, "default", check_positive)
+        bandwidth = TransferScheduler.parse_limits(args.bandwidth, "total", TransferScheduler.parse_rate)
+    except (ValueError, argparse.ArgumentTypeError) as e:
+        parser.error("--max-per-host/--bandwidth: " + str(e))
+    try:
+        max_file_size = MediaFetchPolicy.parse_size(args.max_file_size) if args.max_file_size else None
+    except ValueError as e:
+        parser.error("--max-file-size: " + str(e))
+    if args.dedup_images and not ImageDeduplicator.available():
+        parser.error("--dedup-images needs Pillow and numpy: pip install Pillow numpy")
+    Console.configure(quiet=args.quiet)
+    ConfigurationLoader.quiet = args.quiet
+    ListingPrefetcher.configure(args.prefetch_pages)
+    FileWriter.configure(fsync=not args.no_fsync)
+    ArchiveLayout.configure(args.layout)
+    if getattr(args, "o", None):
+        try:
+            ArchiveLayout.for_output(args.o)
+        except ValueError as e:
+            parser.error("--layout: " + str(e))
+    RenditionPolicy.configure(args.max_image_px)
+    MediaFetchPolicy.configure(args.update, max_file_size)
+    ImageDeduplicator.configure(args.dedup_images, args.dedup_distance)
+    if not args.quiet:
+        print(asciiart())
 
+    metrics = None
+    if args.metrics_textfile or args.metrics_port or args.metrics_summary:
+        from saveddit.metrics import Metrics
+        metrics = Metrics.shared()
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_textfile:
+            metrics.start_textfile_writer(args.metrics_textfile)
+    recorder = None
+    if args.record:
+        from saveddit.api_recording import ApiRecorder
+        recorder = ApiRecorder(args.record)
+        ApiRecorder.install(recorder)
+    elif args.replay:
+        from saveddit.api_recording import ApiReplayer
+        ApiReplayer.install(ApiReplayer(args.replay, args.replay_timing))
+    if max_per_host or bandwidth or args.transfer_control:
+        scheduler = TransferScheduler(max_per_host, bandwidth, args.transfer_control)
+        TransferScheduler.install(scheduler)
+        if args.transfer_control and hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, scheduler.request_reload)
+    profiler = None
+    if args.profile:
+        from saveddit.profiler import Profiler
+        profiler = Profiler(args.profile, args.profiler, args.profile_memory)
+        profiler.start()
+    Progress.shared().start()
+    try:
+        dispatch(parser, args)
+    finally:
+        Progress.shared().stop()
+        ImageDeduplicator.shutdown()
+        Console.stop()
+        if recorder is not None:
+            recorder.close()
+        if profiler is not None:
+            for path in profiler.stop():
+                if not args.quiet:
+                    print("Wrote " + path)
+        if metrics is not None:
+            if args.metrics_textfile:
+                metrics.stop_textfile_writer()
+                metrics.write_textfile(args.metrics_textfile)
+            if args.metrics_summary:
+                metrics.write_summary(args.metrics_summary)
+
+def dispatch(parser, args):
     if args.subparser_name == "subreddit":
         from saveddit.subreddit_downloader import SubredditDownloader
-        for subreddit in args.subreddits:
-            downloader = SubredditDownloader(subreddit)
-            downloader.download(args.o,
-                                download_all_comments=args.all_comments, categories=args.f, post_limit=args.l, skip_videos=args.skip_videos, skip_meta=args.skip_meta, skip_comments=args.skip_comments)
+        if args.j > 1 and len(args.subreddits) > 1:
+            from saveddit.parallel_downloader import ParallelDownloader
+            ParallelDownloader(args.j).download_subreddits(args)
+        else:
+            for subreddit in args.subreddits:
+                downloader = SubredditDownloader(subreddit)
+                downloader.download(args.o,
+                                    download_all_comments=args.all_comments, categories=args.f, post_limit=args.l, skip_videos=args.skip_videos, skip_meta=args.skip_meta, skip_comments=args.skip_comments)
+    elif args.subparser_name == "run":
+        from saveddit.batch_downloader import BatchDownloader
+        BatchDownloader(args.manifest).run()
+    elif args.subparser_name == "coordinator":
+        from saveddit.distributed_downloader import Coordinator
+        Coordinator(args.queue).enqueue_subreddits(args)
+    elif args.subparser_name == "worker":
+        from saveddit.distributed_downloader import Worker
+        Worker(args.queue, lease_seconds=args.lease, output_path=args.o).run(wait=args.wait)
     elif args.subparser_name == "multireddit":
         from saveddit.multireddit_downloader import MultiredditDownloader
         downloader = MultiredditDownloader(args.subreddits)
@@ -356,24 +663,41 @@ def main():
                             categories=args.f, post_limit=args.l, skip_videos=args.skip_videos, skip_meta=args.skip_meta, skip_comments=args.skip_comments)
     elif args.subparser_name == "search":
         from saveddit.search_subreddits import SearchSubreddits
+        queries = list(args.q or [])
+        if args.queries_file:
+            try:
+                with open(args.queries_file, "r", encoding="utf-8") as f:
+                    queries += [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+            except OSError as e:
+                parser.error("search: --queries-file: " + str(e))
+        args.q = list(dict.fromkeys(queries)) # Without repeated queries, in order
+        if not args.q and not args.backfill:
+            parser.error("search: -q or --queries-file is required unless --backfill is used")
         downloader = SearchSubreddits(args.subreddits)
-        downloader.download(args)
+        if args.backfill:
+            for query in args.q or [None]:
+                downloader.backfill(args, query)
+        else:
+            downloader.download(args)
     elif args.subparser_name == "user":
         from saveddit.user_downloader import UserDownloader
-        downloader = UserDownloader()
-        downloader.download_user_meta(args)
-        if args.user_subparser_name == "comments":
-            downloader.download_comments(args)
-        elif args.user_subparser_name == "multireddits":
-            downloader.download_multireddits(args)
-        elif args.user_subparser_name == "submitted":
-            downloader.download_submitted(args)
-        elif args.user_subparser_name == "saved":
-            downloader.download_saved(args)
-        elif args.user_subparser_name == "upvoted":
-            downloader.download_upvoted(args)
-        elif args.user_subparser_name == "gilded":
-            downloader.download_gilded(args)
+        if args.j > 1 and len(args.users) > 1:
+            from saveddit.parallel_downloader import ParallelDownloader
+            ParallelDownloader(args.j).download_users(args)
+        else:
+            downloader = UserDownloader()
+            downloader.download(args)
+    elif args.subparser_name == "migrate":
+        from saveddit.archive_migrator import ArchiveMigrator
+        if args.layout not in ArchiveLayout.SHARDED_LAYOUTS:
+            parser.error("migrate: choose the new layout with --layout id or --layout month (before the subcommand)")
+        ArchiveMigrator(args.output_path, args.layout).migrate(dry_run=args.dry_run)
+    elif args.subparser_name == "refresh":
+        from saveddit.archive_refresher import ArchiveRefresher
+        from saveddit.reddit_client import RedditClientFactory
+        from saveddit.subreddit_downloader import SubredditDownloader
+        reddit_pool = RedditClientFactory.pool(SubredditDownloader.REDDIT_CREDENTIALS)
+        ArchiveRefresher(args.output_path, reddit_pool, jobs=args.j).refresh()
     else:
         parser.print_help()
 
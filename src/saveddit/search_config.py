@@ -1,7 +1,11 @@
 class SearchConfig:
+    DEFAULT_LIMIT = 100 # praw's default number of search results
     DEFAULT_SORT = "relevance"
     DEFAULT_SORT_CATEGORIES = ["relevance", "hot", "top", "new", "comments"]
     DEFAULT_SYNTAX = "lucene"
     DEFAULT_SYNTAX_CATEGORIES = ["cloud search", "lucene", "plain"]
     DEFAULT_TIME_FILTER = "all"
-    DEFAULT_TIME_FILTER_CATEGORIES = ["all", "day", "hour", "month", "week", "year"]
\ No newline at end of file
+    DEFAULT_TIME_FILTER_CATEGORIES = ["all", "day", "hour", "month", "week", "year"]
+    # Backfill (`saveddit search --backfill`) starts here unless --since is given: Reddit's launch, 2005-06-23 UTC
+    BACKFILL_EPOCH = 1119484800
+    DEFAULT_BACKFILL_JOBS = 4
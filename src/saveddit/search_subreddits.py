@@ -1,18 +1,27 @@
-import coloredlogs
 from colorama import Fore, Style
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+import functools
 import logging
-import verboselogs
 import getpass
 import json
 import os
-import praw
 from pprint import pprint
 import re
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.profiler import Profiler
+from saveddit.reddit_client import RedditClientFactory, RedditClientPool
 from saveddit.submission_downloader import SubmissionDownloader
 from saveddit.subreddit_downloader import SubredditDownloader
 from saveddit.search_config import SearchConfig
 import sys
+import threading
+import time
+from saveddit.time_sliced_search import TimeSlicedSearch
 from tqdm import tqdm
 
 class SearchSubreddits:
@@ -37,21 +46,8 @@ class SearchSubreddits:
             # saveddit user .... < password
             REDDIT_PASSWORD = sys.stdin.readline().rstrip()
 
-    def __init__(self, subreddit_names):
-        self.logger = verboselogs.VerboseLogger(__name__)
-        level_styles = {
-            'critical': {'bold': True, 'color': 'red'},
-            'debug': {'color': 'green'},
-            'error': {'color': 'red'},
-            'info': {'color': 'white'},
-            'notice': {'color': 'magenta'},
-            'spam': {'color': 'white', 'faint': True},
-            'success': {'bold': True, 'color': 'green'},
-            'verbose': {'color': 'blue'},
-            'warning': {'color': 'yellow'}
-        }
-        coloredlogs.install(level='SPAM', logger=self.logger,
-                            fmt='%(message)s', level_styles=level_styles)
+    def __init__(self, subreddit_names, reddit=None):
+        self.logger = Console.create_logger(__name__)
 
         if not SearchSubreddits.REDDIT_USERNAME:
             self.logger.error("`reddit_username` in user_config.yaml is empty")
@@ -68,18 +64,42 @@ class SearchSubreddits:
                     # saveddit user .... < password
                     REDDIT_PASSWORD = sys.stdin.readline().rstrip()
 
-        self.reddit = praw.Reddit(
-            client_id=SearchSubreddits.REDDIT_CLIENT_ID,
-            client_secret=SearchSubreddits.REDDIT_CLIENT_SECRET,
-            user_agent="saveddit (by /u/p_ranav)"
-        )
+        if reddit is None:
+            self.reddit_pool = RedditClientFactory.pool(SubredditDownloader.REDDIT_CREDENTIALS)
+        else:
+            self.reddit_pool = RedditClientPool([reddit])
 
         self.multireddit_name = "+".join(subreddit_names)
-        self.subreddit = self.reddit.subreddit(self.multireddit_name)
 
     def download(self, args):
+        '''
+        Searches for every query in args.q, args.j queries at a time. A submission that several
+        queries match is downloaded once; the directories of the other queries get a symbolic
+        link to it. So do submissions saved elsewhere in the output path by earlier runs.
+        '''
+        queries = [args.q] if isinstance(args.q, str) else list(args.q)
+        archive_index = ArchiveIndex.for_output(args.o)
+        ArchiveLayout.for_output(args.o)
+        claims = {} # Submission ID -> (directory it is saved to by this run, set once its download finished)
+        claims_lock = threading.Lock()
+
+        jobs = min(getattr(args, "j", SearchConfig.DEFAULT_BACKFILL_JOBS), len(queries))
+        if jobs <= 1:
+            for query in queries:
+                self.search(query, args, archive_index, claims, claims_lock)
+        else:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {executor.submit(self.search, query, args, archive_index, claims, claims_lock): query
+                           for query in queries}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.logger.error("Search for '" + futures[future] + "' failed - " + str(e))
+        Profiler.checkpoint("search " + self.multireddit_name)
+
+    def search(self, query, args, archive_index, claims, claims_lock):
         output_path = args.o
-        query = args.q
         sort = args.s
         syntax = SearchConfig.DEFAULT_SYNTAX
         time_filter = args.t
@@ -96,23 +116,143 @@ class SearchSubreddits:
         search_dir = os.path.join(os.path.join(os.path.join(os.path.join(os.path.join(
           output_path, "www.reddit.com"), "q"), query), self.multireddit_name), sort)
 
-        if not os.path.exists(search_dir):
-            os.makedirs(search_dir)
+        FileWriter.ensure_dir(search_dir)
 
-        search_results = None
+        search_params = None
         if include_nsfw:
             search_params = {"include_over_18": "on"}
-            search_results = self.subreddit.search(query, sort, syntax, time_filter, params=search_params)
-        else:
-            search_results = self.subreddit.search(query, sort, syntax, time_filter)
+        search_results = self.reddit_pool.listing(
+            lambda reddit: functools.partial(reddit.subreddit(self.multireddit_name).search, query,
+                                         sort=sort, syntax=syntax, time_filter=time_filter),
+            SearchConfig.DEFAULT_LIMIT, search_params)
+
+        submission_config = {'imgur_client_id': SubredditDownloader.IMGUR_CLIENT_ID,
+                             'archive_index': archive_index,
+                             'reddit_pool': self.reddit_pool}
 
         results_found = False
-        for i, submission in enumerate(search_results):
-            if not results_found:
-                results_found = True
-            SubmissionDownloader(submission, i, self.logger, search_dir,
-                skip_videos, skip_meta, skip_comments, comment_limit,
-                {'imgur_client_id': SubredditDownloader.IMGUR_CLIENT_ID})
+        with ListingPrefetcher(search_results) as submissions:
+            for i, submission in enumerate(submissions):
+                if not results_found:
+                    results_found = True
+                submission_dir = ArchiveLayout.submission_dir(search_dir, submission, i)
+                saved_dir = self.claim(submission.id, submission_dir, archive_index, claims, claims_lock)
+                if saved_dir is not None:
+                    self.link(submission, saved_dir, submission_dir, output_path)
+                    continue
+                try:
+                    SubmissionDownloader(submission, i, self.logger, search_dir,
+                        skip_videos, skip_meta, skip_comments, comment_limit,
+                        submission_config)
+                finally:
+                    self.release(submission.id, submission_dir, claims, claims_lock)
 
         if not results_found:
-            self.logger.spam("     * No results found")
\ No newline at end of file
+            self.logger.spam("     * No results found for '" + query + "'")
+
+    def claim(self, submission_id, submission_dir, archive_index, claims, claims_lock):
+        '''
+        Returns None if the submission is to be downloaded to submission_dir (followed by `release`),
+        or else the directory another query of this run or an earlier run saved it to. While another
+        query is downloading the submission, waits for it; if that download fails, it's claimed again.
+        '''
+        if os.path.lexists(submission_dir):
+            return None # Saved or linked here by an earlier run, SubmissionDownloader skips (or updates) it
+        while True:
+            with claims_lock:
+                claim = claims.get(submission_id)
+                if claim is None:
+                    saved_dir = next((path for path in archive_index.paths(submission_id) if os.path.isdir(path)), None)
+                    if saved_dir is None:
+                        claims[submission_id] = (submission_dir, threading.Event())
+                    return saved_dir
+            claimed_dir, downloaded = claim
+            downloaded.wait()
+            if os.path.isdir(claimed_dir):
+                return claimed_dir
+
+    def release(self, submission_id, submission_dir, claims, claims_lock):
+        '''
+        Ends the download of a submission claimed for submission_dir. Unless it was saved (e.g., it
+        failed or was deferred), the claim is dropped so that other queries download it instead.
+        '''
+        with claims_lock:
+            claim = claims.get(submission_id)
+            if claim is None or claim[0] != submission_dir:
+                return # Not claimed, submission_dir existed already
+            if not os.path.isdir(submission_dir):
+                del claims[submission_id]
+        claim[1].set()
+
+    def link(self, submission, saved_dir, link_dir, output_path):
+        try:
+            FileWriter.ensure_dir(os.path.dirname(link_dir))
+            os.symlink(os.path.relpath(saved_dir, os.path.dirname(link_dir)), link_dir, target_is_directory=True)
+            self.logger.spam("     * '" + submission.title + "' is saved in " + os.path.relpath(saved_dir, output_path) + ", linked to it")
+        except OSError as e:
+            # e.g., creating symbolic links needs a privilege on Windows
+            self.logger.warning("     * '" + submission.title + "' is saved in " + os.path.relpath(saved_dir, output_path) +
+                                ", failed to link to it - " + str(e))
+
+    def backfill(self, args, query=None):
+        '''
+        Downloads every submission created between args.since and args.until (epoch seconds,
+        default: all of Reddit's history), optionally matching query, by searching time windows
+        in parallel (see TimeSlicedSearch)
+        '''
+        output_path = args.o
+        skip_comments = args.skip_comments
+        skip_videos = args.skip_videos
+        skip_meta = args.skip_meta
+        comment_limit = 0 # top-level comments ONLY
+
+        since = args.since if args.since is not None else SearchConfig.BACKFILL_EPOCH
+        until = args.until if args.until is not None else int(time.time())
+        if since > until:
+            self.logger.error("--since is after --until, nothing to backfill")
+            return
+
+        self.logger.verbose("Backfilling " + ("'" + query + "' in " if query else "") + self.multireddit_name +
+                            " from " + datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") +
+                            " to " + datetime.fromtimestamp(until, timezone.utc).strftime("%Y-%m-%d %H:%M:%S") + " UTC")
+
+        if query:
+            backfill_dir = os.path.join(output_path, "www.reddit.com", "q", query, self.multireddit_name, "backfill")
+        else:
+            backfill_dir = os.path.join(output_path, "www.reddit.com", "r", self.multireddit_name, "backfill")
+        FileWriter.ensure_dir(backfill_dir)
+
+        archive_index = ArchiveIndex.for_output(output_path)
+        ArchiveLayout.for_output(output_path)
+        submission_config = {'imgur_client_id': SubredditDownloader.IMGUR_CLIENT_ID,
+                             'archive_index': archive_index,
+                             'reddit_pool': self.reddit_pool}
+
+        counter_lock = threading.Lock()
+        counter = [0]
+        skipped = [0]
+
+        def download_submission(submission):
+            # Submissions archived by an earlier (possibly interrupted) backfill are not downloaded again
+            if archive_index.contains(submission.id):
+                with counter_lock:
+                    skipped[0] += 1
+                return
+            with counter_lock:
+                i = counter[0]
+                counter[0] += 1
+            try:
+                SubmissionDownloader(submission, i, self.logger, backfill_dir,
+                    skip_videos, skip_meta, skip_comments, comment_limit,
+                    submission_config)
+            except Exception as e:
+                self.logger.error("Unable to download " + submission.id + " - " + str(e))
+
+        search = TimeSlicedSearch(self.reddit_pool, self.multireddit_name, query=query,
+                                  include_nsfw=args.include_nsfw, logger=self.logger)
+        search.run(since, until, args.j, download_submission)
+
+        self.logger.success("Backfill found " + str(search.submissions_found) + " submissions in " +
+                            str(search.windows_searched) + " windows (" + str(search.windows_split) + " split), " +
+                            str(skipped[0]) + " already archived")
+        Profiler.checkpoint("backfill " + self.multireddit_name)
@@ -1,13 +1,13 @@
 import subprocess
-from bs4 import BeautifulSoup
 import coloredlogs
-from colorama import Fore
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import contextlib
 import logging
 import verboselogs
 from datetime import datetime
 import os
 from io import StringIO
+import html
 import json
 import mimetypes
 import ffmpeg # Note: The previous 'download_reddit_video' used os.system for ffmpeg. If you prefer the python-ffmpeg library, ensure its usage is correct. The provided update uses os.system.
@@ -15,14 +15,36 @@ import praw
 from pprint import pprint
 import re
 import requests
+import time
 import urllib3
-from tqdm import tqdm
 import urllib.request
 import youtube_dl
 import os
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.console import Progress
+from saveddit.disk_cache import DiskCache
+from saveddit.file_writer import FileWriter
+from saveddit.html_media_extractor import EmbeddedVideoExtractor
+from saveddit.image_deduplicator import ImageDeduplicator
+from saveddit.http_session import HttpSession
+from saveddit.imgur_client import ImgurClient
+from saveddit.media_fetch_policy import FileTooLarge, MediaFetchPolicy
+from saveddit.metrics import Metrics
+from saveddit.profiler import Profiler
+from saveddit.rendition_policy import RenditionPolicy
+from saveddit.transfer_scheduler import TransferScheduler
 
 
 class SubmissionDownloader:
+    # Maximum number of gallery/album items fetched at the same time for one submission
+    MAX_ITEM_WORKERS = 8
+
+    # How long resolved (and dead) redirects are remembered, in seconds
+    REDIRECT_CACHE_TTL = 30 * 24 * 60 * 60
+    REDIRECT_NEGATIVE_CACHE_TTL = 3 * 24 * 60 * 60
+    # Statuses that mark a link as dead; timeouts, resets and 5xx are retried on the next run
+    DEAD_LINK_STATUSES = {404, 410}
+
     def __init__(self, submission, submission_index, logger, output_dir, skip_videos, skip_meta, skip_comments, comment_limit, config):
         # Ensure config is a dictionary and has the necessary key
         if not isinstance(config, dict):
@@ -33,6 +55,16 @@ class SubmissionDownloader:
              # For now, let's assume it might be optional for some operations
              # logger.warning("Imgur Client ID not found in config. Imgur Album/Image downloads might fail.")
              pass # Or raise ValueError("Missing 'imgur_client_id' in config")
+        self.session = HttpSession.shared() # Pooled connections shared by all downloaders
+        self.imgur = ImgurClient.for_client_id(self.IMGUR_CLIENT_ID) if self.IMGUR_CLIENT_ID else None
+        self.archive_index = config.get("archive_index") # Optional ArchiveIndex shared by all downloaders of a run
+        self.reddit_pool = config.get("reddit_pool") # Optional RedditClientPool to fetch comments with
+        self.metrics = Metrics.shared()
+        self.transfers = TransferScheduler.shared() # Per-host concurrency and bandwidth limits of media transfers
+        self.renditions = [] # Image renditions chosen with --max-image-px, saved to submission.json
+        self.duplicates = {} # Images linked to a similar one saved before with --dedup-images, saved to submission.json
+        self.staging_dir = None
+        self.previous_dir = None # With --update, the directory an earlier run saved the submission to
 
         self.logger = logger
         i = submission_index
@@ -44,33 +76,23 @@ class SubmissionDownloader:
         if has_url:
             title = submission.title
             self.logger.verbose(prefix_str + '"' + title + '"')
-            # Sanitize title for filesystem compatibility
-            # Replace non-alphanumeric characters (except underscore/hyphen) with underscore
-            title = re.sub(r'[^\w\-]+', '_', title)
-            # Remove leading/trailing underscores/spaces
-            title = title.strip('_ ')
-
-            # Truncate title - Be careful with filesystem limits (e.g., 255 chars on many systems)
-            # 32 is very short, maybe increase slightly? Consider the full path length too.
-            max_title_len = 64 # Increased from 32
-            if len(title) > max_title_len:
-                title = title[:max_title_len]
-                # Adding ellipsis might not be ideal for directory names
-                # title += "..."
-
-            # Prepare directory for the submission
-            post_dir = str(i).zfill(3) + "_" + title # Removed .replace(" ", "_") as spaces are already handled
-            submission_dir = os.path.join(output_dir, post_dir)
+
+            # Prepare directory for the submission, e.g., <output_dir>/007_<sanitized title> (see ArchiveLayout)
+            submission_dir = ArchiveLayout.submission_dir(output_dir, submission, i)
 
             # Check existence *before* creating
             if os.path.exists(submission_dir):
-                # Use logger instead of print for consistency
-                self.logger.notice(f"Directory '{submission_dir}' already exists, skipping submission.")
-                return # Skip this submission entirely if the main dir exists
-
-            # Create the directory *after* the check
+                if not MediaFetchPolicy.update:
+                    # Use logger instead of print for consistency
+                    self.logger.notice("Directory '%s' already exists, skipping submission.", submission_dir)
+                    return # Skip this submission entirely if the main dir exists
+                # Downloaded again and swapped in on commit, reusing the media that didn't change
+                self.previous_dir = submission_dir
+
+            # Everything is saved to a staging directory first, which becomes submission_dir
+            # once complete, so an interrupted submission is downloaded again by the next run
             try:
-                os.makedirs(submission_dir)
+                staging_dir = self.staging_dir = FileWriter.begin(submission_dir)
             except OSError as e:
                 self.logger.error(f"Failed to create directory {submission_dir}: {e}")
                 return # Cannot proceed if directory creation fails
@@ -91,40 +113,45 @@ class SubmissionDownloader:
                 files_dir = submission_dir # Default to submission_dir if not creating subfolder
                 if should_create_files_dir:
                     target_dir = os.path.join(submission_dir, "files")
-                    if not os.path.exists(target_dir):
-                        try:
-                            os.makedirs(target_dir)
-                            files_dir = target_dir # Update files_dir only on successful creation
-                        except OSError as e:
-                             self.logger.error(f"Failed to create 'files' subdirectory in {submission_dir}: {e}")
-                             # Decide how to handle this: maybe download to submission_dir? For now, log and continue.
-                    else:
-                        files_dir = target_dir # Use existing 'files' dir
+                    try:
+                        os.mkdir(target_dir) # The staging directory starts out empty, no need to check first
+                        files_dir = target_dir # Update files_dir only on successful creation
+                    except OSError as e:
+                         self.logger.error(f"Failed to create 'files' subdirectory in {submission_dir}: {e}")
+                         # Decide how to handle this: maybe download to submission_dir? For now, log and continue.
                 return files_dir
             # --- End Inner Function ---
 
 
             # --- Content Type Handling ---
             # Using a more structured if/elif/else approach
+            with self.metrics.timer("saveddit_stage_seconds", stage="classify"), Profiler.stage("classify"):
+                handler = self.classify_link(submission)
+            handler_started = time.perf_counter()
+            previous_stage = Profiler.set_stage(handler)
 
             # 1. Direct Links (Images/MP4)
-            if self.is_direct_link_to_content(submission.url, [".png", ".jpg", ".jpeg", ".gif"]):
-                files_dir = create_files_dir(submission_dir)
+            if handler == "direct_image":
+                files_dir = create_files_dir(staging_dir)
                 filename = os.path.basename(urllib.parse.urlparse(submission.url).path) # Safer filename extraction
                 if not filename: filename = f"{submission.id}_image" # Fallback filename
                 self.logger.spam(
                     self.indent_1 + "This is a direct link to an image file (" + filename + ")")
+                url = submission.url
+                if RenditionPolicy.max_image_px and not filename.lower().endswith(".gif"):
+                    # vars() rather than getattr, so a post without preview doesn't make PRAW fetch it again
+                    url, filename = self.choose_rendition(filename, *RenditionPolicy.from_preview(vars(submission).get('preview'), url))
                 save_path = os.path.join(files_dir, filename)
-                if self.download_direct_link(submission, save_path):
+                if self.download_direct_link(type('obj', (object,), {'url': url})(), save_path):
                     success = True
 
-            elif self.is_direct_link_to_content(submission.url, [".mp4"]):
+            elif handler == "direct_video":
                 filename = os.path.basename(urllib.parse.urlparse(submission.url).path)
                 if not filename: filename = f"{submission.id}_video.mp4"
                 self.logger.spam(
                     self.indent_1 + "This is a direct link to an MP4 file (" + filename + ")")
                 if not skip_videos:
-                    files_dir = create_files_dir(submission_dir)
+                    files_dir = create_files_dir(staging_dir)
                     save_path = os.path.join(files_dir, filename)
                     if self.download_direct_link(submission, save_path):
                         success = True
@@ -133,17 +160,17 @@ class SubmissionDownloader:
                     success = True # Mark success as we intentionally skipped
 
             # 2. Reddit Gallery
-            elif self.is_reddit_gallery(submission.url):
-                 files_dir = create_files_dir(submission_dir)
+            elif handler == "reddit_gallery":
+                 files_dir = create_files_dir(staging_dir)
                  self.logger.spam(self.indent_1 + "This is a reddit gallery")
                  if self.download_reddit_gallery(submission, files_dir, skip_videos):
                      success = True
 
             # 3. Reddit Video
-            elif self.is_reddit_video(submission.url):
+            elif handler == "reddit_video":
                 self.logger.spam(self.indent_1 + "This is a reddit video")
                 if not skip_videos:
-                    files_dir = create_files_dir(submission_dir)
+                    files_dir = create_files_dir(staging_dir)
                     # download_reddit_video now handles its own success logging internally
                     self.download_reddit_video(submission, files_dir)
                     # We might consider success=True even if audio fails but video downloads?
@@ -155,11 +182,11 @@ class SubmissionDownloader:
                     success = True
 
             # 4. Gfycat / Redgifs
-            elif self.is_gfycat_link(submission.url) or self.is_redgifs_link(submission.url):
-                link_type = "gfycat" if self.is_gfycat_link(submission.url) else "redgif"
+            elif handler in ("gfycat", "redgifs"):
+                link_type = "gfycat" if handler == "gfycat" else "redgif"
                 self.logger.spam(self.indent_1 + f"This is a {link_type} link")
                 if not skip_videos:
-                    files_dir = create_files_dir(submission_dir)
+                    files_dir = create_files_dir(staging_dir)
                     if self.download_gfycat_or_redgif(submission, files_dir):
                          success = True
                 else:
@@ -167,41 +194,52 @@ class SubmissionDownloader:
                     success = True
 
             # 5. Imgur Album
-            elif self.is_imgur_album(submission.url):
+            elif handler == "imgur_album":
                 # Check if Imgur Client ID is available
                 if not self.IMGUR_CLIENT_ID:
                     self.logger.warning(self.indent_1 + "Skipping Imgur album download: Imgur Client ID not configured.")
+                elif self.imgur.credits_low() and not self.imgur.has_album(self.get_imgur_album_id(submission.url)):
+                    self.defer_submission(staging_dir, "Imgur API credits are running low")
+                    Profiler.set_stage(previous_stage)
+                    return
                 else:
-                    files_dir = create_files_dir(submission_dir)
+                    files_dir = create_files_dir(staging_dir)
                     self.logger.spam(self.indent_1 + "This is an imgur album")
                     if self.download_imgur_album(submission, files_dir):
                         success = True
 
             # 6. Imgur Image/Video
-            elif self.is_imgur_image(submission.url): # Should be checked *after* album
+            elif handler == "imgur_image": # Classified *after* album
+                 # Direct i.imgur.com media links don't need the API (nor a Client ID)
+                 is_direct_imgur_link = self.get_imgur_direct_url(submission.url) is not None
                  # Check if Imgur Client ID is available
-                 if not self.IMGUR_CLIENT_ID:
+                 if not is_direct_imgur_link and not self.IMGUR_CLIENT_ID:
                      self.logger.warning(self.indent_1 + "Skipping Imgur image/video download: Imgur Client ID not configured.")
+                 elif not is_direct_imgur_link and self.imgur.credits_low() and \
+                         not self.imgur.has_image(self.get_imgur_image_id(submission.url)):
+                     self.defer_submission(staging_dir, "Imgur API credits are running low")
+                     Profiler.set_stage(previous_stage)
+                     return
                  else:
-                     files_dir = create_files_dir(submission_dir)
+                     files_dir = create_files_dir(staging_dir)
                      self.logger.spam(self.indent_1 + "This is an imgur image or video")
                      if self.download_imgur_image(submission, files_dir):
                          success = True
 
             # 7. Self Post
-            elif self.is_self_post(submission):
+            elif handler == "self_post":
                 self.logger.spam(self.indent_1 + "This is a self-post (no external media)")
                 success = True # Nothing to download, so considered successful
 
             # 8. YouTube-DL Supported (including YouTube)
-            elif (not skip_videos) and (self.is_youtube_link(submission.url) or self.is_supported_by_youtubedl(submission.url)):
-                link_type = "youtube" if self.is_youtube_link(submission.url) else "youtube-dl supported"
+            elif (not skip_videos) and handler in ("youtube", "youtube_dl"):
+                link_type = "youtube" if handler == "youtube" else "youtube-dl supported"
                 self.logger.spam(self.indent_1 + f"This is a {link_type} link")
                 # No need for inner 'if not skip_videos' as it's already checked
-                files_dir = create_files_dir(submission_dir)
+                files_dir = create_files_dir(staging_dir)
                 if self.download_youtube_video(submission.url, files_dir):
                     success = True
-            elif skip_videos and (self.is_youtube_link(submission.url) or self.is_supported_by_youtubedl(submission.url)):
+            elif skip_videos and handler in ("youtube", "youtube_dl"):
                  self.logger.spam(self.indent_1 + "Skipping download of video content (youtube-dl)")
                  success = True
 
@@ -211,47 +249,115 @@ class SubmissionDownloader:
                 # Optionally try a generic download attempt here? Or just mark as success if metadata/comments are saved.
                 success = True # Consider it success if we just save meta/comments
 
+            self.metrics.observe("saveddit_stage_seconds", time.perf_counter() - handler_started, stage=handler)
+            Profiler.set_stage(previous_stage)
+            self.metrics.inc("saveddit_submissions_total", handler=handler, outcome="ok" if success else "failed")
+
+            # --- Duplicate images ---
+            if ImageDeduplicator.enabled and self.archive_index is not None:
+                try:
+                    with self.metrics.timer("saveddit_stage_seconds", stage="dedup"), Profiler.stage("dedup"):
+                        self.duplicates = ImageDeduplicator.dedupe(self.archive_index, submission.id, staging_dir)
+                except Exception as e:
+                    self.logger.error(self.indent_1 + "Failed to look for duplicate images.")
+                    self.print_formatted_error(e)
+                for file, original in self.duplicates.items():
+                    self.logger.spam(self.indent_1 + os.path.basename(file) + " looks like " + original["file"] +
+                                     " of " + original["submission_id"] + ", linked to it")
 
             # --- Metadata and Comments ---
             if not skip_meta:
                 self.logger.spam(self.indent_1 + "Saving submission.json")
-                self.download_submission_meta(submission, submission_dir)
+                with self.metrics.timer("saveddit_stage_seconds", stage="meta"), Profiler.stage("meta"):
+                    self.download_submission_meta(submission, staging_dir)
             else:
                 self.logger.spam(self.indent_1 + "Skipping submission meta")
 
             if not skip_comments:
                 limit_desc = "all" if comment_limit is None else f"top-level (limit={comment_limit})"
                 self.logger.spam(self.indent_1 + f"Saving {limit_desc} comments to comments.json")
-                self.download_comments(submission, submission_dir, comment_limit)
+                with self.metrics.timer("saveddit_stage_seconds", stage="comments"), Profiler.stage("comments"):
+                    self.download_comments(submission, staging_dir, comment_limit)
             else:
                 self.logger.spam(self.indent_1 + "Skipping comments")
 
+            # --- Commit ---
+            try:
+                with self.metrics.timer("saveddit_stage_seconds", stage="commit"), Profiler.stage("commit"):
+                    FileWriter.commit(staging_dir, submission_dir, replace=self.previous_dir is not None)
+            except OSError as e:
+                self.logger.error(self.indent_1 + "Failed to move the downloaded submission to " + submission_dir)
+                self.print_formatted_error(e)
+                FileWriter.discard(staging_dir)
+                return
+
+            # --- Archive Index ---
+            if self.archive_index is not None:
+                try:
+                    self.archive_index.add(submission, submission_dir, complete=success)
+                except Exception as e:
+                    self.logger.error(self.indent_1 + "Failed to record submission in the archive index.")
+                    self.print_formatted_error(e)
+
             # --- Final Logging ---
             if success:
-                 # Log success only if directory was actually created (avoid logging for skipped existing dirs)
-                 if os.path.exists(submission_dir): # Double check it wasn't skipped early on
-                      self.logger.spam(self.indent_1 + "Saved to " + submission_dir + "\n")
+                 self.logger.spam(self.indent_1 + "Saved to " + submission_dir + "\n")
             else:
-                 # Only log failure if we didn't skip due to existing directory
-                 if os.path.exists(submission_dir):
-                    self.logger.warning(
-                        self.indent_1 + "Potentially failed to download content from link " + submission.url + "\n"
-                    )
-                    # Consider removing the created directory if the download failed completely?
-                    # Might be risky if metadata/comments *did* save.
-                    # Example cleanup (use with caution):
-                    # if not skip_meta and not skip_comments and not os.listdir(files_dir): # If files dir is empty and meta/comments weren't skipped
-                    #    try:
-                    #        shutil.rmtree(submission_dir)
-                    #        self.logger.warning(self.indent_1 + f"Removed empty directory due to download failure: {submission_dir}")
-                    #    except Exception as e:
-                    #        self.logger.error(self.indent_1 + f"Failed to remove directory {submission_dir}: {e}")
+                 self.logger.warning(
+                     self.indent_1 + "Potentially failed to download content from link " + submission.url + "\n"
+                 )
+                 # Consider removing the created directory if the download failed completely?
+                 # Might be risky if metadata/comments *did* save.
+                 # Example cleanup (use with caution):
+                 # if not skip_meta and not skip_comments and not os.listdir(files_dir): # If files dir is empty and meta/comments weren't skipped
+                 #    try:
+                 #        shutil.rmtree(submission_dir)
+                 #        self.logger.warning(self.indent_1 + f"Removed empty directory due to download failure: {submission_dir}")
+                 #    except Exception as e:
+                 #        self.logger.error(self.indent_1 + f"Failed to remove directory {submission_dir}: {e}")
 
 
         else: # No URL attribute found
             self.logger.warning(f"Submission {submission.id} at index {i} seems to lack a URL attribute. Skipping.")
 
 
+    def classify_link(self, submission):
+        '''
+        Returns the name of the media handler for the submission's link, e.g., "reddit_video"
+        '''
+        url = submission.url
+        if self.is_direct_link_to_content(url, [".png", ".jpg", ".jpeg", ".gif"]):
+            return "direct_image"
+        if self.is_direct_link_to_content(url, [".mp4"]):
+            return "direct_video"
+        if self.is_reddit_gallery(url):
+            return "reddit_gallery"
+        if self.is_reddit_video(url):
+            return "reddit_video"
+        if self.is_gfycat_link(url):
+            return "gfycat"
+        if self.is_redgifs_link(url):
+            return "redgifs"
+        if self.is_imgur_album(url):
+            return "imgur_album"
+        if self.is_imgur_image(url):
+            return "imgur_image"
+        if self.is_self_post(submission):
+            return "self_post"
+        if self.is_youtube_link(url):
+            return "youtube"
+        if self.is_supported_by_youtubedl(url):
+            return "youtube_dl"
+        return "unknown"
+
+    def defer_submission(self, staging_dir, reason):
+        # Undo the (still empty) staging directory so that the next run picks this submission up again
+        self.logger.warning(self.indent_1 + f"Deferring submission: {reason}")
+        try:
+            os.rmdir(staging_dir)
+        except OSError as e:
+            self.logger.error(self.indent_2 + f"Failed to remove deferred submission directory {staging_dir}: {e}")
+
     def print_formatted_error(self, e):
         # Log multi-line errors properly indented
         error_str = str(e).strip() # Remove leading/trailing whitespace
@@ -271,55 +377,134 @@ class SubmissionDownloader:
             self.logger.error(f"Error parsing URL {url} in is_direct_link_to_content: {e}")
             return False
 
+    def choose_rendition(self, filename, source, renditions):
+        # Returns the URL to download image `filename` from with --max-image-px and the file name to save it
+        # under (with the extension of the rendition's format), recording the choice for submission.json
+        choice = RenditionPolicy.choose(source, renditions)
+        if not choice["original"]:
+            self.logger.spam(self.indent_2 + f"Using the {choice['width']}x{choice['height']} rendition of {filename}")
+            filename = RenditionPolicy.filename(filename, choice["url"])
+        self.renditions.append(dict(choice, file=filename))
+        return choice["url"], filename
+
+    def previous_copy(self, save_path):
+        # With --update, returns the file the earlier run saved where save_path (in the staging directory) goes
+        if self.previous_dir is None:
+            return None
+        path = os.path.join(self.previous_dir, os.path.relpath(save_path, self.staging_dir))
+        return path if os.path.isfile(path) else None
+
+    def not_modified(self, url, timeout=20):
+        # With --update, True if the server answers 304 to a conditional request for url with the validators saved before
+        headers = MediaFetchPolicy.conditional_headers(url)
+        if not headers:
+            return False
+        headers['User-Agent'] = 'SavedditDownloader/1.0'
+        with self.transfers.transfer(url):
+            response = self.session.head(url, headers=headers, timeout=timeout, allow_redirects=True)
+        return response.status_code == 304
+
+    def fetch_media(self, url, save_path, timeout, chunk_size=1024 * 64, accept=None):
+        # Streams url to save_path within the TransferScheduler limits and the MediaFetchPolicy rules
+        # Returns True once the file is in place, False if a rule (or accept, given the response) skipped it
+        # Request errors are raised; FileWriter leaves no partial file behind
+        name = os.path.basename(save_path)
+        headers = {'User-Agent': 'SavedditDownloader/1.0'} # Be a good internet citizen
+        previous_copy = self.previous_copy(save_path)
+        if previous_copy:
+            headers.update(MediaFetchPolicy.conditional_headers(url))
+        # Waits for a free slot on the host (see TransferScheduler)
+        with self.transfers.transfer(url) as transfer:
+            # Closing a response whose body wasn't read drops the connection rather than reading the rest
+            with self.session.get(url, stream=True, headers=headers, timeout=timeout) as response:
+                if response.status_code == 304 and previous_copy:
+                    FileWriter.link(previous_copy, save_path)
+                    self.metrics.inc("saveddit_media_not_modified_total")
+                    self.logger.spam(self.indent_2 + f"{name} is unchanged, keeping the saved copy")
+                    return True
+                response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+                if accept is not None and not accept(response):
+                    return False
+
+                total_size = MediaFetchPolicy.content_length(response)
+                downloaded = 0
+                try:
+                    MediaFetchPolicy.check_size(total_size)
+                    with FileWriter.open(save_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size):
+                            transfer.consume(len(chunk))
+                            downloaded += len(chunk)
+                            MediaFetchPolicy.check_size(downloaded)
+                            f.write(chunk)
+                except FileTooLarge as e:
+                    self.metrics.inc("saveddit_media_skipped_total", reason="too_large")
+                    self.logger.notice(self.indent_2 + f"Skipping {name} ({e}, see --max-file-size)")
+                    return False
+
+        # Check if download was complete (Content-Length counts compressed bytes when there's a Content-Encoding)
+        if total_size and downloaded != total_size and not response.headers.get('Content-Encoding'):
+             self.logger.warning("%sDownloaded size mismatch for %s. Expected %d, got %d", self.indent_2, name, total_size, downloaded)
+        MediaFetchPolicy.remember(url, response)
+        return True
+
     def download_direct_link(self, submission, output_path):
         # Returns True on success, False on failure
         try:
-            # Use requests for better error handling and headers
-            headers = {'User-Agent': 'SavedditDownloader/1.0'} # Be a good internet citizen
-            response = requests.get(submission.url, stream=True, headers=headers, timeout=30) # Added timeout
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            total_size = int(response.headers.get('content-length', 0))
-            block_size = 1024 # 1 Kibibyte
-
-            # Use tqdm for progress bar
-            with open(output_path, 'wb') as file, tqdm(
-                    desc=os.path.basename(output_path),
-                    total=total_size,
-                    unit='iB',
-                    unit_scale=True,
-                    unit_divisor=1024,
-                    bar_format='%s%s{l_bar}{bar:20}{r_bar}%s' % (self.indent_2, Fore.WHITE + Fore.LIGHTBLACK_EX, Fore.RESET),
-                    leave=False # Don't leave completed bar behind if logging many files
-                ) as bar:
-                for data in response.iter_content(block_size):
-                    bar.update(len(data))
-                    file.write(data)
-
-            # Check if download was complete (optional but good practice)
-            if total_size != 0 and bar.n != total_size:
-                 self.logger.warning(self.indent_2 + f"Downloaded size mismatch for {os.path.basename(output_path)}. Expected {total_size}, got {bar.n}")
-                 # Decide if this constitutes failure - for now, let's say no unless raise_for_status failed
-            self.logger.spam(self.indent_2 + f"Successfully downloaded {os.path.basename(output_path)}")
+            if self.fetch_media(submission.url, output_path, timeout=30):
+                self.logger.spam("%sSuccessfully downloaded %s", self.indent_2, os.path.basename(output_path))
             return True
 
         except requests.exceptions.RequestException as e:
+            # FileWriter leaves no incomplete file behind
             self.logger.error(self.indent_2 + f"Failed to download direct link: {submission.url}")
             self.print_formatted_error(e)
-            # Clean up potentially incomplete file
-            if os.path.exists(output_path):
-                try: os.remove(output_path)
-                except OSError: pass
             return False
         except Exception as e: # Catch other potential errors
             self.logger.error(self.indent_2 + f"An unexpected error occurred downloading direct link: {submission.url}")
             self.print_formatted_error(e)
-            if os.path.exists(output_path):
-                try: os.remove(output_path)
-                except OSError: pass
             return False
 
 
+    def download_item(self, label, url, save_path, timeout):
+        # Downloads one gallery/album item without a progress bar of its own
+        # Returns True on success, False on failure
+        try:
+            self.fetch_media(url, save_path, timeout, chunk_size=1024 * 8) # 8KB chunks
+            return True # Also when skipped by --max-file-size
+        except requests.exceptions.RequestException as download_err:
+            self.logger.error(self.indent_2 + f"Failed to download {label} from {url}")
+            self.print_formatted_error(download_err)
+        except Exception as e:
+            self.logger.error(self.indent_2 + f"Unexpected error downloading {label}")
+            self.print_formatted_error(e)
+        return False # FileWriter leaves no partial file behind
+
+    def download_items_concurrently(self, items, timeout):
+        # items: list of (label, url, save_path) tuples, e.g., the images of a gallery or an album
+        # Fans the items out to at most MAX_ITEM_WORKERS threads. File names are decided by
+        # the caller, so the output doesn't depend on completion order.
+        # Returns the number of items downloaded successfully
+        if not items:
+            return 0
+
+        success_count = 0
+        max_workers = min(SubmissionDownloader.MAX_ITEM_WORKERS, len(items))
+        pending = [len(items)]
+        gauge = Progress.shared().add_gauge("items queued", lambda: pending[0])
+        try:
+            # Item threads are profiled as part of the gallery/album handler that started them
+            with ThreadPoolExecutor(max_workers=max_workers, initializer=Profiler.set_stage,
+                                    initargs=(Profiler.current_stage(),)) as executor:
+                futures = [executor.submit(self.download_item, label, url, save_path, timeout)
+                           for label, url, save_path in items]
+                for future in as_completed(futures):
+                    if future.result():
+                        success_count += 1
+                    pending[0] -= 1
+        finally:
+            Progress.shared().remove_gauge(gauge)
+        return success_count
+
     def is_youtube_link(self, url):
         # More robust check
         try:
@@ -487,7 +672,8 @@ class SubmissionDownloader:
                  return True # No items to download, consider it success
 
             success_count = 0
-            for j, item in tqdm(enumerate(items), total=image_count, bar_format='%s%s{l_bar}{bar:20}{r_bar}%s' % (self.indent_2, Fore.WHITE + Fore.LIGHTBLACK_EX, Fore.RESET), leave=False):
+            pending_items = [] # (label, url, save_path) tuples fetched concurrently below
+            for j, item in enumerate(items):
                 try:
                     media_id = item.get("media_id")
                     if not media_id:
@@ -505,10 +691,12 @@ class SubmissionDownloader:
 
                     item_url = None
                     file_ext = None
+                    resizable = False # Still images can be swapped for a smaller rendition
 
                     if item_source_info:
                         if 'u' in item_source_info and item_mimetype and 'image' in item_mimetype:
                             item_url = item_source_info['u']
+                            resizable = item_mimetype != 'image/gif'
                             file_ext = mimetypes.guess_extension(item_mimetype) or f".{item_mimetype.split('/')[-1]}"
                         elif 'mp4' in item_source_info and item_mimetype and 'video' in item_mimetype:
                              item_url = item_source_info['mp4']
@@ -538,31 +726,10 @@ class SubmissionDownloader:
                     # Construct filename and save path
                     # Use index j for ordering + media_id for uniqueness
                     item_filename = f"{str(j).zfill(3)}_{media_id}{file_ext}"
+                    if resizable and RenditionPolicy.max_image_px:
+                        item_url, item_filename = self.choose_rendition(item_filename, *RenditionPolicy.from_media_metadata(item_meta))
                     save_path = os.path.join(output_path, item_filename)
-
-                    # Download the item
-                    try:
-                        # Use requests for gallery items too
-                        headers = {'User-Agent': 'SavedditDownloader/1.0'}
-                        response = requests.get(item_url, stream=True, headers=headers, timeout=20)
-                        response.raise_for_status()
-                        with open(save_path, 'wb') as f:
-                            for chunk in response.iter_content(1024 * 8): # 8KB chunks
-                                f.write(chunk)
-                        success_count += 1
-                    except requests.exceptions.RequestException as download_err:
-                        self.logger.error(self.indent_2 + f"Failed to download gallery item {j+1} ({media_id}) from {item_url}")
-                        self.print_formatted_error(download_err)
-                        # Clean up partial file
-                        if os.path.exists(save_path):
-                             try: os.remove(save_path)
-                             except OSError: pass
-                    except Exception as e:
-                         self.logger.error(self.indent_2 + f"Unexpected error downloading gallery item {j+1} ({media_id})")
-                         self.print_formatted_error(e)
-                         if os.path.exists(save_path):
-                              try: os.remove(save_path)
-                              except OSError: pass
+                    pending_items.append((f"gallery item {j+1} ({media_id})", item_url, save_path))
 
                 except Exception as item_proc_err:
                     # Catch errors processing a single item's data
@@ -570,6 +737,9 @@ class SubmissionDownloader:
                     self.print_formatted_error(item_proc_err)
                     # Continue to the next item
 
+            # Download the items
+            success_count += self.download_items_concurrently(pending_items, timeout=20)
+
             # Log final status for the gallery
             if success_count == image_count:
                  self.logger.spam(self.indent_2 + f"Successfully processed all {image_count} gallery items.")
@@ -682,16 +852,26 @@ class SubmissionDownloader:
                      self.logger.error(self.indent_2 + "Could not find video fallback_url or hls_url in submission media.")
                      return # Cannot proceed without any video URL
 
+            # With --update, the earlier run's merged <media_id>.mp4 is kept while the video is unchanged;
+            # its video and audio components were deleted after merging, so fetch_media can't reuse them
+            merged_path = os.path.join(output_path, media_id + ".mp4")
+            merged_copy = self.previous_copy(merged_path)
+            try:
+                if merged_copy and self.not_modified(video_url):
+                    FileWriter.link(merged_copy, merged_path)
+                    self.metrics.inc("saveddit_media_not_modified_total")
+                    self.logger.spam(self.indent_2 + f"{media_id}.mp4 is unchanged, keeping the saved copy")
+                    return
+            except requests.exceptions.RequestException as e:
+                self.logger.spam(self.indent_2 + f"Could not check whether {media_id}.mp4 changed, downloading it again - {e}")
+
             # --- Video Download (from fallback_url) ---
             self.logger.spam(self.indent_2 + f"Downloading video component from: {video_url}")
             video_save_path = os.path.join(output_path, media_id + "_video.mp4")
             try:
-                headers = {'User-Agent': 'SavedditDownloader/1.0'}
-                response = requests.get(video_url, stream=True, headers=headers, timeout=60) # Increased timeout for potentially large videos
-                response.raise_for_status()
-                with open(video_save_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=1024 * 1024): # Larger chunks (1MB) for video
-                        f.write(chunk)
+                # Increased timeout for potentially large videos, larger chunks (1MB)
+                if not self.fetch_media(video_url, video_save_path, timeout=60, chunk_size=1024 * 1024):
+                    return # Skipped by --max-file-size, no point in fetching the audio
                 self.logger.spam(self.indent_2 + "Successfully downloaded video component.")
             except requests.exceptions.RequestException as e:
                 self.logger.error(self.indent_2 + f"Failed to download video component from {video_url}")
@@ -741,22 +921,18 @@ class SubmissionDownloader:
                 if not audio_url: continue # Skip if regex substitution failed etc.
 
                 self.logger.spam(self.indent_2 + f"Attempting to download audio component from: {audio_url}")
-                try:
-                    # Use requests for better error handling
-                    headers = {'User-Agent': 'SavedditDownloader/1.0'}
-                    response = requests.get(audio_url, stream=True, headers=headers, timeout=20) # Shorter timeout for audio
-                    response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
+                def is_audio(response):
                     # Check content type if possible and if it seems like audio
                     content_type = response.headers.get('content-type', '').lower()
                     if content_type and not ('audio' in content_type or 'video' in content_type or 'octet-stream' in content_type):
                         self.logger.warning(self.indent_2 + f"URL {audio_url} returned non-audio/video content-type: {content_type}. Skipping this URL.")
-                        response.close() # Close the connection
-                        continue # Skip to next URL
+                        return False
+                    return True
 
-                    with open(audio_save_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=1024 * 8): # 8KB chunks
-                            f.write(chunk)
+                try:
+                    # Shorter timeout for audio, 8KB chunks
+                    if not self.fetch_media(audio_url, audio_save_path, timeout=20, chunk_size=1024 * 8, accept=is_audio):
+                        continue # Skip to next URL
 
                     # Check if the downloaded file exists and is reasonably sized (e.g., > 1KB)
                     if os.path.exists(audio_save_path) and os.path.getsize(audio_save_path) > 1024:
@@ -814,7 +990,8 @@ class SubmissionDownloader:
                     # result = os.system(ffmpeg_cmd)
 
                     # Using subprocess to capture stderr
-                    process = subprocess.run(ffmpeg_cmd, shell=True, capture_output=True, text=True, check=False) # check=False to handle non-zero exits manually
+                    with self.metrics.timer("saveddit_stage_seconds", stage="ffmpeg_merge"), Profiler.stage("ffmpeg_merge"):
+                        process = subprocess.run(ffmpeg_cmd, shell=True, capture_output=True, text=True, check=False) # check=False to handle non-zero exits manually
                     result = process.returncode
                     ffmpeg_stderr = process.stderr.strip()
 
@@ -945,49 +1122,20 @@ class SubmissionDownloader:
         self.logger.spam(self.indent_2 + f"Attempting to scrape gfycat page for embedded video: {url}")
         try:
             headers = {'User-Agent': 'SavedditDownloader/1.0'}
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status() # Check for HTTP errors
-
-            soup = BeautifulSoup(response.content, 'html.parser') # Use response.content for correct encoding handling
-
-            # Look for video tags first (more reliable if present)
-            video_tags = soup.find_all('video')
-            for video in video_tags:
-                 source_tags = video.find_all('source')
-                 for source in source_tags:
-                      src = source.get('src')
-                      # Prioritize URLs containing 'giant' or 'thumbs' as before, but accept others
-                      if src and src.endswith('.mp4'):
-                          if "giant." in src or "zippy." in src: # Zippy is another common one
-                               self.logger.spam(self.indent_2 + f"Found high-quality MP4 source: {src}")
-                               return src
-                          elif "thumbs." in src:
-                               self.logger.spam(self.indent_2 + f"Found thumbs MP4 source: {src}")
-                               return src # Return thumbs if giant isn't found
-                          else:
-                               # Found an MP4 source, maybe less preferred quality
-                               self.logger.spam(self.indent_2 + f"Found other MP4 source: {src}")
-                               return src # Return it as a last resort within <video> tags
-
-
-            # Fallback: Look for JSON data within script tags (sometimes contains URLs)
-            script_tags = soup.find_all('script')
-            for script in script_tags:
-                if script.string: # Check if script tag has content
-                    try:
-                        # Look for JSON structures that might contain URLs
-                        # This is highly specific to page structure and likely to break
-                        if 'contentUrl' in script.string:
-                             # Very basic search, might need regex for robustness
-                             match = re.search(r'"contentUrl"\s*:\s*"([^"]+\.mp4)"', script.string)
-                             if match:
-                                  url_found = match.group(1)
-                                  self.logger.spam(self.indent_2 + f"Found MP4 URL in script tag JSON: {url_found}")
-                                  return url_found
-                    except Exception:
-                         continue # Ignore errors parsing script content
-
-            self.logger.warning(self.indent_2 + f"Could not find a suitable .mp4 video source on page {url}")
+            # Stream the page and stop reading as soon as a video source shows up
+            with self.session.get(url, headers=headers, timeout=15, stream=True) as response:
+                response.raise_for_status() # Check for HTTP errors
+                extractor = EmbeddedVideoExtractor()
+                src, origin = extractor.extract(response.iter_content(EmbeddedVideoExtractor.CHUNK_SIZE))
+
+            if origin == "video":
+                self.logger.spam(self.indent_2 + f"Found MP4 source in <video> tag: {src}")
+                return src
+            elif origin == "script":
+                self.logger.spam(self.indent_2 + f"Found MP4 URL in script tag JSON: {src}")
+                return src
+
+            self.logger.warning(self.indent_2 + f"Could not find a suitable .mp4 video source on page {url} (read {extractor.bytes_read} bytes)")
             return "" # Return empty string if nothing found
 
         except requests.exceptions.RequestException as e:
@@ -995,7 +1143,6 @@ class SubmissionDownloader:
             self.print_formatted_error(e)
             return ""
         except Exception as e:
-            # Catch other errors like BeautifulSoup issues
             self.logger.error(self.indent_2 + f"An unexpected error occurred while scraping {url}")
             self.print_formatted_error(e)
             return ""
@@ -1023,25 +1170,46 @@ class SubmissionDownloader:
         return ".bin" # Or return None, or raise an error? Defaulting to .bin (binary data)
 
 
+    @staticmethod
+    def is_dead_link(url):
+        '''
+        Returns True if `url` is cached as a dead link by get_redirect_url
+        '''
+        return DiskCache.shared().get("redirects", url) is None
+
     def get_redirect_url(self, url):
         # Finds the *final* URL after following redirects.
+        # Results are cached on disk, including dead links (404/410), so those fail fast on later runs.
+        cache = DiskCache.shared()
+        cached_url = cache.get("redirects", url)
+        if cached_url is not DiskCache.MISS:
+            if cached_url is None:
+                self.logger.spam(self.indent_2 + f"{url} is cached as a dead link, skipping lookup.")
+            return cached_url
+
         try:
             headers = {'User-Agent': 'SavedditDownloader/1.0'}
             # Use HEAD request first (faster, less data) if server supports it well for redirects
             # Fallback to GET if HEAD fails or doesn't redirect properly
             try:
-                 response = requests.head(url, headers=headers, allow_redirects=True, timeout=10)
+                 response = self.session.head(url, headers=headers, allow_redirects=True, timeout=10)
                  response.raise_for_status() # Check for client/server errors on final URL
-                 return response.url
+                 final_url = response.url
             except requests.exceptions.RequestException as head_err:
                  self.logger.spam(f"HEAD request failed for {url} ({head_err}), trying GET.")
-                 response = requests.get(url, headers=headers, allow_redirects=True, timeout=15)
-                 response.raise_for_status()
-                 return response.url
+                 # Stream so that the connection is closed as soon as the headers are in, without reading the body
+                 with self.session.get(url, headers=headers, allow_redirects=True, timeout=15, stream=True) as response:
+                     response.raise_for_status()
+                     final_url = response.url
+            cache.set("redirects", url, final_url, SubmissionDownloader.REDIRECT_CACHE_TTL)
+            return final_url
 
         except requests.exceptions.RequestException as e:
             self.logger.error(self.indent_2 + f"Failed to connect or resolve redirects for {url}")
             self.print_formatted_error(e)
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if isinstance(e, requests.exceptions.HTTPError) and status in SubmissionDownloader.DEAD_LINK_STATUSES:
+                cache.set("redirects", url, None, SubmissionDownloader.REDIRECT_NEGATIVE_CACHE_TTL)
             return None
         except Exception as e:
              self.logger.error(self.indent_2 + f"Unexpected error getting redirect URL for {url}")
@@ -1143,8 +1311,10 @@ class SubmissionDownloader:
         # --- 3. Try Scraping the Final URL (Gfycat/Redgifs Page) ---
         # This is less reliable due to site changes but acts as a fallback.
         # Primarily useful if the URL is gfycat.com or redgifs.com domain
+        # Skipped for dead links - the page request would fail the same way
         domain = urllib.parse.urlparse(final_url).netloc.lower()
-        if "gfycat.com" in domain or "redgifs.com" in domain:
+        if (redirected_url or not SubmissionDownloader.is_dead_link(original_url)) and \
+                ("gfycat.com" in domain or "redgifs.com" in domain):
              self.logger.spam(self.indent_2 + f"Attempting to scrape page for video URL: {final_url}")
              embedded_video_url = self.get_gfycat_embedded_video_url(final_url) # Reusing the gfycat scraping logic
 
@@ -1203,14 +1373,8 @@ class SubmissionDownloader:
              self.logger.error(self.indent_2 + "Imgur Client ID not available. Cannot get album info.")
              return 0
 
-        request_url = f"https://api.imgur.com/3/album/{album_id}"
-        headers = {"Authorization": f"Client-ID {self.IMGUR_CLIENT_ID}"}
-
         try:
-            response = requests.get(request_url, headers=headers, timeout=15)
-            response.raise_for_status() # Raise error for 4xx/5xx responses
-
-            data = response.json()
+            data = self.imgur.get_album(album_id, timeout=15) # Raises for 4xx/5xx responses other than 404
             if data.get("success"):
                 count = data.get("data", {}).get("images_count", 0)
                 if count == 0:
@@ -1241,14 +1405,8 @@ class SubmissionDownloader:
              self.logger.error(self.indent_2 + "Imgur Client ID not available. Cannot get image meta.")
              return None
 
-        request_url = f"https://api.imgur.com/3/image/{image_id}"
-        headers = {"Authorization": f"Client-ID {self.IMGUR_CLIENT_ID}"}
-
         try:
-            response = requests.get(request_url, headers=headers, timeout=15)
-            response.raise_for_status()
-
-            data = response.json()
+            data = self.imgur.get_image(image_id, timeout=15)
             if data.get("success"):
                 return data.get("data") # Return the 'data' dictionary
             else:
@@ -1275,28 +1433,16 @@ class SubmissionDownloader:
              self.logger.error(self.indent_1 + "Cannot download Imgur album: Client ID missing.")
              return False
 
-        album_id = None
-        parsed_url = urllib.parse.urlparse(submission.url)
-        path_parts = parsed_url.path.strip('/').split('/')
-
-        # Expected path: /a/albumId or /gallery/galleryId
-        if len(path_parts) == 2 and path_parts[0] in ('a', 'gallery'):
-             album_id = path_parts[1]
-
+        album_id = self.get_imgur_album_id(submission.url)
         if not album_id:
             self.logger.error(self.indent_2 + f"Could not extract Imgur album ID from URL: {submission.url}")
             return False
 
         self.logger.spam(self.indent_2 + f"Processing Imgur album ID: {album_id}")
 
-        # Get album info using the API (includes image list)
-        request_url = f"https://api.imgur.com/3/album/{album_id}"
-        headers = {"Authorization": f"Client-ID {self.IMGUR_CLIENT_ID}"}
-
+        # Get album info using the API (includes image list, cached on disk)
         try:
-            response = requests.get(request_url, headers=headers, timeout=20)
-            response.raise_for_status()
-            album_data = response.json()
+            album_data = self.imgur.get_album(album_id, timeout=20)
 
             if not album_data.get("success"):
                 error_msg = album_data.get("data", {}).get("error", "Unknown API error")
@@ -1311,8 +1457,8 @@ class SubmissionDownloader:
             images_count = len(images)
             self.logger.spam(self.indent_2 + f"Imgur album has {images_count} image(s)/video(s)")
 
-            download_count = 0
-            for i, image_meta in tqdm(enumerate(images), total=images_count, bar_format='%s%s{l_bar}{bar:20}{r_bar}%s' % (self.indent_2, Fore.WHITE + Fore.LIGHTBLACK_EX, Fore.RESET), leave=False):
+            pending_items = [] # (label, url, save_path) tuples fetched concurrently below
+            for i, image_meta in enumerate(images):
                  image_url = image_meta.get("link")
                  image_id = image_meta.get("id")
                  image_type = image_meta.get("type", "image/jpeg").split('/')[1] # Default to jpeg if type missing
@@ -1324,11 +1470,10 @@ class SubmissionDownloader:
                  # Construct filename: index_imageId.extension
                  filename = f"{str(i).zfill(3)}_{image_id}.{image_type}"
                  save_path = os.path.join(output_dir, filename)
+                 pending_items.append((f"album item {i+1} ({image_id})", image_url, save_path))
 
-                 # Use download_direct_link method
-                 if self.download_direct_link(type('obj', (object,),{'url': image_url})(), save_path):
-                     download_count += 1
-                 # download_direct_link already logs errors on failure
+            # download_item already logs errors on failure
+            download_count = self.download_items_concurrently(pending_items, timeout=30)
 
             self.logger.spam(self.indent_2 + f"Finished processing Imgur album. Downloaded {download_count}/{images_count} items.")
             return True # Return True even if some downloads failed, as the process ran
@@ -1361,28 +1506,83 @@ class SubmissionDownloader:
             return False
 
 
-    def download_imgur_image(self, submission, output_dir):
-         # Handles single Imgur images/videos (not albums) identified by is_imgur_image
-         # Returns True on success, False on failure
-        if not self.IMGUR_CLIENT_ID:
-             self.logger.error(self.indent_1 + "Cannot download Imgur image/video: Client ID missing.")
-             return False
+    def get_imgur_album_id(self, url):
+        # Expected path: /a/albumId or /gallery/galleryId; None otherwise
+        path_parts = urllib.parse.urlparse(url).path.strip('/').split('/')
+        if len(path_parts) == 2 and path_parts[0] in ('a', 'gallery') and path_parts[1]:
+            return path_parts[1]
+        return None
 
-        # Extract image ID from URL (more robustly)
+    def get_imgur_image_id(self, url):
+        # Extract image ID from URL (more robustly); None if there is none
         # e.g., https://imgur.com/gallery/abcd -> abcd
         # e.g., https://imgur.com/abcd -> abcd
         # e.g., https://i.imgur.com/abcd.jpg -> abcd
-        image_id = None
-        parsed_url = urllib.parse.urlparse(submission.url)
-        path = parsed_url.path.strip('/')
-
+        path = urllib.parse.urlparse(url).path.strip('/')
         if path:
             # Handle direct image links (e.g., /abcd.jpg) or plain IDs (e.g., /abcd)
             potential_id = os.path.splitext(path.split('/')[-1])[0] # Get last part of path, remove extension
             # Basic sanity check for typical Imgur ID format (alphanumeric, usually 5 or 7 chars)
             if re.match(r'^[a-zA-Z0-9]{5,}$', potential_id):
-                 image_id = potential_id
+                return potential_id
+        return None
+
+    def get_imgur_direct_url(self, url):
+        # Returns a normalized https://i.imgur.com/<id>.<ext> URL if the link already identifies
+        # the asset and its extension, None for forms that need the API (imgur.com/<id>, .gifv, ...)
+        try:
+            parsed_url = urllib.parse.urlparse(url)
+            if parsed_url.netloc.lower() != 'i.imgur.com':
+                return None
+            name, ext = os.path.splitext(os.path.basename(parsed_url.path))
+            if ext.lower() not in ('.jpg', '.jpeg', '.png', '.gif', '.mp4', '.webp'):
+                return None
+            if not re.match(r'^[a-zA-Z0-9]{5,}$', name):
+                return None
+            return f"https://i.imgur.com/{name}{ext.lower()}"
+        except Exception:
+            return None
+
+    def verify_imgur_direct_url(self, url):
+        # Cheap HEAD check: the asset must still exist and actually be an image or a video.
+        # Deleted Imgur images redirect to i.imgur.com/removed.png instead of returning 404.
+        try:
+            headers = {'User-Agent': 'SavedditDownloader/1.0'}
+            response = self.session.head(url, headers=headers, allow_redirects=True, timeout=10)
+            if response.status_code != 200:
+                self.logger.spam(self.indent_2 + f"HEAD {url} returned status {response.status_code}")
+                return False
+            if urllib.parse.urlparse(response.url).path.endswith("/removed.png"):
+                self.logger.spam(self.indent_2 + f"Imgur reports {url} as removed")
+                return False
+            content_type = response.headers.get('content-type', '').lower()
+            if not (content_type.startswith('image/') or content_type.startswith('video/')):
+                self.logger.spam(self.indent_2 + f"HEAD {url} returned unexpected content-type: {content_type}")
+                return False
+            return True
+        except requests.exceptions.RequestException as e:
+            self.logger.spam(self.indent_2 + f"HEAD request failed for {url} ({e})")
+            return False
+
+    def download_imgur_image(self, submission, output_dir):
+         # Handles single Imgur images/videos (not albums) identified by is_imgur_image
+         # Returns True on success, False on failure
 
+        # Fast path: direct i.imgur.com links are downloaded without spending an API credit
+        direct_url = self.get_imgur_direct_url(submission.url)
+        if direct_url:
+            if self.verify_imgur_direct_url(direct_url):
+                self.logger.spam(self.indent_2 + f"This is a direct imgur media link, skipping the API: {direct_url}")
+                filename = os.path.basename(urllib.parse.urlparse(direct_url).path)
+                save_path = os.path.join(output_dir, filename)
+                return self.download_direct_link(type('obj', (object,),{'url': direct_url})(), save_path)
+            self.logger.spam(self.indent_2 + "Direct imgur link could not be verified, falling back to the API.")
+
+        if not self.IMGUR_CLIENT_ID:
+             self.logger.error(self.indent_1 + "Cannot download Imgur image/video: Client ID missing.")
+             return False
+
+        image_id = self.get_imgur_image_id(submission.url)
         if not image_id:
             self.logger.error(self.indent_2 + f"Could not extract valid Imgur image ID from URL: {submission.url}")
             return False
@@ -1445,10 +1645,18 @@ class SubmissionDownloader:
             # PRAW's limit parameter applies to the number of MoreComments objects replaced.
             # For true top-level comment limit, fetch and slice.
             self.logger.spam(self.indent_2 + "Fetching comments...")
-            submission.comments.replace_more(limit=None) # Replace *all* MoreComments objects first
+            if self.reddit_pool is not None:
+                # Rebind the submission to the client with the most remaining budget
+                def fetch_comments(reddit):
+                    rebound = reddit.submission(id=submission.id)
+                    rebound.comments.replace_more(limit=None)
+                    return rebound.comments.list()
+                all_comments = self.reddit_pool.call(fetch_comments)
+            else:
+                submission.comments.replace_more(limit=None) # Replace *all* MoreComments objects first
 
-            # Get the full list after replacing 'more' comments
-            all_comments = submission.comments.list()
+                # Get the full list after replacing 'more' comments
+                all_comments = submission.comments.list()
 
             if not all_comments:
                 self.logger.spam(self.indent_2 + "No comments found for this submission.")
@@ -1466,7 +1674,7 @@ class SubmissionDownloader:
 
 
             self.logger.spam(self.indent_2 + f"Processing {len(comments_to_process)} comments...")
-            for comment in tqdm(comments_to_process, total=len(comments_to_process), bar_format='%s%s{l_bar}{bar:20}{r_bar}%s' % (self.indent_2, Fore.WHITE + Fore.LIGHTBLACK_EX, Fore.RESET), leave=False):
+            for comment in comments_to_process:
                 # Check if it's a valid Comment object (not MoreComments that failed replacement)
                 if not isinstance(comment, praw.models.Comment):
                      self.logger.warning(self.indent_2 + f"Skipping non-comment object in list: {type(comment)}")
@@ -1505,8 +1713,7 @@ class SubmissionDownloader:
 
 
             # Write the collected comments to JSON file
-            with open(comments_json_path, 'w', encoding='utf-8') as file:
-                json.dump(comments_list, file, indent=2, ensure_ascii=False) # ensure_ascii=False for proper unicode
+            FileWriter.write_json(comments_json_path, comments_list, indent=2, ensure_ascii=False) # ensure_ascii=False for proper unicode
 
             self.logger.spam(self.indent_2 + f"Successfully saved {len(comments_list)} comments to {comments_json_path}")
             return True
@@ -1574,12 +1781,15 @@ class SubmissionDownloader:
                  submission_dict['gallery_data'] = submission.gallery_data
             if hasattr(submission, 'media_metadata'):
                  submission_dict['media_metadata'] = submission.media_metadata
+            if self.renditions:
+                 submission_dict['saveddit_renditions'] = self.renditions
+            if self.duplicates:
+                 submission_dict['saveddit_duplicates'] = self.duplicates
 
 
             # Write to file
-            with open(meta_json_path, 'w', encoding='utf-8') as file:
-                # Use default=str for any objects json can't serialize directly (like datetime if it sneakily appears)
-                json.dump(submission_dict, file, indent=2, ensure_ascii=False, default=str)
+            # Use default=str for any objects json can't serialize directly (like datetime if it sneakily appears)
+            FileWriter.write_json(meta_json_path, submission_dict, indent=2, ensure_ascii=False, default=str)
 
             return True
 
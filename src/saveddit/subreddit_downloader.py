@@ -1,10 +1,14 @@
-import coloredlogs
 from colorama import Fore
 import logging
-import verboselogs
 import os
-import praw
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
 from saveddit.configuration import ConfigurationLoader
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.profiler import Profiler
+from saveddit.reddit_client import RedditClientFactory, RedditClientPool
 from saveddit.submission_downloader import SubmissionDownloader
 from saveddit.subreddit_downloader_config import SubredditDownloaderConfig
 
@@ -18,31 +22,20 @@ class SubredditDownloader:
 
     REDDIT_CLIENT_ID = config['reddit_client_id']
     REDDIT_CLIENT_SECRET = config['reddit_client_secret']
+    REDDIT_CREDENTIALS = ConfigurationLoader.reddit_credentials(config)
     IMGUR_CLIENT_ID = config.get('imgur_client_id', None) # Use .get() to safely access optional key
 
-    def __init__(self, subreddit_name):
+    def __init__(self, subreddit_name, reddit=None):
+        '''
+        reddit: praw.Reddit instance to use (default: a pool of all the apps in user_config.yaml)
+        '''
         self.subreddit_name = subreddit_name
-        reddit = praw.Reddit(
-            client_id=SubredditDownloader.REDDIT_CLIENT_ID,
-            client_secret=SubredditDownloader.REDDIT_CLIENT_SECRET,
-            user_agent="saveddit (by /u/p_ranav)",
-        )
-        self.subreddit = reddit.subreddit(subreddit_name)
+        if reddit is None:
+            self.reddit_pool = RedditClientFactory.pool(SubredditDownloader.REDDIT_CREDENTIALS)
+        else:
+            self.reddit_pool = RedditClientPool([reddit])
 
-        self.logger = verboselogs.VerboseLogger(__name__)
-        level_styles = {
-            'critical': {'bold': True, 'color': 'red'},
-            'debug': {'color': 'green'},
-            'error': {'color': 'red'},
-            'info': {'color': 'white'},
-            'notice': {'color': 'magenta'},
-            'spam': {'color': 'white', 'faint': True},
-            'success': {'bold': True, 'color': 'green'},
-            'verbose': {'color': 'blue'},
-            'warning': {'color': 'yellow'}
-        }
-        coloredlogs.install(level='SPAM', logger=self.logger,
-                            fmt='%(message)s', level_styles=level_styles)
+        self.logger = Console.create_logger(__name__)
 
     def download(self, output_path, download_all_comments, categories=SubredditDownloaderConfig.DEFAULT_CATEGORIES, post_limit=SubredditDownloaderConfig.DEFAULT_POST_LIMIT, skip_videos=False, skip_meta=False, skip_comments=False):
         '''
@@ -54,7 +47,11 @@ class SubredditDownloader:
         root_dir = os.path.join(os.path.join(os.path.join(
             output_path, "www.reddit.com"), "r"), self.subreddit_name)
         categories = categories
-        
+        ArchiveLayout.for_output(output_path)
+        submission_config = {'imgur_client_id': SubredditDownloader.IMGUR_CLIENT_ID,
+                             'archive_index': ArchiveIndex.for_output(output_path),
+                             'reddit_pool': self.reddit_pool}
+
         if download_all_comments == False:
             comment_limit = 0
         elif download_all_comments == True:
@@ -64,11 +61,13 @@ class SubredditDownloader:
             self.logger.notice("Downloading from /r/" +
                                self.subreddit_name + "/" + c + "/")
             category_dir = os.path.join(root_dir, c)
-            if not os.path.exists(category_dir):
-                os.makedirs(category_dir)
-            category_function = getattr(self.subreddit, c)
+            FileWriter.ensure_dir(category_dir)
+            listing = self.reddit_pool.listing(
+                lambda reddit: getattr(reddit.subreddit(self.subreddit_name), c), post_limit)
 
-            for i, submission in enumerate(category_function(limit=post_limit)):
-                SubmissionDownloader(submission, i, self.logger, category_dir,
-                    skip_videos, skip_meta, skip_comments, comment_limit,
-                    {'imgur_client_id': SubredditDownloader.IMGUR_CLIENT_ID})
+            with ListingPrefetcher(listing) as submissions:
+                for i, submission in enumerate(submissions):
+                    SubmissionDownloader(submission, i, self.logger, category_dir,
+                        skip_videos, skip_meta, skip_comments, comment_limit,
+                        submission_config)
+            Profiler.checkpoint("/r/" + self.subreddit_name + "/" + c)
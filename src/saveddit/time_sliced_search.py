@@ -0,0 +1,117 @@
+import functools
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class TimeSlicedSearch:
+    '''
+    Walks the full history of a subreddit (or a search query within it) by searching
+    `timestamp:start..end` windows, working around the ~1000 items a single listing returns.
+
+    Each window is searched sorted by new. Reddit ends search listings well before the
+    cap at times (often around 250 items) without saying so, so a window is only done once
+    it comes back empty or its oldest result reaches the window's start. Otherwise the part
+    older than its oldest result is searched again: split in two when the window came back
+    full, so dense stretches of history end up in small windows and quiet ones in large
+    windows, or as one window when the listing just ended. Windows are searched in parallel.
+    '''
+    # Items a single listing returns at most; a window that returns this many is split
+    WINDOW_CAP = 1000
+
+    # Windows are not split below this span
+    MIN_WINDOW_SECONDS = 60
+
+    def __init__(self, reddit_pool, subreddit_name, query=None, include_nsfw=False, window_cap=WINDOW_CAP, logger=None):
+        self.reddit_pool = reddit_pool
+        self.subreddit_name = subreddit_name
+        self.query = query
+        self.include_nsfw = include_nsfw
+        self.window_cap = window_cap
+        self.logger = logger
+
+        self.windows_searched = 0
+        self.windows_split = 0
+        self.submissions_found = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def run(self, since, until, jobs, on_submission):
+        '''
+        Calls on_submission(submission) once for every submission created in [since, until]
+        (epoch seconds). on_submission is called from up to `jobs` threads at a time.
+        '''
+        windows = TimeSlicedSearch.split_window(since, until, jobs)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = {executor.submit(self._search_window, start, end, on_submission) for start, end in windows}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for start, end in future.result():
+                        pending.add(executor.submit(self._search_window, start, end, on_submission))
+
+    @staticmethod
+    def split_window(start, end, parts):
+        '''
+        Splits the inclusive range [start, end] into at most `parts` contiguous inclusive ranges
+        '''
+        span = end - start + 1
+        parts = max(1, min(parts, span // TimeSlicedSearch.MIN_WINDOW_SECONDS))
+        windows = []
+        for i in range(parts):
+            window_start = start + span * i // parts
+            window_end = start + span * (i + 1) // parts - 1
+            windows.append((window_start, window_end))
+        return windows
+
+    def cloudsearch_query(self, start, end):
+        timestamp = "timestamp:{}..{}".format(start, end)
+        if not self.query:
+            return timestamp
+        return "(and {} '{}')".format(timestamp, self.query.replace("\\", "\\\\").replace("'", "\\'"))
+
+    def _search_window(self, start, end, on_submission):
+        '''
+        Searches one window, hands new submissions to on_submission and returns the
+        windows still left to search
+        '''
+        query = self.cloudsearch_query(start, end)
+        params = {"include_over_18": "on"} if self.include_nsfw else None
+        listing = self.reddit_pool.listing(
+            lambda reddit: functools.partial(reddit.subreddit(self.subreddit_name).search, query,
+                                             sort="new", syntax="cloudsearch", time_filter="all"),
+            self.window_cap, params)
+
+        count = 0
+        oldest = None
+        for submission in listing:
+            count += 1
+            created_utc = int(submission.created_utc)
+            oldest = created_utc if oldest is None else min(oldest, created_utc)
+            with self._lock:
+                if submission.id in self._seen:
+                    continue
+                self._seen.add(submission.id)
+                self.submissions_found += 1
+            on_submission(submission)
+
+        with self._lock:
+            self.windows_searched += 1
+
+        if oldest is None or oldest <= start:
+            return []
+
+        # Possibly truncated: everything newer than `oldest` has been seen. `oldest` itself is
+        # searched again because more submissions may share that second
+        full = count >= self.window_cap
+        remaining_end = min(oldest, end)
+        if remaining_end >= end:
+            if full and self.logger:
+                self.logger.warning("More than " + str(self.window_cap) + " submissions at " +
+                                    str(end) + ", some were skipped")
+            remaining_end = end - 1
+        if remaining_end < start:
+            return []
+
+        with self._lock:
+            self.windows_split += 1
+        return TimeSlicedSearch.split_window(start, remaining_end, 2 if full else 1)
@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+import yaml
+from saveddit.console import Console
+from saveddit.metrics import Metrics
+
+
+class _TokenBucket:
+    '''
+    Bytes/s limit. Takes may overdraw the bucket (a 1 MB video chunk against a 500 KB/s
+    limit), and the next ones then wait until the debt is paid off.
+    '''
+    def __init__(self, rate):
+        self._lock = threading.Lock()
+        self.set_rate(rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = float(rate)
+            self.capacity = max(self.rate, 64 * 1024) # One second of burst
+
+    def take(self, count):
+        '''
+        Returns the number of seconds to wait before using `count` bytes
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= count
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class TransferScheduler:
+    '''
+    Schedules the media transfers of SubmissionDownloader (direct links, gallery and album
+    items, v.redd.it video and audio tracks), so that big video pulls don't starve small
+    image fetches and a run stays within a bandwidth budget:
+
+        max_per_host  {"default": 4, "v.redd.it": 2}      requests in flight per host
+        bandwidth     {"total": 5000000, "v.redd.it": ...}  bytes/s for all transfers, per host
+
+    Limits can be changed while a job runs by editing a YAML control file with these two
+    keys (checked every CONTROL_CHECK_SECONDS, or right away after SIGHUP); a key in the
+    file replaces the limits given on the command line, and removing it restores them.
+
+    Limits apply to the process: with -j, each worker process gets them.
+    '''
+    CONTROL_CHECK_SECONDS = 2.0
+
+    # How long a waiting transfer sleeps at most before looking at the limits again
+    MAX_WAIT_SECONDS = 1.0
+
+    UNITS = {"k": 1000, "m": 1000 ** 2, "g": 1000 ** 3}
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, max_per_host=None, bandwidth=None, control_path=None):
+        self.logger = Console.create_logger(__name__)
+        self.base_limits = {"max_per_host": dict(max_per_host or {}), "bandwidth": dict(bandwidth or {})}
+        self.control_path = os.path.abspath(os.path.expanduser(control_path)) if control_path else None
+        self.max_per_host = {}
+        self._buckets = {}
+        self._in_flight = {}
+        self._condition = threading.Condition()
+        self._control_mtime = None
+        self._control_checked = 0.0
+        self._reload_requested = False
+        self.apply(self.base_limits)
+        self.check_control_file(force=True)
+
+    @classmethod
+    def shared(cls):
+        '''
+        Returns the scheduler of the whole process (without limits unless one was installed)
+        '''
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def install(cls, scheduler):
+        with cls._shared_lock:
+            cls._shared = scheduler
+
+    @staticmethod
+    def parse_rate(value):
+        '''
+        Parses bytes/s such as 500000, "500K", "2.5M" or "1G"
+        '''
+        text = str(value).strip().lower()
+        for suffix in ("/s", "b"):
+            if text.endswith(suffix):
+                text = text[:-len(suffix)]
+        multiplier = TransferScheduler.UNITS.get(text[-1:], 1)
+        if text[-1:] in TransferScheduler.UNITS:
+            text = text[:-1]
+        rate = float(text) * multiplier
+        if rate <= 0:
+            raise ValueError("%s is not a positive rate" % value)
+        return rate
+
+    @staticmethod
+    def parse_limits(values, default_key, parse):
+        '''
+        Turns command line values such as ["4", "v.redd.it=2"] into {default_key: 4, "v.redd.it": 2}
+        '''
+        limits = {}
+        for value in values or []:
+            host, separator, limit = value.rpartition("=")
+            limits[host.lower() if separator else default_key] = parse(limit)
+        return limits
+
+    def apply(self, limits):
+        max_per_host = {host.lower(): int(limit) for host, limit in limits["max_per_host"].items()}
+        bandwidth = {host.lower(): TransferScheduler.parse_rate(rate) for host, rate in limits["bandwidth"].items()}
+        with self._condition:
+            self.max_per_host = max_per_host
+            for key in list(self._buckets):
+                if key not in bandwidth:
+                    del self._buckets[key]
+            for key, rate in bandwidth.items():
+                if key in self._buckets:
+                    self._buckets[key].set_rate(rate)
+                else:
+                    self._buckets[key] = _TokenBucket(rate)
+            self._condition.notify_all()
+
+    def request_reload(self, *args):
+        # Signal handler: only sets a flag, the transfers pick the new limits up
+        self._reload_requested = True
+
+    def check_control_file(self, force=False):
+        '''
+        Applies the control file's limits when it was changed, created or removed
+        '''
+        if self.control_path is None:
+            return
+        now = time.monotonic()
+        if not force and not self._reload_requested and now - self._control_checked < TransferScheduler.CONTROL_CHECK_SECONDS:
+            return
+        self._control_checked = now
+        try:
+            mtime = os.stat(self.control_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._control_mtime and not self._reload_requested:
+            return
+        self._reload_requested = False
+        self._control_mtime = mtime
+
+        limits = {key: dict(value) for key, value in self.base_limits.items()}
+        if mtime is not None:
+            try:
+                with open(self.control_path, "r") as f:
+                    control = yaml.safe_load(f) or {}
+                for key in limits:
+                    if key in control:
+                        value = control[key]
+                        # A bare value is the default (max_per_host) or total (bandwidth) limit
+                        limits[key] = dict(value) if isinstance(value, dict) else (
+                            {} if value is None else {"default" if key == "max_per_host" else "total": value})
+                self.apply(limits)
+            except Exception as e:
+                self.logger.error("Ignoring transfer control file " + self.control_path + ": " + str(e))
+                return
+        else:
+            self.apply(limits)
+        self.logger.notice("Transfer limits: max per host " + str(limits["max_per_host"] or "unlimited") +
+                           ", bandwidth " + str(limits["bandwidth"] or "unlimited"))
+
+    @contextmanager
+    def transfer(self, url):
+        '''
+        Waits for a free slot on the host of `url`, and yields a Transfer to report the bytes read with
+        '''
+        host = (urllib.parse.urlparse(url).hostname or "unknown").lower()
+        self.check_control_file()
+        started = time.perf_counter()
+        with self._condition:
+            while True:
+                limit = self.max_per_host.get(host, self.max_per_host.get("default"))
+                if not limit or self._in_flight.get(host, 0) < limit:
+                    break
+                self._condition.wait(TransferScheduler.MAX_WAIT_SECONDS)
+                self.check_control_file() # The condition's lock is reentrant
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        waited = time.perf_counter() - started
+        if waited > 0.001:
+            Metrics.shared().observe("saveddit_transfer_wait_seconds", waited, host=host, reason="slot")
+        try:
+            yield Transfer(self, host)
+        finally:
+            with self._condition:
+                self._in_flight[host] -= 1
+                self._condition.notify_all()
+
+    def throttle(self, host, count):
+        '''
+        Sleeps as long as reading `count` more bytes from `host` takes within the bandwidth limits
+        '''
+        buckets = self._buckets
+        if not buckets:
+            return
+        self.check_control_file()
+        wait = 0.0
+        for key in ("total", host):
+            bucket = buckets.get(key)
+            if bucket is not None:
+                wait = max(wait, bucket.take(count))
+        if wait > 0:
+            Metrics.shared().observe("saveddit_transfer_wait_seconds", wait, host=host, reason="bandwidth")
+            time.sleep(wait)
+
+
+class Transfer:
+    def __init__(self, scheduler, host):
+        self.scheduler = scheduler
+        self.host = host
+
+    def consume(self, count):
+        '''
+        Accounts for `count` bytes read, waiting as needed to stay within the bandwidth limits
+        '''
+        self.scheduler.throttle(self.host, count)
@@ -1,14 +1,19 @@
-import coloredlogs
 from colorama import Fore, Style
 from datetime import datetime, timezone
 import logging
-import verboselogs
 import getpass
 import json
 import os
 import praw
 from pprint import pprint
 import re
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.console import Console
+from saveddit.file_writer import FileWriter
+from saveddit.listing_prefetcher import ListingPrefetcher
+from saveddit.profiler import Profiler
+from saveddit.reddit_client import RedditClientFactory
 from saveddit.submission_downloader import SubmissionDownloader
 from saveddit.subreddit_downloader import SubredditDownloader
 import sys
@@ -37,21 +42,8 @@ class UserDownloader:
 
     IMGUR_CLIENT_ID = config['imgur_client_id']
 
-    def __init__(self):
-        self.logger = verboselogs.VerboseLogger(__name__)
-        level_styles = {
-            'critical': {'bold': True, 'color': 'red'},
-            'debug': {'color': 'green'},
-            'error': {'color': 'red'},
-            'info': {'color': 'white'},
-            'notice': {'color': 'magenta'},
-            'spam': {'color': 'white', 'faint': True},
-            'success': {'bold': True, 'color': 'green'},
-            'verbose': {'color': 'blue'},
-            'warning': {'color': 'yellow'}
-        }
-        coloredlogs.install(level='SPAM', logger=self.logger,
-                            fmt='%(message)s', level_styles=level_styles)
+    def __init__(self, reddit=None):
+        self.logger = Console.create_logger(__name__)
 
         if not UserDownloader.REDDIT_USERNAME:
             self.logger.error("`reddit_username` in user_config.yaml is empty")
@@ -68,13 +60,34 @@ class UserDownloader:
                     # saveddit user .... < password
                     REDDIT_PASSWORD = sys.stdin.readline().rstrip()
 
-        self.reddit = praw.Reddit(
-            client_id=UserDownloader.REDDIT_CLIENT_ID,
-            client_secret=UserDownloader.REDDIT_CLIENT_SECRET,
-            user_agent="saveddit (by /u/p_ranav)",
-            username=UserDownloader.REDDIT_USERNAME,
-            password=UserDownloader.REDDIT_PASSWORD
-        )
+        self.reddit = reddit
+        if self.reddit is None:
+            self.reddit = RedditClientFactory.get(UserDownloader.REDDIT_CLIENT_ID, UserDownloader.REDDIT_CLIENT_SECRET,
+                                                   UserDownloader.REDDIT_USERNAME, UserDownloader.REDDIT_PASSWORD)
+
+    def download(self, args):
+        '''
+        Runs the `saveddit user` subcommand selected in args for all of args.users
+        '''
+        self.download_user_meta(args)
+        if args.user_subparser_name == "comments":
+            self.download_comments(args)
+        elif args.user_subparser_name == "multireddits":
+            self.download_multireddits(args)
+        elif args.user_subparser_name == "submitted":
+            self.download_submitted(args)
+        elif args.user_subparser_name == "saved":
+            self.download_saved(args)
+        elif args.user_subparser_name == "upvoted":
+            self.download_upvoted(args)
+        elif args.user_subparser_name == "gilded":
+            self.download_gilded(args)
+        Profiler.checkpoint("user " + str(args.user_subparser_name))
+
+    def submission_config(self, output_path):
+        ArchiveLayout.for_output(output_path)
+        return {'imgur_client_id': UserDownloader.IMGUR_CLIENT_ID,
+                'archive_index': ArchiveIndex.for_output(output_path)}
 
     def download_user_meta(self, args):
         output_path = args.o
@@ -85,10 +98,9 @@ class UserDownloader:
             root_dir = os.path.join(os.path.join(os.path.join(
                 output_path, "www.reddit.com"), "u"), username)
 
-            if not os.path.exists(root_dir):
-                os.makedirs(root_dir)
+            FileWriter.ensure_dir(root_dir)
 
-            with open(os.path.join(root_dir, 'user.json'), 'w') as file:
+            with FileWriter.open(os.path.join(root_dir, 'user.json'), 'w') as file:
                 user_dict = {}
                 user_dict["comment_karma"] = user.comment_karma
                 user_dict["created_utc"] = int(user.created_utc)
@@ -124,8 +136,7 @@ class UserDownloader:
                 limit = args.l
 
                 comments_dir = os.path.join(root_dir, "comments")
-                if not os.path.exists(comments_dir):
-                    os.makedirs(comments_dir)
+                FileWriter.ensure_dir(comments_dir)
 
                 self.logger.verbose("Downloading comments sorted by " + sort)
                 category_function = getattr(user.comments, sort)
@@ -133,46 +144,46 @@ class UserDownloader:
                 category_dir = os.path.join(comments_dir, sort)
 
                 if category_function:
-                    if not os.path.exists(category_dir):
-                        os.makedirs(category_dir)
-                    for i, comment in enumerate(category_function(limit=limit)):
-                        prefix_str = '#' + str(i).zfill(3) + ' '
-                        self.indent_1 = ' ' * len(prefix_str) + "* "
-                        self.indent_2 = ' ' * len(self.indent_1) + "- "
-
-                        comment_body = comment.body
-                        comment_body = comment_body[0:32]
-                        comment_body = re.sub(r'\W+', '_', comment_body)
-                        comment_filename = str(i).zfill(3) + "_Comment_" + \
-                            comment_body + "..." + ".json"
-                        self.logger.spam(self.indent_1 + comment.id + ' - "' + comment.body[0:64].replace("\n", "").replace("\r", "")  + '..."')
-
-                        with open(os.path.join(category_dir, comment_filename), 'w') as file:
-                            comment_dict = {}
-                            try:
-                                if comment.author:
-                                    comment_dict["author"] = comment.author.name
-                                else:
-                                    comment_dict["author"] = None
-                                comment_dict["body"] = comment.body
-                                comment_dict["created_utc"] = int(comment.created_utc)
-                                comment_dict["distinguished"] = comment.distinguished
-                                comment_dict["downs"] = comment.downs
-                                comment_dict["edited"] = comment.edited
-                                comment_dict["id"] = comment.id
-                                comment_dict["is_submitter"] = comment.is_submitter
-                                comment_dict["link_id"] = comment.link_id
-                                comment_dict["parent_id"] = comment.parent_id
-                                comment_dict["permalink"] = comment.permalink
-                                comment_dict["score"] = comment.score
-                                comment_dict["stickied"] = comment.stickied
-                                comment_dict["subreddit_name_prefixed"] = comment.subreddit_name_prefixed
-                                comment_dict["subreddit_id"] = comment.subreddit_id
-                                comment_dict["total_awards_received"] = comment.total_awards_received
-                                comment_dict["ups"] = comment.ups
-                                file.write(json.dumps(comment_dict, indent=2))
-                            except Exception as e:
-                                self.print_formatted_error(e)
+                    FileWriter.ensure_dir(category_dir)
+                    with ListingPrefetcher(category_function(limit=limit)) as comments:
+                        for i, comment in enumerate(comments):
+                            prefix_str = '#' + str(i).zfill(3) + ' '
+                            self.indent_1 = ' ' * len(prefix_str) + "* "
+                            self.indent_2 = ' ' * len(self.indent_1) + "- "
+
+                            comment_body = comment.body
+                            comment_body = comment_body[0:32]
+                            comment_body = re.sub(r'\W+', '_', comment_body)
+                            comment_filename = str(i).zfill(3) + "_Comment_" + \
+                                comment_body + "..." + ".json"
+                            self.logger.spam(self.indent_1 + comment.id + ' - "' + comment.body[0:64].replace("\n", "").replace("\r", "")  + '..."')
+
+                            with FileWriter.open(os.path.join(category_dir, comment_filename), 'w') as file:
+                                comment_dict = {}
+                                try:
+                                    if comment.author:
+                                        comment_dict["author"] = comment.author.name
+                                    else:
+                                        comment_dict["author"] = None
+                                    comment_dict["body"] = comment.body
+                                    comment_dict["created_utc"] = int(comment.created_utc)
+                                    comment_dict["distinguished"] = comment.distinguished
+                                    comment_dict["downs"] = comment.downs
+                                    comment_dict["edited"] = comment.edited
+                                    comment_dict["id"] = comment.id
+                                    comment_dict["is_submitter"] = comment.is_submitter
+                                    comment_dict["link_id"] = comment.link_id
+                                    comment_dict["parent_id"] = comment.parent_id
+                                    comment_dict["permalink"] = comment.permalink
+                                    comment_dict["score"] = comment.score
+                                    comment_dict["stickied"] = comment.stickied
+                                    comment_dict["subreddit_name_prefixed"] = comment.subreddit_name_prefixed
+                                    comment_dict["subreddit_id"] = comment.subreddit_id
+                                    comment_dict["total_awards_received"] = comment.total_awards_received
+                                    comment_dict["ups"] = comment.ups
+                                    file.write(json.dumps(comment_dict, indent=2))
+                                except Exception as e:
+                                    self.print_formatted_error(e)
             except Exception as e:
                 self.logger.error("Unable to download comments for user `" + username + "` - " + str(e))
 
@@ -205,8 +216,7 @@ class UserDownloader:
                         name = multireddit.name
                         self.logger.notice("Downloading from /u/" + username + "/m/" + name)
                         multireddit_dir = os.path.join(root_dir, name)
-                        if not os.path.exists(multireddit_dir):
-                            os.makedirs(multireddit_dir)
+                        FileWriter.ensure_dir(multireddit_dir)
 
                         for category in categories:
 
@@ -216,15 +226,16 @@ class UserDownloader:
                             category_dir = os.path.join(multireddit_dir, category)
 
                             if category_function:
-                                for i, s in enumerate(category_function(limit=post_limit)):
-                                    try:
-                                        prefix_str = '#' + str(i).zfill(3) + ' '
-                                        self.indent_1 = ' ' * len(prefix_str) + "* "
-                                        self.indent_2 = ' ' * len(self.indent_1) + "- "
-                                        SubmissionDownloader(s, i, self.logger, category_dir, skip_videos, skip_meta, skip_comments, comment_limit,
-                                                                {'imgur_client_id': UserDownloader.IMGUR_CLIENT_ID})
-                                    except Exception as e:
-                                        self.logger.error(self.indent_2 + "Unable to download post #" + str(i) + " for user `" + username + "` from multireddit " + name + " - " + str(e))
+                                with ListingPrefetcher(category_function(limit=post_limit)) as submissions:
+                                    for i, s in enumerate(submissions):
+                                        try:
+                                            prefix_str = '#' + str(i).zfill(3) + ' '
+                                            self.indent_1 = ' ' * len(prefix_str) + "* "
+                                            self.indent_2 = ' ' * len(self.indent_1) + "- "
+                                            SubmissionDownloader(s, i, self.logger, category_dir, skip_videos, skip_meta, skip_comments, comment_limit,
+                                                                    self.submission_config(output_path))
+                                        except Exception as e:
+                                            self.logger.error(self.indent_2 + "Unable to download post #" + str(i) + " for user `" + username + "` from multireddit " + name + " - " + str(e))
             except Exception as e:
                 self.logger.error(self.indent_1 + "Unable to download multireddit posts for user `" + username + "` - " + str(e))
 
@@ -248,8 +259,7 @@ class UserDownloader:
                 comment_limit = 0 # top-level comments ONLY
 
                 submitted_dir = os.path.join(root_dir, "submitted")
-                if not os.path.exists(submitted_dir):
-                    os.makedirs(submitted_dir)
+                FileWriter.ensure_dir(submitted_dir)
 
                 self.logger.verbose("Downloading submissions sorted by " + sort)
                 category_function = getattr(user.submissions, sort)
@@ -257,15 +267,16 @@ class UserDownloader:
                 category_dir = os.path.join(submitted_dir, sort)
 
                 if category_function:
-                    for i, s in enumerate(category_function(limit=post_limit)):
-                        try:
-                            prefix_str = '#' + str(i).zfill(3) + ' '
-                            self.indent_1 = ' ' * len(prefix_str) + "* "
-                            self.indent_2 = ' ' * len(self.indent_1) + "- "
-                            SubmissionDownloader(s, i, self.logger, category_dir, skip_videos, skip_meta, skip_comments, comment_limit,
-                                                    {'imgur_client_id': UserDownloader.IMGUR_CLIENT_ID})
-                        except Exception as e:
-                            self.logger.error(self.indent_2 + "Unable to download post #" + str(i) + " for user `" + username + "` - " + str(e))
+                    with ListingPrefetcher(category_function(limit=post_limit)) as submissions:
+                        for i, s in enumerate(submissions):
+                            try:
+                                prefix_str = '#' + str(i).zfill(3) + ' '
+                                self.indent_1 = ' ' * len(prefix_str) + "* "
+                                self.indent_2 = ' ' * len(self.indent_1) + "- "
+                                SubmissionDownloader(s, i, self.logger, category_dir, skip_videos, skip_meta, skip_comments, comment_limit,
+                                                        self.submission_config(output_path))
+                            except Exception as e:
+                                self.logger.error(self.indent_2 + "Unable to download post #" + str(i) + " for user `" + username + "` - " + str(e))
             except Exception as e:
                 self.logger.error(self.indent_1 + "Unable to download submitted posts for user `" + username + "` - " + str(e))
 
@@ -288,18 +299,18 @@ class UserDownloader:
                 comment_limit = 0 # top-level comments ONLY
 
                 upvoted_dir = os.path.join(root_dir, "upvoted")
-                if not os.path.exists(upvoted_dir):
-                    os.makedirs(upvoted_dir)
-
-                for i, s in enumerate(user.upvoted(limit=post_limit)):
-                    try:
-                        prefix_str = '#' + str(i).zfill(3) + ' '
-                        self.indent_1 = ' ' * len(prefix_str) + "* "
-                        self.indent_2 = ' ' * len(self.indent_1) + "- "
-                        SubmissionDownloader(s, i, self.logger, upvoted_dir, skip_videos, skip_meta, skip_comments, comment_limit,
-                                                {'imgur_client_id': UserDownloader.IMGUR_CLIENT_ID})
-                    except Exception as e:
-                        self.logger.error(self.indent_2 + "Unable to download post #" + str(i) + " for user `" + username + "` - " + str(e))
+                FileWriter.ensure_dir(upvoted_dir)
+
+                with ListingPrefetcher(user.upvoted(limit=post_limit)) as submissions:
+                    for i, s in enumerate(submissions):
+                        try:
+                            prefix_str = '#' + str(i).zfill(3) + ' '
+                            self.indent_1 = ' ' * len(prefix_str) + "* "
+                            self.indent_2 = ' ' * len(self.indent_1) + "- "
+                            SubmissionDownloader(s, i, self.logger, upvoted_dir, skip_videos, skip_meta, skip_comments, comment_limit,
+                                                    self.submission_config(output_path))
+                        except Exception as e:
+                            self.logger.error(self.indent_2 + "Unable to download post #" + str(i) + " for user `" + username + "` - " + str(e))
             except Exception as e:
                 self.logger.error("Unable to download upvoted posts for user `" + username + "` - " + str(e))
 
@@ -322,36 +333,36 @@ class UserDownloader:
                 comment_limit = 0 # top-level comments ONLY
 
                 saved_dir = os.path.join(root_dir, "saved")
-                if not os.path.exists(saved_dir):
-                    os.makedirs(saved_dir)
-
-                for i, s in enumerate(user.saved(limit=post_limit)):
-                    try:
-                        prefix_str = '#' + str(i).zfill(3) + ' '
-                        self.indent_1 = ' ' * len(prefix_str) + "* "
-                        self.indent_2 = ' ' * len(self.indent_1) + "- "
-                        if isinstance(s, praw.models.Comment) and not skip_comments:
-                            self.logger.verbose(
-                                prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author) + " \"" + s.body[0:32].replace("\n", "").replace("\r", "") + "...\"")
-
-                            comment_body = s.body
-                            comment_body = comment_body[0:32]
-                            comment_body = re.sub(r'\W+', '_', comment_body)
-                            post_dir = str(i).zfill(3) + "_Comment_" + \
-                                comment_body + "..."
-                            submission_dir = os.path.join(saved_dir, post_dir)
-                            self.download_saved_comment(s, submission_dir)
-                        elif isinstance(s, praw.models.Comment):
-                            self.logger.verbose(
-                                prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author))
-                            self.logger.spam(self.indent_2 + "Skipping comment")
-                        elif isinstance(s, praw.models.Submission):
-                            SubmissionDownloader(s, i, self.logger, saved_dir, skip_videos, skip_meta, skip_comments, comment_limit,
-                                                {'imgur_client_id': UserDownloader.IMGUR_CLIENT_ID})
-                        else:
-                            pass
-                    except Exception as e:
-                        self.logger.error(self.indent_2 + "Unable to download #" + str(i) + " for user `" + username + "` - " + str(e))
+                FileWriter.ensure_dir(saved_dir)
+
+                with ListingPrefetcher(user.saved(limit=post_limit)) as submissions:
+                    for i, s in enumerate(submissions):
+                        try:
+                            prefix_str = '#' + str(i).zfill(3) + ' '
+                            self.indent_1 = ' ' * len(prefix_str) + "* "
+                            self.indent_2 = ' ' * len(self.indent_1) + "- "
+                            if isinstance(s, praw.models.Comment) and not skip_comments:
+                                self.logger.verbose(
+                                    prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author) + " \"" + s.body[0:32].replace("\n", "").replace("\r", "") + "...\"")
+
+                                comment_body = s.body
+                                comment_body = comment_body[0:32]
+                                comment_body = re.sub(r'\W+', '_', comment_body)
+                                post_dir = str(i).zfill(3) + "_Comment_" + \
+                                    comment_body + "..."
+                                submission_dir = os.path.join(saved_dir, post_dir)
+                                self.download_saved_comment(s, submission_dir)
+                            elif isinstance(s, praw.models.Comment):
+                                self.logger.verbose(
+                                    prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author))
+                                self.logger.spam(self.indent_2 + "Skipping comment")
+                            elif isinstance(s, praw.models.Submission):
+                                SubmissionDownloader(s, i, self.logger, saved_dir, skip_videos, skip_meta, skip_comments, comment_limit,
+                                                    self.submission_config(output_path))
+                            else:
+                                pass
+                        except Exception as e:
+                            self.logger.error(self.indent_2 + "Unable to download #" + str(i) + " for user `" + username + "` - " + str(e))
             except Exception as e:
                 self.logger.error("Unable to download saved for user `" + username + "` - " + str(e))
 
@@ -374,36 +385,36 @@ class UserDownloader:
                 comment_limit = 0 # top-level comments ONLY
 
                 saved_dir = os.path.join(root_dir, "gilded")
-                if not os.path.exists(saved_dir):
-                    os.makedirs(saved_dir)
-
-                for i, s in enumerate(user.gilded(limit=post_limit)):
-                    try:
-                        prefix_str = '#' + str(i).zfill(3) + ' '
-                        self.indent_1 = ' ' * len(prefix_str) + "* "
-                        self.indent_2 = ' ' * len(self.indent_1) + "- "
-                        if isinstance(s, praw.models.Comment) and not skip_comments:
-                            self.logger.verbose(
-                                prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author) + " \"" + s.body[0:32].replace("\n", "").replace("\r", "") + "...\"")
-
-                            comment_body = s.body
-                            comment_body = comment_body[0:32]
-                            comment_body = re.sub(r'\W+', '_', comment_body)
-                            post_dir = str(i).zfill(3) + "_Comment_" + \
-                                comment_body + "..."
-                            submission_dir = os.path.join(saved_dir, post_dir)
-                            self.download_saved_comment(s, submission_dir)
-                        elif isinstance(s, praw.models.Comment):
-                            self.logger.verbose(
-                                prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author))
-                            self.logger.spam(self.indent_2 + "Skipping comment")
-                        elif isinstance(s, praw.models.Submission):
-                            SubmissionDownloader(s, i, self.logger, saved_dir, skip_videos, skip_meta, skip_comments, comment_limit,
-                                                {'imgur_client_id': UserDownloader.IMGUR_CLIENT_ID})
-                        else:
-                            pass
-                    except Exception as e:
-                        self.logger.error(self.indent_2 + "Unable to download #" + str(i) + " for user `" + username + "` - " + str(e))
+                FileWriter.ensure_dir(saved_dir)
+
+                with ListingPrefetcher(user.gilded(limit=post_limit)) as submissions:
+                    for i, s in enumerate(submissions):
+                        try:
+                            prefix_str = '#' + str(i).zfill(3) + ' '
+                            self.indent_1 = ' ' * len(prefix_str) + "* "
+                            self.indent_2 = ' ' * len(self.indent_1) + "- "
+                            if isinstance(s, praw.models.Comment) and not skip_comments:
+                                self.logger.verbose(
+                                    prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author) + " \"" + s.body[0:32].replace("\n", "").replace("\r", "") + "...\"")
+
+                                comment_body = s.body
+                                comment_body = comment_body[0:32]
+                                comment_body = re.sub(r'\W+', '_', comment_body)
+                                post_dir = str(i).zfill(3) + "_Comment_" + \
+                                    comment_body + "..."
+                                submission_dir = os.path.join(saved_dir, post_dir)
+                                self.download_saved_comment(s, submission_dir)
+                            elif isinstance(s, praw.models.Comment):
+                                self.logger.verbose(
+                                    prefix_str + "Comment `" + str(s.id) + "` by " + str(s.author))
+                                self.logger.spam(self.indent_2 + "Skipping comment")
+                            elif isinstance(s, praw.models.Submission):
+                                SubmissionDownloader(s, i, self.logger, saved_dir, skip_videos, skip_meta, skip_comments, comment_limit,
+                                                    self.submission_config(output_path))
+                            else:
+                                pass
+                        except Exception as e:
+                            self.logger.error(self.indent_2 + "Unable to download #" + str(i) + " for user `" + username + "` - " + str(e))
             except Exception as e:
                 self.logger.error("Unable to download gilded for user `" + username + "` - " + str(e))
 
@@ -412,11 +423,10 @@ class UserDownloader:
             self.logger.error(self.indent_2 + line)
 
     def download_saved_comment(self, comment, output_dir):
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        FileWriter.ensure_dir(output_dir)
         self.logger.spam(
             self.indent_2 + "Saving comment.json to " + output_dir)
-        with open(os.path.join(output_dir, 'comments.json'), 'w') as file:
+        with FileWriter.open(os.path.join(output_dir, 'comments.json'), 'w') as file:
             comment_dict = {}
             try:
                 if comment.author:
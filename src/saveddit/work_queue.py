@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class WorkQueue:
+    '''
+    Queue of work units shared by a coordinator and any number of workers.
+
+    A unit is a JSON-serializable dict. Workers lease units for a limited time,
+    extend the lease with heartbeats while working, and mark them complete or
+    failed. Leases that are not renewed in time go back to the queue.
+
+    Backends are picked by URL scheme, see WorkQueue.open and WorkQueue.register_backend.
+    '''
+    MAX_ATTEMPTS = 3
+
+    _backends = {}
+
+    @classmethod
+    def register_backend(cls, scheme, backend_class):
+        '''
+        Makes `<scheme>://...` queue URLs open with backend_class(url)
+        '''
+        cls._backends[scheme] = backend_class
+
+    @classmethod
+    def open(cls, url):
+        '''
+        url: `sqlite:///path/to/queue.sqlite3`, a plain file path (SQLite), or a URL
+             whose scheme was registered with WorkQueue.register_backend
+        '''
+        scheme, separator, _ = url.partition("://")
+        if not separator:
+            return SQLiteWorkQueue(url)
+        if scheme not in cls._backends:
+            raise ValueError("No work queue backend registered for '" + scheme + "://' URLs")
+        return cls._backends[scheme](url)
+
+    def put(self, key, unit):
+        '''
+        Adds a unit unless a unit with the same key was queued before. Returns True if added
+        '''
+        raise NotImplementedError
+
+    def lease(self, worker_id, lease_seconds):
+        '''
+        Returns a (unit_id, unit) tuple leased to worker_id, or None if nothing is pending
+        '''
+        raise NotImplementedError
+
+    def heartbeat(self, unit_id, worker_id, lease_seconds):
+        '''
+        Extends a lease. Returns False if the lease was lost (expired and re-queued)
+        '''
+        raise NotImplementedError
+
+    def complete(self, unit_id, worker_id):
+        raise NotImplementedError
+
+    def fail(self, unit_id, worker_id, error):
+        '''
+        Re-queues the unit, or marks it failed after MAX_ATTEMPTS leases
+        '''
+        raise NotImplementedError
+
+    def requeue_expired(self):
+        '''
+        Puts units whose lease expired back in the queue. Returns the number of units re-queued
+        '''
+        raise NotImplementedError
+
+    def counts(self):
+        '''
+        Returns a dict of state -> number of units (pending, leased, done, failed)
+        '''
+        raise NotImplementedError
+
+
+class SQLiteWorkQueue(WorkQueue):
+    '''
+    WorkQueue stored in a SQLite file. Enough for several processes on one host,
+    or several hosts sharing a file system with working locks.
+    '''
+    def __init__(self, url):
+        path = url[len("sqlite://"):] if url.startswith("sqlite://") else url
+        path = os.path.expanduser(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "key TEXT NOT NULL UNIQUE, "
+                "payload TEXT NOT NULL, "
+                "state TEXT NOT NULL DEFAULT 'pending', "
+                "worker TEXT, "
+                "lease_expires REAL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS units_state ON units (state, id)")
+
+    def put(self, key, unit):
+        with self._lock:
+            cursor = self._connection.execute(
+                "INSERT OR IGNORE INTO units (key, payload) VALUES (?, ?)", (key, json.dumps(unit)))
+            return cursor.rowcount > 0
+
+    def lease(self, worker_id, lease_seconds):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT id, payload FROM units WHERE state = 'pending' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    self._connection.execute("COMMIT")
+                    return None
+                self._connection.execute(
+                    "UPDATE units SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE id = ?", (worker_id, time.time() + lease_seconds, row[0]))
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, unit_id, worker_id, lease_seconds):
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (time.time() + lease_seconds, unit_id, worker_id))
+            return cursor.rowcount > 0
+
+    def complete(self, unit_id, worker_id):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE units SET state = 'done', lease_expires = NULL, error = NULL WHERE id = ? AND worker = ?",
+                (unit_id, worker_id))
+
+    def fail(self, unit_id, worker_id, error):
+        with self._lock:
+            self._connection.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_expires = NULL, error = ? WHERE id = ? AND worker = ?",
+                (WorkQueue.MAX_ATTEMPTS, str(error), unit_id, worker_id))
+
+    def requeue_expired(self):
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "worker = NULL, lease_expires = NULL, error = 'lease expired' "
+                "WHERE state = 'leased' AND lease_expires < ?",
+                (WorkQueue.MAX_ATTEMPTS, time.time()))
+            return cursor.rowcount
+
+    def counts(self):
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        with self._lock:
+            for state, count in self._connection.execute("SELECT state, COUNT(*) FROM units GROUP BY state"):
+                counts[state] = count
+        return counts
+
+
+WorkQueue.register_backend("sqlite", SQLiteWorkQueue)
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+# The downloaders read ~/.saveddit/user_config.yaml when they are imported; point them at a
+# throwaway home so the tests never touch (or need) a real configuration or token cache
+HOME = tempfile.mkdtemp(prefix="saveddit-tests-home-")
+os.makedirs(os.path.join(HOME, ".saveddit"))
+with open(os.path.join(HOME, ".saveddit", "user_config.yaml"), "w") as f:
+    f.write("reddit_client_id: test\nreddit_client_secret: test\nreddit_username: ''\nimgur_client_id: ''\n")
+os.environ["HOME"] = HOME
@@ -0,0 +1,81 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.archive_migrator import ArchiveMigrator
+
+
+@pytest.fixture(autouse=True)
+def layout(monkeypatch):
+    monkeypatch.setattr(ArchiveLayout, "_outputs", {})
+    monkeypatch.setattr(ArchiveLayout, "layout", "flat")
+    monkeypatch.setattr(ArchiveLayout, "requested", None)
+
+
+def next_run(layout=None):
+    # A later process: nothing resolved yet
+    ArchiveLayout._outputs.clear()
+    ArchiveLayout.configure(layout)
+
+
+def test_first_download_saves_the_layout(tmp_path):
+    ArchiveLayout.configure("id")
+    assert ArchiveLayout.for_output(tmp_path) == "id"
+
+    next_run()
+    assert ArchiveLayout.for_output(tmp_path) == "id"
+    assert ArchiveLayout.layout == "id"
+    assert ArchiveLayout.saved(tmp_path) == "id"
+
+
+def test_new_output_defaults_to_flat(tmp_path):
+    ArchiveLayout.configure()
+    assert ArchiveLayout.for_output(tmp_path) == "flat"
+    assert ArchiveLayout.saved(tmp_path) == "flat"
+
+
+def test_other_layout_than_saved_fails(tmp_path):
+    ArchiveLayout.configure("month")
+    ArchiveLayout.for_output(tmp_path)
+
+    next_run("flat")
+    with pytest.raises(ValueError, match="migrate"):
+        ArchiveLayout.for_output(tmp_path)
+    assert ArchiveLayout.saved(tmp_path) == "month"
+
+
+def test_layout_of_earlier_runs_is_found_in_the_index(tmp_path):
+    ArchiveIndex.for_output(tmp_path).add(SimpleNamespace(id="abc12", created_utc=0, title="t"),
+                                          os.path.join(tmp_path, "www.reddit.com", "r", "pics", "new", "12", "abc12_t"))
+
+    ArchiveLayout.configure()
+    assert ArchiveLayout.for_output(tmp_path) == "id"
+    assert ArchiveLayout.saved(tmp_path) == "id"
+
+
+def save_flat_submission(output_path, submission_id):
+    submission_dir = os.path.join(output_path, "www.reddit.com", "r", "pics", "new", "000_title")
+    os.makedirs(submission_dir)
+    with open(os.path.join(submission_dir, "submission.json"), "w") as f:
+        json.dump({"id": submission_id, "created_utc": 1600000000}, f)
+    ArchiveIndex.for_output(output_path).add(SimpleNamespace(id=submission_id, created_utc=1600000000, title="title"),
+                                             submission_dir)
+
+
+def test_migrate_saves_the_layout(tmp_path):
+    ArchiveLayout.configure()
+    ArchiveLayout.for_output(tmp_path)
+    save_flat_submission(tmp_path, "abc12")
+
+    ArchiveMigrator(tmp_path, "month").migrate(dry_run=True)
+    assert ArchiveLayout.saved(tmp_path) == "flat"
+
+    assert ArchiveMigrator(tmp_path, "month").migrate() == 1
+    assert os.path.isdir(os.path.join(tmp_path, "www.reddit.com", "r", "pics", "new", "2020", "09", "abc12_title"))
+
+    next_run()
+    assert ArchiveLayout.for_output(tmp_path) == "month"
@@ -0,0 +1,50 @@
+import json
+from types import SimpleNamespace
+
+from saveddit.archive_refresher import ArchiveRefresher
+
+
+class FakeReddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+        self.requests = []
+
+    def info(self, fullnames):
+        self.requests.append(fullnames)
+        return [self.submissions[name[3:]] for name in fullnames if name[3:] in self.submissions]
+
+
+class FakePool:
+    def __init__(self, reddit):
+        self.reddit = reddit
+
+    def call(self, function):
+        return function(self.reddit)
+
+
+def save(output_path, name, meta):
+    submission_dir = output_path / name
+    submission_dir.mkdir(parents=True)
+    (submission_dir / "submission.json").write_text(json.dumps(meta))
+    return submission_dir
+
+
+def test_only_changed_fields_are_refreshed(tmp_path, monkeypatch):
+    monkeypatch.setattr(ArchiveRefresher, "BATCH_SIZE", 1)
+    changed = save(tmp_path, "r/pics/000_a", {"id": "a", "title": "Saved title", "score": 1})
+    unchanged = save(tmp_path, "r/pics/001_b", {"id": "b", "score": 7, **{
+        field: default for field, default in ArchiveRefresher.REFRESHED_FIELDS.items() if field != "score"}})
+    save(tmp_path, "r/pics/002_c", {"id": "c", "score": 3})
+    reddit = FakeReddit({
+        "a": SimpleNamespace(id="a", title="[deleted]", score=42, num_comments=5),
+        "b": SimpleNamespace(id="b", score=7),
+    })
+
+    assert ArchiveRefresher(tmp_path, FakePool(reddit), jobs=2).refresh() == 1
+
+    meta = json.loads((changed / "submission.json").read_text())
+    assert meta["title"] == "Saved title"
+    assert (meta["score"], meta["num_comments"]) == (42, 5)
+    assert "saveddit_refreshed_utc" in meta
+    assert "saveddit_refreshed_utc" not in json.loads((unchanged / "submission.json").read_text())
+    assert sorted(reddit.requests) == [["t3_a"], ["t3_b"], ["t3_c"]]
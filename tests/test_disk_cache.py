@@ -0,0 +1,27 @@
+import time
+
+from saveddit.disk_cache import DiskCache
+
+
+def test_miss_and_negative_entries_are_told_apart(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("redirects", "dead", None, 60)
+
+    assert cache.get("redirects", "dead") is None
+    assert cache.get("redirects", "unknown") is DiskCache.MISS
+    assert cache.get("imgur_album", "dead") is DiskCache.MISS
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("imgur_album", "abc", {"success": True}, 60)
+    assert cache.get("imgur_album", "abc") == {"success": True}
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("imgur_album", "abc") is DiskCache.MISS
+
+
+def test_entries_persist_across_instances(tmp_path):
+    DiskCache(str(tmp_path / "cache.sqlite3")).set("imgur_image", "abc", [1, 2], 60)
+    assert DiskCache(str(tmp_path / "cache.sqlite3")).get("imgur_image", "abc") == [1, 2]
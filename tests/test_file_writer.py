@@ -0,0 +1,64 @@
+import os
+
+from saveddit.file_writer import FileWriter
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_open_replaces_file_only_on_success(tmp_path):
+    path = tmp_path / "a.txt"
+    write(path, b"old")
+
+    try:
+        with FileWriter.open(path) as f:
+            f.write(b"partial")
+            raise RuntimeError("interrupted")
+    except RuntimeError:
+        pass
+
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["a.txt"]
+
+
+def test_link_replaces_path_with_hard_link(tmp_path):
+    source, path = tmp_path / "source.png", tmp_path / "copy.png"
+    write(source, b"original")
+    write(path, b"repost")
+
+    FileWriter.link(source, path)
+
+    assert os.path.samefile(source, path)
+    assert path.read_bytes() == b"original"
+    assert sorted(os.listdir(tmp_path)) == ["copy.png", "source.png"]
+
+
+def test_link_to_same_inode_leaves_no_temp_file(tmp_path):
+    source, path = tmp_path / "source.png", tmp_path / "copy.png"
+    write(source, b"original")
+    os.link(source, path)
+
+    FileWriter.link(source, path)
+    FileWriter.link(source, source)
+
+    assert os.path.samefile(source, path)
+    assert sorted(os.listdir(tmp_path)) == ["copy.png", "source.png"]
+
+
+def test_commit_renames_staging_dir_and_replaces(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileWriter, "fsync", False)
+    final_dir = tmp_path / "000_submission"
+
+    staging_dir = FileWriter.begin(final_dir)
+    write(os.path.join(staging_dir, "submission.json"), b"{}")
+    FileWriter.commit(staging_dir, final_dir)
+    assert os.listdir(final_dir) == ["submission.json"]
+
+    staging_dir = FileWriter.begin(final_dir)
+    write(os.path.join(staging_dir, "comments.json"), b"[]")
+    FileWriter.commit(staging_dir, final_dir, replace=True)
+
+    assert os.listdir(final_dir) == ["comments.json"]
+    assert os.listdir(tmp_path) == ["000_submission"]
@@ -0,0 +1,104 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from saveddit.archive_index import ArchiveIndex
+from saveddit.image_deduplicator import ImageDeduplicator, dhash_images
+from saveddit.image_hash_index import ImageHashIndex
+
+
+@pytest.fixture
+def deduplicator(monkeypatch):
+    monkeypatch.setattr(ImageDeduplicator, "max_distance", ImageDeduplicator.DEFAULT_MAX_DISTANCE)
+    # Hashes in the test process rather than a worker pool
+    monkeypatch.setattr(ImageDeduplicator, "hash_files", staticmethod(dhash_images))
+    return ImageDeduplicator
+
+
+def save_image(submission_dir, name, size=(64, 48), fmt="PNG"):
+    files_dir = os.path.join(submission_dir, "files")
+    os.makedirs(files_dir, exist_ok=True)
+    image = Image.new("L", size)
+    width, height = size
+    image.putdata([255 * x // width // 2 + 255 * (y * y) // (height * height) // 2
+                   for y in range(height) for x in range(width)])
+    path = os.path.join(files_dir, name)
+    image.save(path, fmt)
+    return path
+
+
+def save_submission(archive_index, submission_id, name, **kwargs):
+    submission_dir = os.path.join(archive_index.output_path, submission_id)
+    path = save_image(submission_dir, name, **kwargs)
+    archive_index.add(SimpleNamespace(id=submission_id, title=submission_id), submission_dir)
+    return submission_dir, path
+
+
+def files(submission_dir):
+    return sorted(os.listdir(os.path.join(submission_dir, "files")))
+
+
+def test_repost_is_linked_to_the_original(tmp_path, deduplicator):
+    archive_index = ArchiveIndex.for_output(tmp_path)
+    original_dir, original = save_submission(archive_index, "abc", "000_a.png")
+    assert deduplicator.dedupe(archive_index, "abc", original_dir) == {}
+
+    # Same picture, resized and recompressed
+    repost_dir, repost = save_submission(archive_index, "def", "000_b.jpg", size=(128, 96), fmt="JPEG")
+    duplicates = deduplicator.dedupe(archive_index, "def", repost_dir)
+
+    assert list(duplicates) == ["files/000_b.jpg"]
+    assert duplicates["files/000_b.jpg"]["submission_id"] == "abc"
+    assert duplicates["files/000_b.jpg"]["file"] == "files/000_a.png"
+    assert os.path.samefile(original, repost)
+    assert files(repost_dir) == ["000_b.jpg"]
+
+
+def test_dedupe_again_does_not_match_the_image_itself(tmp_path, deduplicator):
+    archive_index = ArchiveIndex.for_output(tmp_path)
+    submission_dir, _ = save_submission(archive_index, "abc", "000_a.png")
+
+    assert deduplicator.dedupe(archive_index, "abc", submission_dir) == {}
+    assert deduplicator.dedupe(archive_index, "abc", submission_dir) == {}
+
+    assert files(submission_dir) == ["000_a.png"]
+    assert len(ImageHashIndex.for_output(tmp_path)) == 1
+
+
+def test_dedupe_again_keeps_reporting_linked_images(tmp_path, deduplicator):
+    archive_index = ArchiveIndex.for_output(tmp_path)
+    original_dir, _ = save_submission(archive_index, "abc", "000_a.png")
+    repost_dir, _ = save_submission(archive_index, "def", "000_b.png")
+    deduplicator.dedupe(archive_index, "abc", original_dir)
+    first = deduplicator.dedupe(archive_index, "def", repost_dir)
+
+    assert deduplicator.dedupe(archive_index, "def", repost_dir) == first
+    assert files(repost_dir) == ["000_b.png"]
+    assert len(ImageHashIndex.for_output(tmp_path)) == 1
+
+
+def test_single_worker_hashes_in_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageDeduplicator, "workers", 1)
+    monkeypatch.setattr(ImageDeduplicator, "_pool", None)
+    path = save_image(str(tmp_path), "000_a.png")
+
+    assert ImageDeduplicator.hash_files([path]) == dhash_images([path])
+    assert ImageDeduplicator._pool is None
+
+
+def test_shutdown_stops_the_hashing_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(ImageDeduplicator, "workers", 2)
+    monkeypatch.setattr(ImageDeduplicator, "_pool", None)
+    path = save_image(str(tmp_path), "000_a.png")
+    ImageDeduplicator.hash_files([path])
+    pool = ImageDeduplicator._pool
+
+    ImageDeduplicator.shutdown()
+
+    assert ImageDeduplicator._pool is None
+    with pytest.raises(RuntimeError):
+        pool.submit(dhash_images, [path])
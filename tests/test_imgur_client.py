@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from saveddit.disk_cache import DiskCache
+from saveddit.http_session import HttpSession
+from saveddit.imgur_client import ImgurClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = headers or {}
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def imgur(tmp_path):
+    return ImgurClient("client", cache=DiskCache(str(tmp_path / "cache.sqlite3")))
+
+
+def serve(monkeypatch, *responses):
+    session = FakeSession(responses)
+    monkeypatch.setattr(HttpSession, "shared", classmethod(lambda cls: session))
+    return session
+
+
+def test_responses_are_cached(imgur, monkeypatch):
+    session = serve(monkeypatch, FakeResponse(200, {"success": True, "data": {"link": "https://i.imgur.com/abcde.jpg"}}))
+    assert not imgur.has_image("abcde")
+
+    first = imgur.get_image("abcde")
+    assert imgur.has_image("abcde")
+    assert imgur.get_image("abcde") == first
+    assert session.urls == ["https://api.imgur.com/3/image/abcde"]
+
+
+def test_not_found_is_negative_cached(imgur, monkeypatch):
+    session = serve(monkeypatch, FakeResponse(404))
+
+    assert imgur.get_album("gone")["status"] == 404
+    assert imgur.get_album("gone")["status"] == 404
+    assert imgur.has_album("gone")
+    assert len(session.urls) == 1
+
+
+def test_failed_responses_are_not_cached(imgur, monkeypatch):
+    serve(monkeypatch, FakeResponse(200, {"success": False, "data": {"error": "Over capacity"}}))
+
+    imgur.get_album("busy")
+    assert not imgur.has_album("busy")
+    assert not imgur.has_album(None)
+
+
+def test_credits_are_tracked_across_clients(imgur, monkeypatch):
+    serve(monkeypatch, FakeResponse(200, {"success": True, "data": {}}, headers={
+        "X-RateLimit-ClientRemaining": "100",
+        "X-RateLimit-UserRemaining": "1000",
+        "X-RateLimit-UserReset": str(int(time.time()) + 600),
+    }))
+    assert not imgur.credits_low()
+
+    imgur.get_image("abcde")
+
+    assert imgur.credits_low()
+    assert ImgurClient("client", cache=imgur.cache).credits_low()
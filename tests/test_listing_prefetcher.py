@@ -0,0 +1,36 @@
+import itertools
+
+import pytest
+
+from saveddit.listing_prefetcher import ListingPrefetcher
+
+
+def test_items_are_yielded_in_order():
+    with ListingPrefetcher(range(250)) as items:
+        assert list(items) == list(range(250))
+
+
+def test_producer_stops_when_the_consumer_fails():
+    with pytest.raises(RuntimeError):
+        with ListingPrefetcher(itertools.count()) as items:
+            for item in items:
+                if item == 3:
+                    raise RuntimeError("download failed")
+    items._thread.join(5)
+    assert not items._thread.is_alive()
+
+
+def test_producer_stops_when_closed_before_iterating():
+    prefetcher = ListingPrefetcher(itertools.count())
+    prefetcher.close()
+    prefetcher._thread.join(5)
+    assert not prefetcher._thread.is_alive()
+
+
+def test_depth_is_configurable(monkeypatch):
+    monkeypatch.setattr(ListingPrefetcher, "pages", ListingPrefetcher.DEFAULT_PAGES)
+    ListingPrefetcher.configure(5)
+    with ListingPrefetcher([]) as items:
+        assert items._queue.maxsize == 5 * ListingPrefetcher.PAGE_SIZE
+    with pytest.raises(ValueError):
+        ListingPrefetcher.configure(0)
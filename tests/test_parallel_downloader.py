@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from saveddit.archive_index import ArchiveIndex
+from saveddit.console import Console
+from saveddit.disk_cache import DiskCache
+from saveddit.file_writer import FileWriter
+from saveddit.http_session import HttpSession
+from saveddit.metrics import Metrics
+from saveddit.parallel_downloader import _init_worker
+from saveddit.rate_limiter import RateLimiter
+
+pytestmark = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+
+
+def _worker(log_queue, rate_limiter, results):
+    _init_worker(log_queue, rate_limiter)
+    Metrics.shared().inc("saveddit_submissions_total", handler="test", outcome="ok")
+    Console.create_logger("saveddit.tests").error("logged from a worker")
+    FileWriter.forget("/nonexistent")
+    results.put(Metrics.shared().snapshot(reset=True))
+
+
+def test_worker_forked_while_locks_are_held_does_not_hang():
+    context = multiprocessing.get_context("fork")
+    Console.create_logger("saveddit.tests")
+    held, release = threading.Event(), threading.Event()
+
+    def hold_locks():
+        # Like the progress, log listener and textfile threads that run while workers are forked
+        with Metrics.shared()._lock, Console.output_lock, Console._lock, FileWriter._lock:
+            held.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold_locks, daemon=True)
+    thread.start()
+    held.wait()
+    results = context.Queue()
+    worker = context.Process(target=_worker, args=(context.Queue(), RateLimiter(context=context), results))
+    try:
+        worker.start()
+        worker.join(30)
+        assert worker.exitcode == 0, "worker deadlocked"
+        assert results.get(timeout=5)
+    finally:
+        if worker.is_alive():
+            worker.kill()
+        release.set()
+        thread.join()
+
+
+def _use_connections(output_path, cache_path, inherited, results):
+    index = ArchiveIndex.for_output(output_path)
+    cache = DiskCache.shared(cache_path)
+    index.add(SimpleNamespace(id="def34", created_utc=0, title="t"), output_path + "/def34")
+    cache.set("tests", "child", 1, 60)
+    results.put(index is not inherited[0] and cache is not inherited[1] and index.contains("abc12"))
+
+
+def test_worker_opens_its_own_sqlite_connections(tmp_path):
+    context = multiprocessing.get_context("fork")
+    index = ArchiveIndex.for_output(tmp_path)
+    cache = DiskCache.shared(str(tmp_path / "cache.sqlite3"))
+    index.add(SimpleNamespace(id="abc12", created_utc=0, title="t"), str(tmp_path / "abc12"))
+    results = context.Queue()
+
+    worker = context.Process(target=_use_connections,
+                             args=(str(tmp_path), str(tmp_path / "cache.sqlite3"), (index, cache), results))
+    worker.start()
+    worker.join(30)
+
+    assert worker.exitcode == 0
+    assert results.get(timeout=5)
+    assert index.contains("def34")
+    assert cache.get("tests", "child") == 1
+
+
+def _report_session(inherited, results):
+    results.put(HttpSession.shared() is not inherited)
+
+
+def test_worker_opens_its_own_http_connections():
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    worker = context.Process(target=_report_session, args=(HttpSession.shared(), results))
+    worker.start()
+    worker.join(30)
+
+    assert worker.exitcode == 0
+    assert results.get(timeout=5)
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from saveddit import profiler as profiler_module
+from saveddit.profiler import Profiler
+
+
+def busy_stage():
+    with Profiler.stage("direct_image"):
+        return sum(i * i for i in range(10000))
+
+
+def run_threads(count=3):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(busy_stage())) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@pytest.mark.parametrize("mode", Profiler.MODES)
+def test_profile_of_threaded_run_is_written(tmp_path, mode):
+    profiler = Profiler(tmp_path, mode)
+    profiler.start()
+    try:
+        assert len(run_threads()) == 3
+    finally:
+        paths = profiler.stop()
+
+    assert str(tmp_path / "profile.txt") in paths
+    assert (tmp_path / "profile.txt").read_text()
+
+
+class SingleProfile:
+    '''
+    Stands in for cProfile.Profile on Python 3.12+, where only one profiler can be enabled at a time
+    '''
+    enabled = 0
+
+    def enable(self):
+        if SingleProfile.enabled:
+            raise ValueError("Another profiling tool is already active")
+        SingleProfile.enabled += 1
+
+    def disable(self):
+        SingleProfile.enabled -= 1
+
+    def snapshot_stats(self):
+        self.stats = {("submission_downloader.py", 1, "classify_link"): (1, 1, 0.0, 0.0, {})}
+
+
+def test_cprofile_enables_one_profiler_on_python_3_12(tmp_path, monkeypatch):
+    monkeypatch.setattr(Profiler, "PROFILE_PER_THREAD", False)
+    monkeypatch.setattr(profiler_module.cProfile, "Profile", SingleProfile)
+    profiler = Profiler(tmp_path, "cprofile")
+    profiler.start()
+    try:
+        assert len(run_threads()) == 3
+    finally:
+        profiler.stop()
+
+    assert len(profiler._profiles) == 1
+    assert SingleProfile.enabled == 0
+    assert "cProfile of all threads" in (tmp_path / "profile.txt").read_text()
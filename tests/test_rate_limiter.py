@@ -0,0 +1,56 @@
+import multiprocessing
+import time
+
+import pytest
+
+from saveddit.rate_limiter import RateLimiter
+from saveddit.reddit_client import create_reddit
+
+
+def timed(function, *args, **kwargs):
+    started = time.monotonic()
+    function(*args, **kwargs)
+    return time.monotonic() - started
+
+
+def test_every_key_has_its_own_bucket():
+    limiter = RateLimiter(rate=5, burst=1)
+    limiter.acquire(key="app1")
+
+    assert timed(limiter.acquire, key="app2") < 0.1
+    assert timed(limiter.acquire, key="app1") > 0.1
+
+
+def test_keys_beyond_the_buckets_share_the_last_one():
+    limiter = RateLimiter(rate=5, burst=1, max_keys=2)
+    limiter.acquire(key="app1")
+    limiter.acquire(key="app2")
+
+    assert timed(limiter.acquire, key="app3") > 0.1
+
+
+def _acquire(limiter, key):
+    limiter.acquire(key=key)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_bucket_is_shared_with_worker_processes():
+    context = multiprocessing.get_context("fork")
+    limiter = RateLimiter(rate=5, burst=1, context=context)
+    worker = context.Process(target=_acquire, args=(limiter, "app1"))
+    worker.start()
+    worker.join(30)
+    assert worker.exitcode == 0
+
+    assert timed(limiter.acquire, key="app2") < 0.1
+    assert timed(limiter.acquire, key="app1") > 0.1
+
+
+def test_requestor_takes_from_the_bucket_of_its_client(monkeypatch):
+    limiter = RateLimiter(rate=5, burst=1)
+    monkeypatch.setattr(RateLimiter, "shared", limiter)
+
+    requestor = create_reddit("app1", "secret")._core._authorizer._authenticator._requestor
+
+    assert requestor.rate_limiter is limiter
+    assert requestor.client_id == "app1"
@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+import types
+from types import SimpleNamespace
+
+import prawcore
+import pytest
+from prawcore.exceptions import TooManyRequests
+
+from saveddit.reddit_client import RedditClientFactory, RedditClientPool, SavedditRequestor, TokenCache, create_reddit
+
+
+def read_only_authorizer(posts):
+    '''
+    A prawcore ReadOnlyAuthorizer whose token requests are answered without the network
+    '''
+    authenticator = prawcore.TrustedAuthenticator(requestor=prawcore.Requestor(user_agent="saveddit tests"),
+                                                  client_id="id", client_secret="secret")
+
+    def post(url, **data):
+        posts.append(url)
+        return SimpleNamespace(json=lambda: {"access_token": "token" + str(len(posts)), "expires_in": 3600, "scope": "*"})
+
+    authenticator._post = post
+    return prawcore.ReadOnlyAuthorizer(authenticator=authenticator)
+
+
+def test_token_is_reused_by_the_next_run(tmp_path):
+    posts = []
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    key = TokenCache.key("id", None, "read_only")
+
+    first = read_only_authorizer(posts)
+    cache.attach(first, key)
+    first.refresh()
+    saved = json.loads((tmp_path / "tokens.json").read_text())[key]
+    assert saved["access_token"] == "token1"
+    assert abs(saved["expires_at"] - (time.time() + 3610)) < 5
+
+    # A later process: a new authorizer starts out with the cached token
+    second = read_only_authorizer(posts)
+    TokenCache(str(tmp_path / "tokens.json")).attach(second, key)
+    assert second.is_valid()
+    assert second.access_token == "token1"
+    assert len(posts) == 1
+
+
+def test_expired_tokens_are_not_loaded(tmp_path):
+    cache = TokenCache(str(tmp_path / "tokens.json"))
+    cache.save("soon", {"access_token": "a", "expires_at": time.time() + 10, "scopes": ["*"]})
+    cache.save("later", {"access_token": "b", "expires_at": time.time() + 3600, "scopes": ["*"]})
+
+    assert cache.load("soon") is None
+    assert cache.load("later")["access_token"] == "b"
+
+
+def test_token_cache_attaches_to_new_clients(tmp_path, monkeypatch):
+    monkeypatch.setattr(RedditClientFactory, "token_cache", TokenCache(str(tmp_path / "tokens.json")))
+    reddit = create_reddit("id", "secret")
+
+    RedditClientFactory._attach_token_cache(reddit, "id", None)
+
+    # The bound method was wrapped by TokenCache.attach
+    assert isinstance(reddit._read_only_core._authorizer.refresh, types.FunctionType)
+
+
+class FakeReddit:
+    def __init__(self, name, remaining=None):
+        self.name = name
+        self.auth = SimpleNamespace(limits={"remaining": remaining, "reset_timestamp": time.time() + 600})
+
+
+def test_pool_fails_over_on_429():
+    response = SimpleNamespace(status_code=429, headers={}, text="")
+    busy, idle = FakeReddit("busy", remaining=500), FakeReddit("idle", remaining=100)
+    pool = RedditClientPool([busy, idle])
+    called = []
+
+    def function(reddit):
+        called.append(reddit.name)
+        if reddit is busy:
+            raise TooManyRequests(response)
+        return reddit.name
+
+    assert pool.call(function) == "idle"
+    assert called == ["busy", "idle"]
+    # Benched until its quota resets
+    assert pool.best() is idle
+
+
+def test_pool_raises_when_every_client_is_throttled():
+    response = SimpleNamespace(status_code=429, headers={}, text="")
+    pool = RedditClientPool([FakeReddit("a"), FakeReddit("b")])
+
+    def function(reddit):
+        raise TooManyRequests(response)
+
+    with pytest.raises(TooManyRequests):
+        pool.call(function)
+
+
+def test_retried_statuses_match_prawcore():
+    # prawcore raises TooManyRequests on a 429 rather than retrying it
+    assert 429 not in SavedditRequestor.RETRIED_STATUSES
+    assert SavedditRequestor.RETRIED_STATUSES == set(prawcore.sessions.Session.RETRY_STATUSES)
+
+
+def test_requests_of_one_client_are_serialized(monkeypatch):
+    active, overlaps = [], []
+    lock = threading.Lock()
+
+    def request_with_retries(self, **kwargs):
+        with lock:
+            active.append(self)
+            overlaps.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(self)
+        return {}
+
+    monkeypatch.setattr(prawcore.sessions.Session, "_request_with_retries", request_with_retries)
+    shared, other = create_reddit("id", "secret"), create_reddit("other", "secret")
+    threads = [threading.Thread(target=reddit._core.request, kwargs={"method": "GET", "path": "/api/v1/me"})
+               for reddit in [shared] * 6 + [other] * 6]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(overlaps) == 12
+    # Never two requests of one client at a time, but the two clients run in parallel
+    assert max(overlaps) == 2
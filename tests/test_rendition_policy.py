@@ -0,0 +1,42 @@
+import pytest
+
+from saveddit.rendition_policy import RenditionPolicy
+
+PREVIEW = {"images": [{
+    "source": {"url": "https://preview.redd.it/abc.png?auto=webp&amp;s=1", "width": 4000, "height": 3000},
+    "resolutions": [
+        {"url": "https://preview.redd.it/abc.png?width=640&amp;crop=smart&amp;format=pjpg&amp;auto=webp&amp;s=2", "width": 640, "height": 480},
+        {"url": "https://preview.redd.it/abc.png?width=1080&amp;crop=smart&amp;format=pjpg&amp;auto=webp&amp;s=3", "width": 1080, "height": 810},
+    ],
+}]}
+
+
+@pytest.fixture
+def max_image_px(monkeypatch):
+    monkeypatch.setattr(RenditionPolicy, "max_image_px", 1080)
+
+
+def test_largest_fitting_rendition_is_chosen(max_image_px):
+    choice = RenditionPolicy.choose(*RenditionPolicy.from_preview(PREVIEW, "https://i.redd.it/abc.png"))
+
+    assert not choice["original"]
+    assert (choice["width"], choice["height"]) == (1080, 810)
+    assert choice["url"] == "https://preview.redd.it/abc.png?width=1080&crop=smart&format=pjpg&auto=webp&s=3"
+
+
+def test_original_is_kept_when_it_fits(monkeypatch):
+    monkeypatch.setattr(RenditionPolicy, "max_image_px", 5000)
+    choice = RenditionPolicy.choose(*RenditionPolicy.from_preview(PREVIEW, "https://i.redd.it/abc.png"))
+    assert choice == {"url": "https://i.redd.it/abc.png", "width": 4000, "height": 3000, "original": True}
+
+
+@pytest.mark.parametrize("filename, url, expected", [
+    ("abc.png", "https://preview.redd.it/abc.png?width=640&format=pjpg&auto=webp&s=2", "abc.jpg"),
+    ("000_abc.gif", "https://preview.redd.it/abc.gif?width=640&format=png8&s=2", "000_abc.png"),
+    ("abc.png", "https://preview.redd.it/abc.webp?width=640&s=2", "abc.webp"),
+    ("abc.jpeg", "https://preview.redd.it/abc.jpg?width=640&format=pjpg&s=2", "abc.jpeg"),
+    ("abc.png", "https://preview.redd.it/abc.png?width=640&s=2", "abc.png"),
+    ("abc.png", "https://preview.redd.it/abc?width=640&s=2", "abc.png"),
+])
+def test_filename_follows_the_rendition_format(filename, url, expected):
+    assert RenditionPolicy.filename(filename, url) == expected
@@ -0,0 +1,123 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+import verboselogs
+
+from saveddit import search_subreddits
+from saveddit.archive_index import ArchiveIndex
+from saveddit.archive_layout import ArchiveLayout
+from saveddit.search_subreddits import SearchSubreddits
+
+
+@pytest.fixture(autouse=True)
+def layout(monkeypatch):
+    monkeypatch.setattr(ArchiveLayout, "_outputs", {})
+    monkeypatch.setattr(ArchiveLayout, "layout", "flat")
+    monkeypatch.setattr(ArchiveLayout, "requested", None)
+
+
+class FakePool:
+    def __init__(self, results):
+        self.results = results
+
+    def listing(self, listing_function, limit, params=None):
+        return list(self.results)
+
+
+def searcher(results=()):
+    # Skips __init__, which reads the configuration and creates Reddit clients
+    searcher = SearchSubreddits.__new__(SearchSubreddits)
+    searcher.logger = verboselogs.VerboseLogger("saveddit.tests")
+    searcher.multireddit_name = "pics"
+    searcher.reddit_pool = FakePool(results)
+    return searcher
+
+
+def search_args(output_path, queries):
+    return SimpleNamespace(o=str(output_path), q=queries, s="new", t="all", j=1, include_nsfw=False,
+                           skip_comments=True, skip_videos=True, skip_meta=False)
+
+
+def fake_downloader(attempts, fail):
+    '''
+    Stands in for SubmissionDownloader: saves the submission unless its ID is in `fail`, like a failed
+    or deferred download, which leaves no directory
+    '''
+    def download(submission, i, logger, output_dir, *args):
+        submission_dir = ArchiveLayout.submission_dir(output_dir, submission, i)
+        attempts.append(submission_dir)
+        if submission.id not in fail:
+            os.makedirs(submission_dir)
+    return download
+
+
+def query_dir(output_path, query):
+    return os.path.join(output_path, "www.reddit.com", "q", query, "pics", "new", "000_Title")
+
+
+def test_other_queries_link_to_the_saved_submission(tmp_path, monkeypatch):
+    attempts = []
+    monkeypatch.setattr(search_subreddits, "SubmissionDownloader", fake_downloader(attempts, fail=set()))
+
+    searcher([SimpleNamespace(id="abc12", title="Title")]).download(search_args(tmp_path, ["cats", "dogs"]))
+
+    assert attempts == [query_dir(str(tmp_path), "cats")]
+    assert os.path.islink(query_dir(str(tmp_path), "dogs"))
+    assert os.path.samefile(query_dir(str(tmp_path), "dogs"), query_dir(str(tmp_path), "cats"))
+
+
+def test_failed_download_is_retried_by_the_next_query(tmp_path, monkeypatch):
+    attempts = []
+    fail = {"abc12"}
+    download = fake_downloader(attempts, fail)
+
+    def fail_once(submission, *args):
+        download(submission, *args)
+        fail.clear()
+    monkeypatch.setattr(search_subreddits, "SubmissionDownloader", fail_once)
+
+    searcher([SimpleNamespace(id="abc12", title="Title")]).download(search_args(tmp_path, ["cats", "dogs", "birds"]))
+
+    assert attempts == [query_dir(str(tmp_path), "cats"), query_dir(str(tmp_path), "dogs")]
+    assert not os.path.lexists(query_dir(str(tmp_path), "cats"))
+    assert os.path.isdir(query_dir(str(tmp_path), "dogs")) and not os.path.islink(query_dir(str(tmp_path), "dogs"))
+    assert os.path.samefile(query_dir(str(tmp_path), "birds"), query_dir(str(tmp_path), "dogs"))
+
+
+def test_claim_waits_for_the_download_of_another_query(tmp_path):
+    s = searcher()
+    archive_index = ArchiveIndex.for_output(tmp_path)
+    claims, claims_lock = {}, threading.Lock()
+    first, second = str(tmp_path / "cats" / "000_Title"), str(tmp_path / "dogs" / "000_Title")
+    assert s.claim("abc12", first, archive_index, claims, claims_lock) is None
+
+    claimed = []
+    waiter = threading.Thread(target=lambda: claimed.append(s.claim("abc12", second, archive_index, claims, claims_lock)))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+
+    os.makedirs(first)
+    s.release("abc12", first, claims, claims_lock)
+    waiter.join(5)
+    assert claimed == [first]
+
+
+def test_claim_is_dropped_when_the_download_fails(tmp_path):
+    s = searcher()
+    archive_index = ArchiveIndex.for_output(tmp_path)
+    claims, claims_lock = {}, threading.Lock()
+    first, second = str(tmp_path / "cats" / "000_Title"), str(tmp_path / "dogs" / "000_Title")
+    assert s.claim("abc12", first, archive_index, claims, claims_lock) is None
+
+    claimed = []
+    waiter = threading.Thread(target=lambda: claimed.append(s.claim("abc12", second, archive_index, claims, claims_lock)))
+    waiter.start()
+    s.release("abc12", first, claims, claims_lock)
+    waiter.join(5)
+
+    # The waiting query downloads it instead
+    assert claimed == [None]
+    assert claims["abc12"][0] == second
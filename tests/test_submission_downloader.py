@@ -0,0 +1,167 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+import requests
+import verboselogs
+
+from saveddit.disk_cache import DiskCache
+from saveddit.media_fetch_policy import MediaFetchPolicy
+from saveddit.metrics import Metrics
+from saveddit.rendition_policy import RenditionPolicy
+from saveddit.submission_downloader import SubmissionDownloader
+from saveddit.transfer_scheduler import TransferScheduler
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(DiskCache, "_shared", {DiskCache.DEFAULT_PATH: cache})
+    return cache
+
+
+class FakeSession:
+    '''
+    Answers HEAD and GET with `outcome`: a final URL, or an exception to raise
+    '''
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.requests = 0
+
+    def request(self, url, **kwargs):
+        self.requests += 1
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return FakeResponse(self.outcome)
+
+    head = get = request
+
+
+class FakeResponse:
+    def __init__(self, url):
+        self.url = url
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def downloader(session):
+    # Skips __init__, which downloads the submission
+    downloader = SubmissionDownloader.__new__(SubmissionDownloader)
+    downloader.session = session
+    downloader.logger = verboselogs.VerboseLogger("saveddit.tests")
+    downloader.indent_2 = ""
+    downloader.print_formatted_error = lambda e: None
+    return downloader
+
+
+def http_error(status):
+    return requests.exceptions.HTTPError(response=SimpleNamespace(status_code=status))
+
+
+def test_resolved_redirect_is_cached(cache):
+    session = FakeSession("https://redgifs.com/watch/a")
+    assert downloader(session).get_redirect_url("https://gfycat.com/a") == "https://redgifs.com/watch/a"
+    assert downloader(FakeSession(requests.exceptions.ConnectionError())).get_redirect_url(
+        "https://gfycat.com/a") == "https://redgifs.com/watch/a"
+    assert session.requests == 1
+
+
+@pytest.mark.parametrize("status", [404, 410])
+def test_dead_link_is_negative_cached(cache, status):
+    assert downloader(FakeSession(http_error(status))).get_redirect_url("https://gfycat.com/a") is None
+
+    session = FakeSession("https://redgifs.com/watch/a")
+    assert downloader(session).get_redirect_url("https://gfycat.com/a") is None
+    assert session.requests == 0
+    assert SubmissionDownloader.is_dead_link("https://gfycat.com/a")
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.Timeout(),
+    requests.exceptions.ConnectionError(),
+    http_error(503),
+    http_error(429),
+])
+def test_transient_failure_is_not_cached(cache, error):
+    assert downloader(FakeSession(error)).get_redirect_url("https://gfycat.com/a") is None
+
+    assert cache.get("redirects", "https://gfycat.com/a") is DiskCache.MISS
+    assert not SubmissionDownloader.is_dead_link("https://gfycat.com/a")
+    assert downloader(FakeSession("https://redgifs.com/watch/a")).get_redirect_url(
+        "https://gfycat.com/a") == "https://redgifs.com/watch/a"
+
+
+@pytest.mark.parametrize("url, album_id", [
+    ("https://imgur.com/a/AbC12", "AbC12"),
+    ("https://imgur.com/gallery/AbC12", "AbC12"),
+    ("https://imgur.com/AbC12", None),
+])
+def test_imgur_album_id(url, album_id):
+    assert downloader(None).get_imgur_album_id(url) == album_id
+
+
+@pytest.mark.parametrize("url, image_id", [
+    ("https://imgur.com/AbC12", "AbC12"),
+    ("https://i.imgur.com/AbC12.gifv", "AbC12"),
+    ("https://imgur.com/", None),
+    ("https://imgur.com/a.b", None),
+])
+def test_imgur_image_id(url, image_id):
+    assert downloader(None).get_imgur_image_id(url) == image_id
+
+
+def test_chosen_rendition_is_saved_with_its_own_extension(monkeypatch):
+    monkeypatch.setattr(RenditionPolicy, "max_image_px", 640)
+    d = downloader(None)
+    d.renditions = []
+    source = ("https://i.redd.it/abc.png", 4000, 3000)
+    renditions = [("https://preview.redd.it/abc.png?width=640&amp;format=pjpg&amp;s=2", 640, 480)]
+
+    url, filename = d.choose_rendition("abc.png", source, renditions)
+
+    assert url == "https://preview.redd.it/abc.png?width=640&format=pjpg&s=2"
+    assert filename == "abc.jpg"
+    assert d.renditions[0]["file"] == "abc.jpg"
+
+
+class NotModifiedSession:
+    def __init__(self):
+        self.heads, self.gets = [], []
+
+    def head(self, url, headers=None, **kwargs):
+        self.heads.append(headers)
+        return SimpleNamespace(status_code=304 if "If-None-Match" in headers else 200)
+
+    def get(self, url, **kwargs):
+        self.gets.append(url)
+        raise requests.exceptions.ConnectionError()
+
+
+def test_unchanged_reddit_video_keeps_the_merged_copy(cache, tmp_path):
+    video_url = "https://v.redd.it/abc/DASH_720.mp4?source=fallback"
+    cache.set(MediaFetchPolicy.CACHE_NAMESPACE, video_url, {"etag": '"v1"'}, 60)
+    previous_dir, staging_dir = tmp_path / "000_video", tmp_path / ".000_video.part"
+    (previous_dir / "files").mkdir(parents=True)
+    (previous_dir / "files" / "abc.mp4").write_bytes(b"merged")
+    (staging_dir / "files").mkdir(parents=True)
+
+    session = NotModifiedSession()
+    d = downloader(session)
+    d.previous_dir, d.staging_dir = str(previous_dir), str(staging_dir)
+    d.transfers = TransferScheduler()
+    d.metrics = Metrics()
+    submission = SimpleNamespace(url="https://v.redd.it/abc",
+                                 media={"reddit_video": {"fallback_url": video_url}})
+
+    d.download_reddit_video(submission, str(staging_dir / "files"))
+
+    assert session.heads[0]["If-None-Match"] == '"v1"'
+    assert session.gets == []
+    assert os.path.samefile(previous_dir / "files" / "abc.mp4", staging_dir / "files" / "abc.mp4")
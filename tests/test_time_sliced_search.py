@@ -0,0 +1,117 @@
+import inspect
+import re
+from types import SimpleNamespace
+
+import praw
+
+from saveddit.reddit_client import RedditClientPool
+from saveddit.time_sliced_search import TimeSlicedSearch
+
+
+class FakeSubreddit:
+    '''
+    Answers Subreddit.search from a list of submissions, accepting only the arguments praw does
+    '''
+    def __init__(self, submissions, calls, truncate=None):
+        self.submissions = submissions
+        self.calls = calls
+        self.truncate = truncate
+
+    def search(self, *args, **kwargs):
+        arguments = inspect.signature(praw.models.Subreddit.search).bind(self, *args, **kwargs).arguments
+        self.calls.append(arguments)
+        start, end = map(int, re.search(r"timestamp:(\d+)\.\.(\d+)", arguments["query"]).groups())
+        generator_kwargs = arguments.get("generator_kwargs", {})
+        limit = generator_kwargs.get("limit")
+        after = (generator_kwargs.get("params") or {}).get("after")
+
+        matches = sorted((s for s in self.submissions if start <= s.created_utc <= end),
+                         key=lambda s: s.created_utc, reverse=True)
+        if after:
+            matches = matches[[s.fullname for s in matches].index(after) + 1:]
+        # Like Reddit, which can end a search listing early without an `after` cursor
+        return iter(matches[:limit][:self.truncate])
+
+
+class FakeReddit:
+    def __init__(self, submissions, truncate=None):
+        self.calls = []
+        self.submissions = submissions
+        self.truncate = truncate
+
+    def subreddit(self, name):
+        return FakeSubreddit(self.submissions, self.calls, self.truncate)
+
+
+def submissions(count, start=1000000):
+    return [SimpleNamespace(id="s" + str(i), fullname="t3_s" + str(i), created_utc=start + 100 * i)
+            for i in range(count)]
+
+
+def test_search_window_calls_search_with_praw_signature():
+    reddit = FakeReddit(submissions(3))
+    search = TimeSlicedSearch(RedditClientPool([reddit]), "pics", window_cap=10)
+    found = []
+
+    assert search._search_window(1000000, 2000000, found.append) == []
+
+    assert [s.id for s in found] == ["s2", "s1", "s0"]
+    assert len(reddit.calls) == 1
+    assert reddit.calls[0]["sort"] == "new"
+    assert reddit.calls[0]["syntax"] == "cloudsearch"
+    assert reddit.calls[0]["time_filter"] == "all"
+
+
+def test_search_window_returns_the_part_left_of_a_truncated_window():
+    reddit = FakeReddit(submissions(10))
+    search = TimeSlicedSearch(RedditClientPool([reddit]), "pics", window_cap=4)
+
+    remaining = search._search_window(1000000, 1000900, lambda submission: None)
+
+    # s9..s6 were returned; s6 (created at 1000600) is searched again with everything older
+    assert remaining == [(1000000, 1000299), (1000300, 1000600)]
+    assert search.windows_split == 1
+
+
+def test_run_finds_every_submission_once():
+    history = submissions(50)
+    search = TimeSlicedSearch(RedditClientPool([FakeReddit(history)]), "pics", window_cap=5)
+    found = []
+
+    search.run(1000000, 1000000 + 100 * 50, 3, found.append)
+
+    assert sorted(s.id for s in found) == sorted(s.id for s in history)
+    assert search.submissions_found == 50
+    assert search.windows_split > 0
+
+
+def test_listing_ended_early_is_searched_again_from_its_oldest_result():
+    reddit = FakeReddit(submissions(10), truncate=3)
+    search = TimeSlicedSearch(RedditClientPool([reddit]), "pics", window_cap=1000)
+
+    remaining = search._search_window(1000000, 1000900, lambda submission: None)
+
+    # s9..s7 were returned, far below the cap; s7 (created at 1000700) is searched again with everything older
+    assert remaining == [(1000000, 1000700)]
+
+
+def test_run_finds_every_submission_when_listings_end_early():
+    history = submissions(50)
+    search = TimeSlicedSearch(RedditClientPool([FakeReddit(history, truncate=4)]), "pics", window_cap=1000)
+    found = []
+
+    search.run(1000000, 1000000 + 100 * 50, 3, found.append)
+
+    assert sorted(s.id for s in found) == sorted(s.id for s in history)
+
+
+def test_window_reaching_its_start_is_done():
+    search = TimeSlicedSearch(RedditClientPool([FakeReddit(submissions(3))]), "pics", window_cap=1000)
+    assert search._search_window(1000000, 1000900, lambda submission: None) == []
+    assert search._search_window(999000, 1000900, lambda submission: None) == [(999000, 1000000)]
+    assert search._search_window(999000, 999999, lambda submission: None) == []
+
+
+def test_cloudsearch_query_quotes_the_search_query():
+    search = TimeSlicedSearch(None, "pics", query="it's")
+    assert search.cloudsearch_query(1, 2) == "(and timestamp:1..2 'it\\'s')"
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from saveddit.transfer_scheduler import TransferScheduler
+
+
+def test_rates_and_limits_are_parsed():
+    assert TransferScheduler.parse_rate("500K") == 500000
+    assert TransferScheduler.parse_rate("2.5MB/s") == 2500000
+    assert TransferScheduler.parse_limits(["4", "V.redd.it=2"], "default", int) == {"default": 4, "v.redd.it": 2}
+    with pytest.raises(ValueError):
+        TransferScheduler.parse_rate("0")
+
+
+def test_transfers_wait_for_a_slot_on_their_host():
+    scheduler = TransferScheduler(max_per_host={"default": 1})
+    entered = threading.Event()
+
+    def second_transfer():
+        with scheduler.transfer("https://i.redd.it/b.jpg"):
+            entered.set()
+
+    with scheduler.transfer("https://i.redd.it/a.jpg"):
+        with scheduler.transfer("https://v.redd.it/a/DASH_720.mp4"):
+            thread = threading.Thread(target=second_transfer)
+            thread.start()
+            assert not entered.wait(0.2)
+    assert entered.wait(5)
+    thread.join(5)
+
+
+def test_control_file_replaces_command_line_limits(tmp_path):
+    control_path = tmp_path / "limits.yaml"
+    control_path.write_text("max_per_host:\n  v.redd.it: 1\nbandwidth: 1M\n")
+    scheduler = TransferScheduler(max_per_host={"default": 4}, control_path=str(control_path))
+
+    assert scheduler.max_per_host == {"v.redd.it": 1}
+    assert scheduler._buckets["total"].rate == 1000000
+
+    control_path.unlink()
+    scheduler.check_control_file(force=True)
+
+    assert scheduler.max_per_host == {"default": 4}
+    assert not scheduler._buckets